@@ -23,6 +23,40 @@ class Settings:
                 self.manual_ip = config.get('manual_ip', '')
                 self.port = config.get('port', 8000)
                 self.database_url = config.get('database_url', 'sqlite:///./data/database.db')
+                self.vote_progress_rate = config.get('vote_progress_rate', 4)
+                self.ws_send_timeout = config.get('ws_send_timeout', 2.0)
+                self.ws_queue_size = config.get('ws_queue_size', 64)
+                self.vote_batch_interval_ms = config.get('vote_batch_interval_ms', 5)
+                self.vote_batch_size = config.get('vote_batch_size', 200)
+                self.signin_batch_interval_ms = config.get('signin_batch_interval_ms', 5)
+                self.signin_batch_size = config.get('signin_batch_size', 200)
+                self.signin_broadcast_interval = config.get('signin_broadcast_interval', 1.0)
+                self.participant_count_reconcile_s = config.get('participant_count_reconcile_s', 30)
+                self.sqlite_cache_mb = config.get('sqlite_cache_mb', 64)
+                self.sqlite_mmap_mb = config.get('sqlite_mmap_mb', 256)
+                self.sqlite_busy_timeout_ms = config.get('sqlite_busy_timeout_ms', 5000)
+                self.session_cache_size = config.get('session_cache_size', 4096)
+                self.session_cache_ttl = config.get('session_cache_ttl', 600)
+                self.ip_probe_interval = config.get('ip_probe_interval', 60)
+                self.state_cache_ttl = config.get('state_cache_ttl', 0)
+                self.journal_enabled = config.get('journal_enabled', True)
+                self.journal_fsync_interval = config.get('journal_fsync_interval', 1.0)
+                self.export_archive = config.get('export_archive', True)
+                self.keyword_capacity = config.get('keyword_capacity', 200)
+                self.keyword_top_n = config.get('keyword_top_n', 30)
+                self.cluster_threshold = config.get('cluster_threshold', 0.5)
+                self.cluster_top_n = config.get('cluster_top_n', 10)
+                self.metrics_enabled = config.get('metrics_enabled', True)
+                self.sql_audit_enabled = config.get('sql_audit_enabled', True)
+                self.sql_slow_ms = config.get('sql_slow_ms', 100)
+                self.sql_repeat_threshold = config.get('sql_repeat_threshold', 10)
+                self.profile_interval_ms = config.get('profile_interval_ms', 5)
+                self.profile_max_seconds = config.get('profile_max_seconds', 60)
+                self.tracemalloc_frames = config.get('tracemalloc_frames', 10)
+                self.backplane = config.get('backplane', 'memory')
+                self.backplane_url = config.get('backplane_url', '')
+                self.backplane_poll_ms = config.get('backplane_poll_ms', 10)
+                self.admin_token_ttl_hours = config.get('admin_token_ttl_hours', 12)
         else:
             # 默认配置
             self.admin_password = 'admin123'
@@ -30,6 +64,40 @@ class Settings:
             self.manual_ip = ''
             self.port = 8000
             self.database_url = 'sqlite:///./data/database.db'
+            self.vote_progress_rate = 4  # 投票进度推送频率上限(次/秒)
+            self.ws_send_timeout = 2.0  # WebSocket 单次发送超时(秒)
+            self.ws_queue_size = 64  # 每个连接的发送队列上限
+            self.vote_batch_interval_ms = 5  # 投票组提交攒批时间(毫秒)
+            self.vote_batch_size = 200  # 投票组提交每批最大条数
+            self.signin_batch_interval_ms = 5  # 签到组提交攒批时间(毫秒)
+            self.signin_batch_size = 200  # 签到组提交每批最大条数
+            self.signin_broadcast_interval = 1.0  # 签到人数广播间隔(秒)
+            self.participant_count_reconcile_s = 30  # 签到人数与数据库核对间隔(秒)
+            self.sqlite_cache_mb = 64  # SQLite 页缓存大小(MB)
+            self.sqlite_mmap_mb = 256  # SQLite 内存映射大小(MB)
+            self.sqlite_busy_timeout_ms = 5000  # SQLite 锁等待超时(毫秒)
+            self.session_cache_size = 4096  # session 缓存条目上限
+            self.session_cache_ttl = 600  # session 缓存过期时间(秒)
+            self.ip_probe_interval = 60  # 后台重新检测本机 IP 的间隔(秒)
+            self.state_cache_ttl = 0  # 活动状态缓存过期时间(秒),0 表示只在数据变化时失效
+            self.journal_enabled = True  # 是否记录签到/投票流水日志
+            self.journal_fsync_interval = 1.0  # 流水日志写盘间隔(秒)
+            self.export_archive = True  # 导出时是否同时生成压缩归档(jsonl.gz)
+            self.keyword_capacity = 200  # 每个问答题跟踪的候选关键词数
+            self.keyword_top_n = 30  # 问答题结果返回的关键词数
+            self.cluster_threshold = 0.5  # 相似回答聚类的相似度阈值(估计 Jaccard)
+            self.cluster_top_n = 10  # 问答题结果返回的相似回答簇数
+            self.metrics_enabled = True  # 是否记录运行指标并开放 /metrics
+            self.sql_audit_enabled = True  # 是否按请求统计 SQL 语句并报告慢语句/重复语句
+            self.sql_slow_ms = 100  # 慢语句阈值(毫秒)
+            self.sql_repeat_threshold = 10  # 同一请求中同一语句执行次数达到该值时报告(N+1)
+            self.profile_interval_ms = 5  # CPU 采样间隔(毫秒)
+            self.profile_max_seconds = 60  # 单次 CPU 采样最长时间(秒)
+            self.tracemalloc_frames = 10  # 内存跟踪保存的调用栈深度
+            self.backplane = 'memory'  # 多进程消息总线: memory(单进程)/sqlite(同机多进程)/redis
+            self.backplane_url = ''  # 总线地址,sqlite 为文件路径(默认 data/backplane.db),redis 为 redis://[:密码@]主机:端口/库
+            self.backplane_poll_ms = 10  # sqlite 总线的轮询间隔(毫秒)
+            self.admin_token_ttl_hours = 12  # 管理员令牌有效期(小时)
     
     def save_config(self):
         """保存配置到文件"""
@@ -38,7 +106,41 @@ class Settings:
             'host_password': self.host_password,
             'manual_ip': self.manual_ip,
             'port': self.port,
-            'database_url': self.database_url
+            'database_url': self.database_url,
+            'vote_progress_rate': self.vote_progress_rate,
+            'ws_send_timeout': self.ws_send_timeout,
+            'ws_queue_size': self.ws_queue_size,
+            'vote_batch_interval_ms': self.vote_batch_interval_ms,
+            'vote_batch_size': self.vote_batch_size,
+            'signin_batch_interval_ms': self.signin_batch_interval_ms,
+            'signin_batch_size': self.signin_batch_size,
+            'signin_broadcast_interval': self.signin_broadcast_interval,
+            'participant_count_reconcile_s': self.participant_count_reconcile_s,
+            'sqlite_cache_mb': self.sqlite_cache_mb,
+            'sqlite_mmap_mb': self.sqlite_mmap_mb,
+            'sqlite_busy_timeout_ms': self.sqlite_busy_timeout_ms,
+            'session_cache_size': self.session_cache_size,
+            'session_cache_ttl': self.session_cache_ttl,
+            'ip_probe_interval': self.ip_probe_interval,
+            'state_cache_ttl': self.state_cache_ttl,
+            'journal_enabled': self.journal_enabled,
+            'journal_fsync_interval': self.journal_fsync_interval,
+            'export_archive': self.export_archive,
+            'keyword_capacity': self.keyword_capacity,
+            'keyword_top_n': self.keyword_top_n,
+            'cluster_threshold': self.cluster_threshold,
+            'cluster_top_n': self.cluster_top_n,
+            'metrics_enabled': self.metrics_enabled,
+            'sql_audit_enabled': self.sql_audit_enabled,
+            'sql_slow_ms': self.sql_slow_ms,
+            'sql_repeat_threshold': self.sql_repeat_threshold,
+            'profile_interval_ms': self.profile_interval_ms,
+            'profile_max_seconds': self.profile_max_seconds,
+            'tracemalloc_frames': self.tracemalloc_frames,
+            'backplane': self.backplane,
+            'backplane_url': self.backplane_url,
+            'backplane_poll_ms': self.backplane_poll_ms,
+            'admin_token_ttl_hours': self.admin_token_ttl_hours
         }
         self.config_path.parent.mkdir(parents=True, exist_ok=True)
         with open(self.config_path, 'w', encoding='utf-8') as f:
@@ -56,6 +158,10 @@ class Settings:
         """更新网络配置"""
         self.manual_ip = manual_ip
         self.save_config()
+        
+        # 网络配置变化后重新检测本机 IP
+        from backend.utils.network import invalidate_local_ip
+        invalidate_local_ip()
 
 # 全局配置实例
 settings = Settings()
@@ -1,17 +1,20 @@
 """
 数据库连接和会话管理
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from backend.models import Base
 from backend.config import settings
+from backend.utils.metrics import db_query_duration
+from backend.utils.query_audit import record_query
 from pathlib import Path
+import time
 
 # 确保数据目录存在
 Path("data").mkdir(exist_ok=True)
 
-# 同步数据库引擎
+# 同步数据库引擎(用于建表、迁移脚本等非请求场景)
 SQLALCHEMY_DATABASE_URL = settings.database_url
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -21,19 +24,113 @@ engine = create_engine(
 # 会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _to_async_url(url: str) -> str:
+    """将同步数据库 URL 转换为异步驱动 URL"""
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    return url
+
+# 异步数据库引擎(请求处理使用,数据库操作不阻塞事件循环)
+ASYNC_DATABASE_URL = _to_async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+
+# 异步会话工厂
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    SQLite 性能配置(每个新连接执行)
+    
+    WAL 模式下读写互不阻塞,synchronous=NORMAL 只在检查点时 fsync
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_mb * 1024 * 1024}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_mb * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+    cursor.close()
+
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """记录语句耗时(运行指标按语句类型分组)和当前请求的语句统计"""
+    started = getattr(context, '_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if settings.metrics_enabled:
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement else 'UNKNOWN'
+        db_query_duration.observe(elapsed, verb)
+    if settings.sql_audit_enabled:
+        record_query(statement, parameters, elapsed, executemany)
+
+if settings.metrics_enabled or settings.sql_audit_enabled:
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+def migrate_schema() -> list:
+    """
+    为已有数据库补建表和索引
+    
+    创建 (vote_id, participant_id) 唯一索引前,先删除重复的投票记录(保留最新的一条)
+    
+    Returns:
+        执行的迁移步骤说明
+    """
+    steps = []
+    Base.metadata.create_all(bind=engine, checkfirst=True)
+    
+    with engine.begin() as conn:
+        existing = {
+            table: {index['name'] for index in inspect(conn).get_indexes(table)}
+            for table in inspect(conn).get_table_names()
+        }
+        
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in existing.get(table.name, set()):
+                    continue
+                
+                if index.unique and table.name == 'vote_records':
+                    result = conn.execute(text(
+                        "DELETE FROM vote_records WHERE id NOT IN ("
+                        "SELECT MAX(id) FROM vote_records GROUP BY vote_id, participant_id)"
+                    ))
+                    steps.append(f"删除重复投票记录 {result.rowcount} 条")
+                
+                index.create(bind=conn)
+                steps.append(f"创建索引 {index.name}")
+    
+    return steps
+
 def init_db():
-    """初始化数据库,创建所有表"""
-    Base.metadata.create_all(bind=engine)
+    """初始化数据库,创建所有表并补建缺失的索引"""
+    migrate_schema()
 
-def get_db():
+async def get_db():
     """获取数据库会话"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def reset_db():
     """重置数据库(清空所有数据)"""
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    
+    from backend.services.tally import tally_engine
+    from backend.services.journal import journal_writer
+    tally_engine.clear()
+    journal_writer.clear()
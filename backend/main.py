@@ -4,15 +4,33 @@ FastAPI 主程序入口
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from backend.database import init_db
-from backend.routers import admin, signin, host, participant
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
+from backend.database import init_db, AsyncSessionLocal, async_engine
+from backend.routers import admin, signin, host, participant, display
 from backend.routers.websocket import manager
+from backend.services.tally import tally_engine
+from backend.services.ingest import vote_queue, signin_queue
+from backend.services.export import export_jobs
+from backend.services.journal import journal_writer
+from backend.services.backplane import backplane
+from backend.utils.network import refresh_local_ip, run_local_ip_refresher
+from backend.utils.metrics import metrics, MetricsMiddleware
+from backend.utils.query_audit import QueryAuditMiddleware
+from backend.config import settings
+import asyncio
 import uvicorn
 
 # 创建 FastAPI 应用
 app = FastAPI(title="互动大屏幕投票系统", version="1.0.0")
 
+# 统计每个请求的 SQL 语句
+if settings.sql_audit_enabled:
+    app.add_middleware(QueryAuditMiddleware)
+
+# 记录请求耗时
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # 挂载静态文件
 app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
 
@@ -24,6 +42,7 @@ app.include_router(admin.router)
 app.include_router(signin.router)
 app.include_router(host.router)
 app.include_router(participant.router)
+app.include_router(display.router)
 
 # WebSocket 路由
 @app.websocket("/ws")
@@ -38,6 +57,14 @@ async def websocket_endpoint(websocket: WebSocket, client_type: str = "display")
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+# 运行指标(Prometheus 文本格式)
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """运行指标"""
+    if not settings.metrics_enabled:
+        return Response(status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 页面路由
 @app.get("/", response_class=HTMLResponse)
 async def display_page(request: Request):
@@ -64,18 +91,53 @@ async def participant_page(request: Request):
     """参会人页面"""
     return templates.TemplateResponse("participant.html", {"request": request})
 
+# 后台任务
+background_tasks = []
+
 # 启动事件
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化数据库"""
     init_db()
     print("数据库初始化完成")
+    
+    # 连接多进程消息总线并加载共享状态(在加载计票数据之前,加载期间其他进程的投票会被补记)
+    await backplane.start()
+    
+    # 从数据库重建计票数据,避免重启后计数丢失
+    async with AsyncSessionLocal() as db:
+        await tally_engine.rebuild(db)
+    print("计票数据加载完成")
+    
+    # 启动投票、签到组提交队列
+    vote_queue.start()
+    signin_queue.start()
+    
+    # 定期把签到/投票流水写盘
+    background_tasks.append(asyncio.create_task(journal_writer.run(settings.journal_fsync_interval)))
+    
+    # 检测本机 IP,之后在后台定期重新检测
+    print(f"本机 IP: {await asyncio.to_thread(refresh_local_ip)}")
+    background_tasks.append(asyncio.create_task(run_local_ip_refresher(settings.ip_probe_interval)))
     print("服务器启动成功")
 
 # 关闭事件
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时的清理工作"""
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    
+    # 写完队列中剩余的投票和签到
+    await vote_queue.stop()
+    await signin_queue.stop()
+    # 等待进行中的导出完成
+    await export_jobs.join()
+    # 发出剩余的同步消息
+    await backplane.stop()
+    await asyncio.to_thread(journal_writer.flush_all)
+    await async_engine.dispose()
     print("服务器关闭")
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 """
 数据库模型定义
 """
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -38,6 +38,10 @@ class Vote(Base):
     type = Column(String(20), nullable=False)  # single, multiple, text, rating
     options = Column(Text)  # JSON 格式
     order_index = Column(Integer)
+    
+    __table_args__ = (
+        Index('ix_votes_activity_id', 'activity_id'),
+    )
 
 class Participant(Base):
     """参会人表"""
@@ -50,6 +54,11 @@ class Participant(Base):
     role = Column(String(20), default='participant')  # participant, host
     session_id = Column(String(100), unique=True)
     signed_in_at = Column(DateTime, server_default=func.now())
+    
+    __table_args__ = (
+        # 签到人数统计、查找主持人
+        Index('ix_participants_activity_id_role', 'activity_id', 'role'),
+    )
 
 class VoteRecord(Base):
     """投票记录表"""
@@ -60,3 +69,10 @@ class VoteRecord(Base):
     participant_id = Column(Integer, ForeignKey('participants.id'), nullable=False)
     answer = Column(Text, nullable=False)  # JSON 格式
     voted_at = Column(DateTime, server_default=func.now())
+    
+    __table_args__ = (
+        # 每人每题只有一条记录,投票提交使用 INSERT ... ON CONFLICT
+        Index('uq_vote_records_vote_id_participant_id', 'vote_id', 'participant_id', unique=True),
+        # 统计参会人参与次数
+        Index('ix_vote_records_participant_id', 'participant_id'),
+    )
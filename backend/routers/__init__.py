@@ -1,6 +1,6 @@
 """
 路由模块初始化
 """
-from . import admin, signin, host, participant, websocket
+from . import admin, signin, host, participant, display, websocket
 
-__all__ = ['admin', 'signin', 'host', 'participant', 'websocket']
+__all__ = ['admin', 'signin', 'host', 'participant', 'display', 'websocket']
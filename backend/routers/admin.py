@@ -2,8 +2,8 @@
 管理员 API 路由
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import get_db
 from backend.schemas import (
     ActivityCreate, ActivityResponse,
@@ -13,49 +13,63 @@ from backend.schemas import (
     LoginRequest, LoginResponse
 )
 from backend.services import ActivityService, VoteService, VoteTemplateService, ExportService
+from backend.services.export import export_jobs
+from backend.routers.websocket import manager
+from backend.services.backplane import backplane
+from backend.utils.profiling import profiler_manager
 from backend.config import settings
 from backend.utils import verify_password
 from typing import List
+from datetime import datetime
+import asyncio
 import json
-from pathlib import Path
+import secrets
+import threading
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
-# 简单的认证令牌(实际项目中应使用 JWT)
-admin_tokens = set()
+# 简单的认证令牌(实际项目中应使用 JWT),保存在消息总线的共享状态中,所有进程可见,
+# admin_token_ttl_hours 小时后过期
+ADMIN_TOKEN_PREFIX = 'admin_token:'
 
 @router.post("/login", response_model=LoginResponse)
 async def admin_login(request: LoginRequest):
     """管理员登录"""
     if verify_password(request.password, settings.admin_password):
-        token = f"admin_{len(admin_tokens)}"
-        admin_tokens.add(token)
+        token = f"admin_{secrets.token_hex(8)}"
+        backplane.set_state(ADMIN_TOKEN_PREFIX + token, True, ttl=settings.admin_token_ttl_hours * 3600)
         return LoginResponse(token=token, message="登录成功")
     raise HTTPException(status_code=401, detail="密码错误")
 
 def verify_admin_token(token: str = Query(..., description="管理员令牌")):
     """验证管理员令牌"""
-    if token not in admin_tokens:
+    if not backplane.get_state(ADMIN_TOKEN_PREFIX + token):
         raise HTTPException(status_code=401, detail="令牌无效或已过期,请重新登录")
     return token
 
+@router.post("/logout")
+async def admin_logout(token: str = Depends(verify_admin_token)):
+    """管理员退出登录(令牌立即失效)"""
+    backplane.set_state(ADMIN_TOKEN_PREFIX + token, None)
+    return {"message": "已退出登录"}
+
 @router.post("/activities", response_model=ActivityResponse)
 async def create_activity(
     activity: ActivityCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """创建活动"""
-    db_activity = ActivityService.create_activity(db, activity)
+    db_activity = await ActivityService.create_activity(db, activity)
     return db_activity
 
 @router.get("/activities/current", response_model=ActivityResponse)
 async def get_current_activity(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """获取当前活动"""
-    activity = ActivityService.get_current_activity(db)
+    activity = await ActivityService.get_current_activity(db)
     if not activity:
         raise HTTPException(status_code=404, detail="没有活动")
     return activity
@@ -63,11 +77,11 @@ async def get_current_activity(
 @router.post("/votes", response_model=VoteResponse)
 async def create_vote(
     vote: VoteCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """创建投票"""
-    db_vote = VoteService.create_vote(db, vote)
+    db_vote = await VoteService.create_vote(db, vote)
     # 解析 options JSON
     if db_vote.options:
         db_vote.options = json.loads(db_vote.options)
@@ -76,11 +90,11 @@ async def create_vote(
 @router.get("/votes/{activity_id}", response_model=List[VoteResponse])
 async def get_votes(
     activity_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """获取活动的所有投票"""
-    votes = VoteService.get_votes_by_activity(db, activity_id)
+    votes = await VoteService.get_votes_by_activity(db, activity_id)
     # 解析 options JSON
     for vote in votes:
         if vote.options:
@@ -91,11 +105,11 @@ async def get_votes(
 async def update_vote(
     vote_id: int,
     vote_update: VoteUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """更新投票"""
-    db_vote = VoteService.update_vote(db, vote_id, vote_update)
+    db_vote = await VoteService.update_vote(db, vote_id, vote_update)
     if not db_vote:
         raise HTTPException(status_code=404, detail="投票不存在")
     if db_vote.options:
@@ -105,11 +119,11 @@ async def update_vote(
 @router.delete("/votes/{vote_id}")
 async def delete_vote(
     vote_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """删除投票"""
-    success = VoteService.delete_vote(db, vote_id)
+    success = await VoteService.delete_vote(db, vote_id)
     if not success:
         raise HTTPException(status_code=404, detail="投票不存在")
     return {"message": "删除成功"}
@@ -117,7 +131,7 @@ async def delete_vote(
 @router.post("/passwords")
 async def update_passwords(
     passwords: PasswordUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """更新密码"""
@@ -127,27 +141,86 @@ async def update_passwords(
 @router.post("/network")
 async def update_network(
     config: NetworkConfig,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """更新网络配置"""
     settings.update_network(config.manual_ip)
     return {"message": "网络配置更新成功"}
 
+@router.post("/activities/{activity_id}/export")
+async def start_export(
+    activity_id: int,
+    db: AsyncSession = Depends(get_db),
+    token: str = Depends(verify_admin_token)
+):
+    """后台导出活动数据(不重置活动)"""
+    activity = await ActivityService.get_activity(db, activity_id)
+    if not activity:
+        raise HTTPException(status_code=404, detail="活动不存在")
+    job = export_jobs.start(activity_id)
+    return job.to_dict()
+
+@router.get("/activities/{activity_id}/records.csv")
+async def stream_activity_records(
+    activity_id: int,
+    db: AsyncSession = Depends(get_db),
+    token: str = Depends(verify_admin_token)
+):
+    """流式下载活动当前的投票记录(活动进行中也可下载)"""
+    activity = await ActivityService.get_activity(db, activity_id)
+    if not activity:
+        raise HTTPException(status_code=404, detail="活动不存在")
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"activity_{activity_id}_records_{timestamp}.csv"
+    return StreamingResponse(
+        ExportService.stream_vote_records(activity_id),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/export-jobs")
+async def list_export_jobs(token: str = Depends(verify_admin_token)):
+    """列出导出任务"""
+    return {"jobs": export_jobs.list_jobs()}
+
+@router.get("/export-jobs/{job_id}")
+async def get_export_job(
+    job_id: str,
+    token: str = Depends(verify_admin_token)
+):
+    """查询导出任务进度"""
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    return job
+
 @router.get("/exports")
 async def list_exports(token: str = Depends(verify_admin_token)):
     """列出所有导出文件"""
     files = ExportService.list_export_files()
     return {"files": files}
 
+@router.get("/exports/{filename}/results")
+async def get_archive_results(
+    filename: str,
+    token: str = Depends(verify_admin_token)
+):
+    """读取归档中的统计结果"""
+    results = await asyncio.to_thread(ExportService.load_archive_results, filename)
+    if results is None:
+        raise HTTPException(status_code=404, detail="归档不存在")
+    return results
+
 @router.get("/exports/{filename}")
 async def download_export(
     filename: str,
     token: str = Depends(verify_admin_token)
 ):
     """下载导出文件"""
-    filepath = Path("data/exports") / filename
-    if not filepath.exists():
+    filepath = ExportService.get_export_file(filename)
+    if filepath is None:
         raise HTTPException(status_code=404, detail="文件不存在")
     return FileResponse(filepath, filename=filename)
 
@@ -167,11 +240,11 @@ async def delete_export(
 @router.post("/vote-templates", response_model=VoteTemplateResponse)
 async def create_vote_template(
     template: VoteTemplateCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """创建投票模板"""
-    db_template = VoteTemplateService.create_template(
+    db_template = await VoteTemplateService.create_template(
         db, template.title, template.type, template.options, template.order_index
     )
     # 解析 options JSON
@@ -181,11 +254,11 @@ async def create_vote_template(
 
 @router.get("/vote-templates", response_model=List[VoteTemplateResponse])
 async def get_vote_templates(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """获取所有投票模板"""
-    templates = VoteTemplateService.get_all_templates(db)
+    templates = await VoteTemplateService.get_all_templates(db)
     # 解析 options JSON
     for template in templates:
         if template.options:
@@ -196,11 +269,11 @@ async def get_vote_templates(
 async def update_vote_template(
     template_id: int,
     template_update: VoteTemplateUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """更新投票模板"""
-    db_template = VoteTemplateService.update_template(
+    db_template = await VoteTemplateService.update_template(
         db, template_id, template_update.title, template_update.type,
         template_update.options, template_update.order_index
     )
@@ -213,11 +286,70 @@ async def update_vote_template(
 @router.delete("/vote-templates/{template_id}")
 async def delete_vote_template(
     template_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(verify_admin_token)
 ):
     """删除投票模板"""
-    success = VoteTemplateService.delete_template(db, template_id)
+    success = await VoteTemplateService.delete_template(db, template_id)
     if not success:
         raise HTTPException(status_code=404, detail="投票模板不存在")
     return {"message": "删除成功"}
+
+# ===== 性能分析 =====
+
+@router.post("/profile/cpu")
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, description="采样时长(秒)"),
+    interval_ms: float = Query(None, gt=0, description="采样间隔(毫秒)"),
+    all_threads: bool = Query(False, description="同时采样数据库驱动等其他线程"),
+    token: str = Depends(verify_admin_token)
+):
+    """对事件循环采样 seconds 秒,写出折叠栈文件(可生成火焰图)"""
+    seconds = min(seconds, settings.profile_max_seconds)
+    interval = (interval_ms or settings.profile_interval_ms) / 1000
+    # 采样在独立线程中进行,本协程等待期间事件循环照常处理请求
+    result = await asyncio.to_thread(
+        profiler_manager.profile_cpu, threading.get_ident(), seconds, interval, all_threads
+    )
+    if result is None:
+        raise HTTPException(status_code=409, detail="已有性能分析正在进行")
+    return result
+
+@router.post("/profile/memory")
+async def snapshot_memory(token: str = Depends(verify_admin_token)):
+    """
+    保存内存快照
+    
+    首次调用开始跟踪内存分配(只统计此后的分配);之后每次调用与上一次快照比较,
+    连接数有变化时给出每个 WebSocket 连接平均占用的内存
+    """
+    started = profiler_manager.start_memory_tracing(settings.tracemalloc_frames)
+    connections = {
+        client_type: len(connections)
+        for client_type, connections in manager.connections_by_type.items()
+    }
+    result = await asyncio.to_thread(profiler_manager.snapshot_memory, connections)
+    result['tracing_started'] = started
+    return result
+
+@router.delete("/profile/memory")
+async def stop_memory_tracing(token: str = Depends(verify_admin_token)):
+    """停止跟踪内存分配"""
+    profiler_manager.stop_memory_tracing()
+    return {"message": "已停止内存跟踪"}
+
+@router.get("/profiles")
+async def list_profiles(token: str = Depends(verify_admin_token)):
+    """列出性能分析文件"""
+    return {"files": profiler_manager.list_files()}
+
+@router.get("/profiles/{filename}")
+async def download_profile(
+    filename: str,
+    token: str = Depends(verify_admin_token)
+):
+    """下载性能分析文件"""
+    filepath = profiler_manager.get_file(filename)
+    if filepath is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return FileResponse(filepath, filename=filename)
@@ -0,0 +1,23 @@
+"""
+大屏 API 路由
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import get_db
+from backend.services import VoteService
+
+router = APIRouter(prefix="/api/display", tags=["display"])
+
+@router.get("/votes/{vote_id}/answers")
+async def get_text_answers(
+    vote_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(VoteService.TEXT_ANSWERS_PAGE_SIZE, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """分页获取问答题回答(大屏回答墙)"""
+    vote = await VoteService.get_vote(db, vote_id)
+    if not vote or vote.type != 'text':
+        raise HTTPException(status_code=404, detail="问答题不存在")
+    
+    return await VoteService.get_text_answers(db, vote_id, offset, limit)
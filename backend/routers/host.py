@@ -2,10 +2,13 @@
 主持人 API 路由
 """
 from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import get_db
-from backend.services import ActivityService, VoteService, ParticipantService, ExportService
-from backend.routers.websocket import manager
+from backend.services import ActivityService, VoteService, ParticipantService
+from backend.services.activity import activity_cache, HOST_STATUS_KEY
+from backend.services.export import export_jobs
+from backend.services.tally import tally_engine
+from backend.routers.websocket import manager, progress_publisher
 from typing import Optional
 import json
 
@@ -20,59 +23,71 @@ def get_host_session(session_id: Optional[str] = Header(None, alias="X-Session-I
 @router.get("/status")
 async def get_host_status(
     session_id: str = Depends(get_host_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """获取主持人控制面板状态"""
     # 验证 session
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant or participant.role != 'host':
         raise HTTPException(status_code=403, detail="无权限")
     
-    activity = ActivityService.get_current_activity(db)
-    if not activity:
-        raise HTTPException(status_code=404, detail="没有活动")
+    # 活动和投票列表读缓存,签到人数和当前投票实时获取
+    status = activity_cache.get(HOST_STATUS_KEY)
+    if status is None:
+        version = activity_cache.version
+        activity = await ActivityService.get_current_activity(db)
+        if not activity:
+            raise HTTPException(status_code=404, detail="没有活动")
+        
+        # 获取投票列表
+        votes = await VoteService.get_votes_by_activity(db, activity.id)
+        vote_list = []
+        for vote in votes:
+            options = json.loads(vote.options) if vote.options else None
+            vote_list.append({
+                'id': vote.id,
+                'title': vote.title,
+                'type': vote.type,
+                'options': options
+            })
+        
+        status = {
+            'activity_id': activity.id,
+            'activity_name': activity.name,
+            'activity_status': activity.status,
+            'votes': vote_list
+        }
+        activity_cache.set(HOST_STATUS_KEY, status, version)
     
     # 获取签到人数
-    participant_count = ParticipantService.get_participants_count(db, activity.id)
-    
-    # 获取投票列表
-    votes = VoteService.get_votes_by_activity(db, activity.id)
-    vote_list = []
-    for vote in votes:
-        options = json.loads(vote.options) if vote.options else None
-        vote_list.append({
-            'id': vote.id,
-            'title': vote.title,
-            'type': vote.type,
-            'options': options
-        })
+    participant_count = await ParticipantService.get_participants_count(db, status['activity_id'])
     
     return {
-        'activity_id': activity.id,
-        'activity_name': activity.name,
-        'activity_status': activity.status,
+        'activity_id': status['activity_id'],
+        'activity_name': status['activity_name'],
+        'activity_status': status['activity_status'],
         'current_vote_id': manager.current_vote_id, # 增加当前投票 ID
         'participant_count': participant_count,
-        'votes': vote_list
+        'votes': status['votes']
     }
 
 @router.post("/activity/start")
 async def start_activity(
     session_id: str = Depends(get_host_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """开始活动"""
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant or participant.role != 'host':
         raise HTTPException(status_code=403, detail="无权限")
     
-    activity = ActivityService.get_current_activity(db)
+    activity = await ActivityService.get_current_activity(db)
     if not activity:
         raise HTTPException(status_code=404, detail="没有活动")
     
     # 更新活动状态
-    ActivityService.update_activity_status(db, activity.id, 'active')
-    manager.current_status = 'active'
+    await ActivityService.update_activity_status(db, activity.id, 'active')
+    manager.update_state(current_status='active')
     
     # 广播活动开始
     await manager.broadcast({
@@ -86,21 +101,24 @@ async def start_activity(
 async def start_vote(
     vote_id: int,
     session_id: str = Depends(get_host_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """开始投票"""
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant or participant.role != 'host':
         raise HTTPException(status_code=403, detail="无权限")
     
-    vote = VoteService.get_vote(db, vote_id)
+    vote = await VoteService.get_vote(db, vote_id)
     if not vote:
         raise HTTPException(status_code=404, detail="投票不存在")
     
+    # 提前加载计数器,投票期间的提交校验和进度推送不再访问数据库
+    await tally_engine.get(db, vote.id)
+    
     # 解析选项
     options = json.loads(vote.options) if vote.options else None
-    manager.current_vote_id = vote.id
-    manager.current_status = 'voting'
+    manager.update_state(current_vote_id=vote.id, current_status='voting')
+    progress_publisher.reset(vote.id)
     
     # 广播开始投票
     await manager.broadcast({
@@ -119,16 +137,17 @@ async def start_vote(
 async def end_vote(
     vote_id: int,
     session_id: str = Depends(get_host_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """结束投票并显示结果"""
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant or participant.role != 'host':
         raise HTTPException(status_code=403, detail="无权限")
     
     # 获取投票结果
-    results = VoteService.get_vote_results(db, vote_id)
-    manager.current_status = 'result'
+    results = await VoteService.get_vote_results(db, vote_id)
+    manager.update_state(current_status='result')
+    progress_publisher.reset(None)
     
     # 广播投票结果
     await manager.broadcast({
@@ -141,15 +160,16 @@ async def end_vote(
 @router.post("/vote/exit")
 async def exit_vote(
     session_id: str = Depends(get_host_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """退出投票,回到签到页"""
-    manager.current_vote_id = None
-    manager.current_status = 'active'
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant or participant.role != 'host':
         raise HTTPException(status_code=403, detail="无权限")
     
+    manager.update_state(current_vote_id=None, current_status='active')
+    progress_publisher.reset(None)
+    
     # 广播退出投票
     await manager.broadcast({
         "type": "vote_exited"
@@ -160,24 +180,24 @@ async def exit_vote(
 @router.post("/activity/end")
 async def end_activity(
     session_id: str = Depends(get_host_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """结束活动,显示统计"""
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant or participant.role != 'host':
         raise HTTPException(status_code=403, detail="无权限")
     
-    activity = ActivityService.get_current_activity(db)
+    activity = await ActivityService.get_current_activity(db)
     if not activity:
         raise HTTPException(status_code=404, detail="没有活动")
     
     # 获取活动统计
-    summary = ActivityService.get_activity_summary(db, activity.id)
+    summary = await ActivityService.get_activity_summary(db, activity.id)
     
     # 更新活动状态
-    ActivityService.update_activity_status(db, activity.id, 'ended')
-    manager.current_vote_id = None
-    manager.current_status = 'summary'
+    await ActivityService.update_activity_status(db, activity.id, 'ended')
+    manager.update_state(current_vote_id=None, current_status='summary')
+    progress_publisher.reset(None)
     
     # 广播活动结束
     await manager.broadcast({
@@ -190,32 +210,49 @@ async def end_activity(
 @router.post("/activity/close")
 async def close_activity(
     session_id: str = Depends(get_host_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """退出活动,保存数据并重置"""
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant or participant.role != 'host':
         raise HTTPException(status_code=403, detail="无权限")
     
-    activity = ActivityService.get_current_activity(db)
+    activity = await ActivityService.get_current_activity(db)
     if not activity:
         raise HTTPException(status_code=404, detail="没有活动")
     
-    # 导出数据
-    records_file, stats_file = ExportService.export_activity_data(db, activity.id)
+    activity_id = activity.id
     
-    # 重置活动数据
-    ActivityService.reset_activity_data(db, activity.id)
+    async def finish(db: AsyncSession, job):
+        # 导出完成后重置活动数据并广播活动关闭
+        await ActivityService.reset_activity_data(db, activity_id)
+        await manager.broadcast({
+            "type": "activity_closed"
+        })
     
-    # 广播活动关闭
-    await manager.broadcast({
-        "type": "activity_closed"
-    })
+    # 后台导出数据,主持人通过任务 ID 查询进度
+    job = export_jobs.start(activity_id, on_done=finish, finalize=True)
     
     return {
-        "message": "活动已关闭,数据已保存",
-        "files": {
-            "records": records_file,
-            "statistics": stats_file
-        }
+        "message": "活动正在关闭,数据保存中",
+        "job": job.to_dict()
     }
+
+@router.get("/exports/{job_id}")
+async def get_export_job(
+    job_id: str,
+    session_id: str = Depends(get_host_session),
+    db: AsyncSession = Depends(get_db)
+):
+    """查询导出任务进度"""
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    
+    # 关闭活动后主持人的 session 随参会人一起清除,任务结束后不再校验
+    if job['status'] not in ('done', 'failed'):
+        participant = await ParticipantService.get_participant_by_session(db, session_id)
+        if not participant or participant.role != 'host':
+            raise HTTPException(status_code=403, detail="无权限")
+    
+    return job
@@ -2,10 +2,13 @@
 参会人 API 路由
 """
 from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import get_db
 from backend.schemas import VoteSubmit
 from backend.services import ParticipantService, VoteService
+from backend.services.tally import tally_engine
+from backend.services.ingest import vote_queue
+from backend.routers.websocket import progress_publisher
 from typing import Optional
 
 router = APIRouter(prefix="/api/participant", tags=["participant"])
@@ -19,10 +22,10 @@ def get_participant_session(session_id: Optional[str] = Header(None, alias="X-Se
 @router.get("/status")
 async def get_participant_status(
     session_id: str = Depends(get_participant_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """获取参会人状态"""
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant:
         raise HTTPException(status_code=404, detail="参会人不存在")
     
@@ -36,19 +39,38 @@ async def get_participant_status(
 async def submit_vote(
     vote_submit: VoteSubmit,
     session_id: str = Depends(get_participant_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """提交投票"""
-    participant = ParticipantService.get_participant_by_session(db, session_id)
+    participant = await ParticipantService.get_participant_by_session(db, session_id)
     if not participant:
         raise HTTPException(status_code=404, detail="参会人不存在")
     
-    # 提交投票
-    record = VoteService.submit_vote(
-        db,
-        vote_submit.vote_id,
-        participant.id,
-        vote_submit.answer
+    # 投票不存在或答案格式不符时直接拒绝,不进入组提交队列(以免影响同一批的其他投票)
+    tally = tally_engine.peek(vote_submit.vote_id)
+    if tally is not None:
+        vote_type = tally.type
+    else:
+        vote = await VoteService.get_vote(db, vote_submit.vote_id)
+        if not vote:
+            raise HTTPException(status_code=404, detail="投票不存在")
+        vote_type = vote.type
+    
+    if not VoteService.validate_answer(vote_type, vote_submit.answer):
+        raise HTTPException(status_code=422, detail="答案格式与投票类型不符")
+    
+    # 释放本请求的数据库连接,避免等待组提交时占满连接池
+    await db.close()
+    
+    # 提交投票(进入组提交队列,所属批次落库后返回)
+    record_id = await vote_queue.submit(
+        (vote_submit.vote_id, participant.id, vote_submit.answer)
     )
+    if record_id is None:
+        # 排队期间投票被删除
+        raise HTTPException(status_code=404, detail="投票不存在")
+    
+    # 触发投票进度推送(节流合并)
+    progress_publisher.notify(vote_submit.vote_id)
     
-    return {"message": "投票已提交", "record_id": record.id}
+    return {"message": "投票已提交", "record_id": record_id}
@@ -1,22 +1,31 @@
 """
 签到 API 路由
 """
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import get_db
 from backend.schemas import SignInRequest, SignInResponse
 from backend.services import ActivityService, ParticipantService
 from backend.config import settings
-from backend.utils import verify_password, get_server_url, generate_qrcode
-from backend.routers.websocket import manager
+from backend.utils import verify_password, get_server_url, render_qrcode_async
+from backend.services.ingest import signin_queue
+from backend.routers.websocket import signin_publisher
 
 router = APIRouter(prefix="/api/signin", tags=["signin"])
 
+# 大屏二维码尺寸
+QRCODE_SIZE = 400
+
+def get_signin_url() -> str:
+    """签到页面地址"""
+    server_url = get_server_url(settings.manual_ip, settings.port)
+    return f"{server_url}/signin"
+
 @router.get("/info")
-async def get_signin_info(request: Request, db: Session = Depends(get_db)):
+async def get_signin_info(request: Request, db: AsyncSession = Depends(get_db)):
     """获取签到页面信息"""
     # 获取当前活动
-    activity = ActivityService.get_current_activity(db)
+    activity = await ActivityService.get_current_activity(db)
     if not activity:
         return {
             "qrcode_url": "",
@@ -24,30 +33,52 @@ async def get_signin_info(request: Request, db: Session = Depends(get_db)):
             "message": "暂无活动"
         }
     
-    # 生成二维码 URL
-    server_url = get_server_url(settings.manual_ip, settings.port)
-    signin_url = f"{server_url}/signin"
-    qrcode_data = generate_qrcode(signin_url, size=400)
+    # 二维码图片地址(带内容哈希,浏览器可长期缓存)
+    signin_url = get_signin_url()
+    image = await render_qrcode_async(signin_url, QRCODE_SIZE, "png")
+    qrcode_url = f"/api/signin/qrcode?size={QRCODE_SIZE}&format=png&v={image.etag}"
     
     # 获取签到人数
-    participant_count = ParticipantService.get_participants_count(db, activity.id)
+    participant_count = await ParticipantService.get_participants_count(db, activity.id)
     
     return {
-        "qrcode_url": qrcode_data,
+        "qrcode_url": qrcode_url,
         "signin_url": signin_url,
         "activity_status": activity.status,
         "activity_name": activity.name,
         "participant_count": participant_count
     }
 
+@router.get("/qrcode")
+async def get_signin_qrcode(
+    request: Request,
+    size: int = Query(QRCODE_SIZE, ge=64, le=2048),
+    format: str = Query("png", pattern="^(png|svg)$"),
+    v: str = Query("", description="内容哈希,由 /info 返回的地址携带")
+):
+    """签到二维码图片(按内容哈希缓存,PNG 尺寸归到 QRCODE_SIZES 中的档位)"""
+    image = await render_qrcode_async(get_signin_url(), size, format)
+    etag = f'"{image.etag}"'
+    
+    # 地址中的哈希与当前内容一致时可以永久缓存,否则每次向服务器确认
+    if v == image.etag:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image.content, media_type=image.media_type, headers=headers)
+
 @router.post("/submit", response_model=SignInResponse)
 async def submit_signin(
     signin: SignInRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """提交签到"""
     # 获取当前活动
-    activity = ActivityService.get_current_activity(db)
+    activity = await ActivityService.get_current_activity(db)
     if not activity or activity.status == 'ended':
         raise HTTPException(status_code=400, detail="当前没有活动")
     
@@ -57,7 +88,7 @@ async def submit_signin(
             raise HTTPException(status_code=401, detail="主持人密码错误")
         
         # 检查是否已有主持人
-        existing_host = ParticipantService.get_host(db, activity.id)
+        existing_host = await ParticipantService.get_host(db, activity.id)
         if existing_host:
             # 返回已有主持人的 session_id
             return SignInResponse(
@@ -65,21 +96,21 @@ async def submit_signin(
                 redirect="/host"
             )
     
-    # 创建参会人
-    participant = ParticipantService.create_participant(
-        db, activity.id, signin.name, signin.department, signin.role
+    # 释放本请求的数据库连接,避免等待组提交时占满连接池
+    activity_id = activity.id
+    await db.close()
+    
+    # 创建参会人(进入组提交队列,所属批次落库后返回)
+    session_id = await signin_queue.submit(
+        (activity_id, signin.name, signin.department, signin.role)
     )
     
-    # 广播签到人数更新
-    participant_count = ParticipantService.get_participants_count(db, activity.id)
-    await manager.broadcast({
-        "type": "participant_signed_in",
-        "data": {"count": participant_count}
-    })
+    # 签到人数按固定节奏广播
+    signin_publisher.notify(activity_id)
     
     # 返回 session_id 和重定向路径
     redirect = "/host" if signin.role == 'host' else "/participant"
     return SignInResponse(
-        session_id=participant.session_id,
+        session_id=session_id,
         redirect=redirect
     )
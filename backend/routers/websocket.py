@@ -2,25 +2,171 @@
 WebSocket 连接管理器
 """
 from fastapi import WebSocket
-from typing import List, Dict
+from typing import Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+from backend.config import settings
+from backend.services.tally import tally_engine
+from backend.services.participant import participant_counter
+from backend.services.backplane import backplane
+from backend.utils.throttle import Throttler
+from backend.utils.metrics import metrics, broadcast_enqueue_duration, broadcast_messages, ws_dropped, ws_send_latency
+import asyncio
 import json
+import time
+
+# 消息总线中主持人控制的直播状态(当前投票和界面状态)
+LIVE_STATE_KEY = 'live_state'
+
+# 状态类事件: 只需要最新状态,发送队列中只保留最新的一份
+STATE_EVENTS = {
+    'participant_signed_in',   # 签到人数
+    'vote_progress',           # 投票进度
+}
+
+def encode_message(message: dict) -> str:
+    """编码消息(与 send_json 相同的编码方式)"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+def _merge_state(previous: dict, message: dict) -> dict:
+    """
+    合并两条同类型的状态事件
+    
+    新消息覆盖旧消息;增量消息(如 vote_progress)中嵌套的计数器字典按键合并,
+    保证合并后的消息仍包含所有变化过的计数器
+    """
+    old_data = previous.get('data')
+    new_data = message.get('data')
+    if not isinstance(old_data, dict) or not isinstance(new_data, dict) or new_data.get('full'):
+        return message
+    
+    merged = dict(new_data)
+    for key, value in old_data.items():
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(value, dict) and isinstance(merged[key], dict):
+            merged[key] = {**value, **merged[key]}
+    if old_data.get('full'):
+        merged['full'] = True
+    return {**message, 'data': merged}
+
+class ClientChannel:
+    """
+    单个连接的发送队列
+    
+    每个连接有独立的写任务,广播只负责入队,慢连接不会阻塞其他连接;
+    生命周期事件按顺序发送,状态类事件只保留最新的一份
+    """
+    
+    def __init__(self, websocket: WebSocket, client_type: str, on_dead: Callable[['ClientChannel'], None]):
+        self.websocket = websocket
+        self.client_type = client_type
+        self._on_dead = on_dead
+        # 待发送消息: key -> (消息, 已编码文本, 入队时间)
+        self._pending: "OrderedDict[tuple, Tuple[dict, Optional[str], float]]" = OrderedDict()
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """启动写任务"""
+        self._task = asyncio.get_running_loop().create_task(self._writer())
+    
+    def stop(self):
+        """停止写任务"""
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
+        self._pending.clear()
+    
+    @property
+    def pending_count(self) -> int:
+        """队列中待发送的消息数"""
+        return len(self._pending)
+    
+    def enqueue(self, message: dict, text: Optional[str]) -> bool:
+        """
+        消息入队
+        
+        Args:
+            message: 消息字典
+            text: 已编码的消息文本
+        
+        Returns:
+            是否入队成功(队列已满返回 False)
+        """
+        enqueued_at = time.perf_counter()
+        event_type = message.get('type')
+        if event_type in STATE_EVENTS:
+            key = ('state', event_type)
+            previous = self._pending.pop(key, None)
+            if previous is not None:
+                # 合并后需重新编码,移到队尾以保持与生命周期事件的先后顺序;
+                # 入队时间取被合并的旧消息,从最早未发出的变化算起
+                message, text, enqueued_at = _merge_state(previous[0], message), None, previous[2]
+        else:
+            self._seq += 1
+            key = ('event', self._seq)
+        
+        if len(self._pending) >= settings.ws_queue_size:
+            return False
+        
+        self._pending[key] = (message, text, enqueued_at)
+        self._wakeup.set()
+        return True
+    
+    async def _writer(self):
+        """写任务: 按顺序发送队列中的消息"""
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._pending:
+                    _, (message, text, enqueued_at) = self._pending.popitem(last=False)
+                    if text is None:
+                        text = encode_message(message)
+                    await asyncio.wait_for(
+                        self.websocket.send_text(text),
+                        timeout=settings.ws_send_timeout
+                    )
+                    ws_send_latency.observe(time.perf_counter() - enqueued_at, self.client_type)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 发送超时或连接已断开
+            self._on_dead(self)
 
 class ConnectionManager:
     """WebSocket 连接管理器"""
     
     def __init__(self):
-        # 存储所有活跃的 WebSocket 连接
-        self.active_connections: List[WebSocket] = []
+        # 存储所有活跃的 WebSocket 连接及其发送队列
+        self.active_connections: Dict[WebSocket, ClientChannel] = {}
         # 按类型分组的连接
-        self.connections_by_type: Dict[str, List[WebSocket]] = {
-            'display': [],      # 大屏
-            'host': [],         # 主持人
-            'participant': []   # 参会人
+        self.connections_by_type: Dict[str, Dict[WebSocket, ClientChannel]] = {
+            'display': {},      # 大屏
+            'host': {},         # 主持人
+            'participant': {}   # 参会人
         }
-        # 缓存当前状态以便新连接同步
+        # 缓存当前状态以便新连接同步(多进程时通过消息总线同步,修改请使用 update_state)
         self.current_vote_id = None
         self.current_status = 'pending' # pending, active, voting, result, summary
     
+    def update_state(self, **changes):
+        """
+        修改直播状态并同步到其他进程
+        
+        Args:
+            changes: current_vote_id / current_status
+        """
+        for key, value in changes.items():
+            if key not in ('current_vote_id', 'current_status'):
+                raise ValueError(f"未知的状态: {key}")
+            setattr(self, key, value)
+        backplane.set_state(LIVE_STATE_KEY, {
+            'current_vote_id': self.current_vote_id,
+            'current_status': self.current_status
+        })
+    
     async def connect(self, websocket: WebSocket, client_type: str = 'display'):
         """
         接受新的 WebSocket 连接
@@ -30,9 +176,11 @@ class ConnectionManager:
             client_type: 客户端类型 (display/host/participant)
         """
         await websocket.accept()
-        self.active_connections.append(websocket)
+        channel = ClientChannel(websocket, client_type, self._drop)
+        channel.start()
+        self.active_connections[websocket] = channel
         if client_type in self.connections_by_type:
-            self.connections_by_type[client_type].append(websocket)
+            self.connections_by_type[client_type][websocket] = channel
     
     def disconnect(self, websocket: WebSocket):
         """
@@ -41,66 +189,257 @@ class ConnectionManager:
         Args:
             websocket: WebSocket 连接对象
         """
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        channel = self.active_connections.pop(websocket, None)
+        if channel is None:
+            return
+        channel.stop()
         
         # 从分组中移除
-        for connections in self.connections_by_type.values():
-            if websocket in connections:
-                connections.remove(websocket)
+        connections = self.connections_by_type.get(channel.client_type)
+        if connections is not None:
+            connections.pop(websocket, None)
     
-    async def broadcast(self, message: dict):
+    async def broadcast(self, message: dict, local_only: bool = False):
         """
         广播消息到所有连接
         
         Args:
             message: 消息字典
+            local_only: 只发给本进程的连接(各进程自行生成的消息,如投票进度)
         """
-        # 移除已断开的连接
-        dead_connections = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception:
-                dead_connections.append(connection)
-        
-        # 清理断开的连接
-        for connection in dead_connections:
-            self.disconnect(connection)
+        self._fan_out(self.active_connections, message, 'all')
+        if not local_only:
+            backplane.publish('broadcast', {'target': 'all', 'message': message})
     
-    async def send_to_type(self, client_type: str, message: dict):
+    async def send_to_type(self, client_type: str, message: dict, local_only: bool = False):
         """
         发送消息到特定类型的客户端
         
         Args:
             client_type: 客户端类型
             message: 消息字典
+            local_only: 只发给本进程的连接
         """
         if client_type not in self.connections_by_type:
             return
         
-        dead_connections = []
-        for connection in self.connections_by_type[client_type]:
-            try:
-                await connection.send_json(message)
-            except Exception:
-                dead_connections.append(connection)
+        self._fan_out(self.connections_by_type[client_type], message, client_type)
+        if not local_only:
+            backplane.publish('broadcast', {'target': client_type, 'message': message})
+    
+    def deliver_remote(self, data: dict):
+        """发送其他进程广播的消息到本进程的连接"""
+        target, message = data['target'], data['message']
+        if target == 'all':
+            self._fan_out(self.active_connections, message, target)
+        elif target in self.connections_by_type:
+            self._fan_out(self.connections_by_type[target], message, target)
+    
+    def _fan_out(self, connections: Dict[WebSocket, ClientChannel], message: dict, target: str):
+        """
+        将消息放入一组连接的发送队列
+        
+        消息只序列化一次;入队不等待网络发送,由各连接的写任务并发发送,
+        队列已满的连接视为跟不上,直接断开
+        
+        Args:
+            connections: 连接字典
+            message: 消息字典
+            target: 广播对象(all 或客户端类型),用于运行指标
+        """
+        if not connections:
+            return
         
-        # 清理断开的连接
-        for connection in dead_connections:
-            self.disconnect(connection)
+        started = time.perf_counter()
+        text = encode_message(message)
+        overflowed = [
+            channel for channel in list(connections.values())
+            if not channel.enqueue(message, text)
+        ]
+        
+        # 清理跟不上的连接
+        for channel in overflowed:
+            self._drop(channel, 'slow')
+        
+        broadcast_enqueue_duration.observe(time.perf_counter() - started, target)
+        broadcast_messages.inc(target, amount=len(connections))
+    
+    def _drop(self, channel: ClientChannel, reason: str = 'dead'):
+        """移除慢连接或已断开的连接,并在后台关闭"""
+        if channel.websocket in self.active_connections:
+            ws_dropped.inc(reason)
+        self.disconnect(channel.websocket)
+        asyncio.get_running_loop().create_task(self._close_quietly(channel.websocket))
     
-    async def send_to_display(self, message: dict):
+    @staticmethod
+    async def _close_quietly(connection: WebSocket):
+        try:
+            await asyncio.wait_for(connection.close(), timeout=settings.ws_send_timeout)
+        except Exception:
+            pass
+    
+    async def send_to_display(self, message: dict, local_only: bool = False):
         """发送消息到大屏"""
-        await self.send_to_type('display', message)
+        await self.send_to_type('display', message, local_only)
     
-    async def send_to_host(self, message: dict):
+    async def send_to_host(self, message: dict, local_only: bool = False):
         """发送消息到主持人"""
-        await self.send_to_type('host', message)
+        await self.send_to_type('host', message, local_only)
     
-    async def send_to_participants(self, message: dict):
+    async def send_to_participants(self, message: dict, local_only: bool = False):
         """发送消息到所有参会人"""
-        await self.send_to_type('participant', message)
+        await self.send_to_type('participant', message, local_only)
+
+class VoteProgressPublisher:
+    """
+    投票进度推送
+    
+    投票进行中把实时计数推送到大屏和主持人,频率受 settings.vote_progress_rate 限制,
+    每帧只携带自上一帧以来变化的计数器
+    """
+    
+    def __init__(self, manager: ConnectionManager):
+        self.manager = manager
+        self.vote_id: Optional[int] = None
+        # 上一帧已推送的计数器
+        self._last_counters: Dict[str, int] = {}
+        self._last_total: Optional[int] = None
+        rate = settings.vote_progress_rate
+        self._throttler = Throttler(self._publish, 1 / rate) if rate > 0 else None
+    
+    def reset(self, vote_id: Optional[int]):
+        """
+        切换正在推送的投票
+        
+        Args:
+            vote_id: 投票 ID,None 表示停止推送
+        """
+        self.vote_id = vote_id
+        self._last_counters = {}
+        self._last_total = None
+        if self._throttler:
+            self._throttler.cancel()
+    
+    def notify(self, vote_id: int):
+        """有新的投票提交"""
+        if self._throttler and vote_id == self.vote_id:
+            self._throttler.mark()
+    
+    async def _publish(self):
+        """推送一帧进度(只包含变化的计数器)"""
+        vote_id = self.vote_id
+        tally = tally_engine.peek(vote_id) if vote_id is not None else None
+        if tally is None:
+            return
+        
+        counters = tally.counters()
+        total_count = tally.total_count
+        full = self._last_total is None
+        changed = {
+            key: value for key, value in counters.items()
+            if full or self._last_counters.get(key) != value
+        }
+        if not changed and total_count == self._last_total:
+            return
+        
+        self._last_counters = counters
+        self._last_total = total_count
+        message = {
+            "type": "vote_progress",
+            "data": {
+                "vote_id": vote_id,
+                "full": full,
+                "total_count": total_count,
+                "counts": changed
+            }
+        }
+        # 各进程按同步后的计数器各自推送
+        await self.manager.send_to_display(message, local_only=True)
+        await self.manager.send_to_host(message, local_only=True)
+
+class SigninCountPublisher:
+    """
+    签到人数推送
+    
+    签到高峰时不再每次签到都广播,而是按 settings.signin_broadcast_interval 的固定节奏
+    广播内存中的最新签到人数
+    """
+    
+    def __init__(self, manager: ConnectionManager):
+        self.manager = manager
+        self.activity_id: Optional[int] = None
+        self._last_count: Optional[int] = None
+        self._throttler = Throttler(self._publish, settings.signin_broadcast_interval)
+    
+    def notify(self, activity_id: int):
+        """有新的签到"""
+        self.activity_id = activity_id
+        self._throttler.mark()
+    
+    async def _publish(self):
+        """广播最新签到人数"""
+        count = participant_counter.peek(self.activity_id) if self.activity_id is not None else None
+        if count is None or count == self._last_count:
+            return
+        self._last_count = count
+        await self.manager.broadcast({
+            "type": "participant_signed_in",
+            "data": {"count": count}
+        }, local_only=True)
 
 # 全局 WebSocket 管理器实例
 manager = ConnectionManager()
+
+# 各类型的在线连接数(抓取时统计)
+metrics.gauge(
+    'ws_connections', '在线 WebSocket 连接数', ('client_type',),
+    collect=lambda: {(client_type,): len(connections) for client_type, connections in manager.connections_by_type.items()}
+)
+
+# 全局投票进度推送实例
+progress_publisher = VoteProgressPublisher(manager)
+
+# 全局签到人数推送实例
+signin_publisher = SigninCountPublisher(manager)
+
+# ===== 多进程同步 =====
+
+# 后台加载任务(保留引用,避免被回收)
+_loading_tasks = set()
+
+async def _preload_tally(vote_id: int):
+    """加载投票计数器,之后才能接收其他进程提交的投票并推送进度"""
+    from backend.database import AsyncSessionLocal
+    
+    try:
+        async with AsyncSessionLocal() as db:
+            await tally_engine.get(db, vote_id)
+        progress_publisher.notify(vote_id)
+    except Exception as e:
+        print(f"加载投票 {vote_id} 的计数器失败: {e}")
+
+def _on_live_state(state: Optional[dict]):
+    """其他进程修改了直播状态(或启动时加载)"""
+    if not state:
+        return
+    manager.current_vote_id = state.get('current_vote_id')
+    manager.current_status = state.get('current_status', 'pending')
+    
+    vote_id = manager.current_vote_id if manager.current_status == 'voting' else None
+    if vote_id == progress_publisher.vote_id:
+        return
+    progress_publisher.reset(vote_id)
+    if vote_id is not None and tally_engine.peek(vote_id) is None:
+        task = asyncio.get_running_loop().create_task(_preload_tally(vote_id))
+        _loading_tasks.add(task)
+        task.add_done_callback(_loading_tasks.discard)
+
+def _on_remote_votes(data: dict):
+    """其他进程提交了投票(计数器已由计票引擎更新)"""
+    for vote_id in {record[0] for record in data['records']}:
+        progress_publisher.notify(vote_id)
+
+backplane.on('broadcast', manager.deliver_remote)
+backplane.on('tally', _on_remote_votes)
+backplane.on('participants', lambda data: signin_publisher.notify(data['activity_id']))
+backplane.on_state(LIVE_STATE_KEY, _on_live_state)
@@ -1,17 +1,43 @@
 """
 活动管理服务
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, func, desc
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.models import Activity, Vote, Participant, VoteRecord
 from backend.schemas import ActivityCreate, VoteCreate
-from typing import Optional, List
+from backend.config import settings
+from backend.utils.cache import VersionedCache
+from backend.services.backplane import backplane
+from backend.services.journal import journal_writer
+from datetime import datetime
+from typing import Optional, List, NamedTuple
 import json
 
+class ActivitySnapshot(NamedTuple):
+    """缓存中的活动信息"""
+    id: int
+    name: str
+    theme: Optional[str]
+    status: str
+    created_at: datetime
+
+# 当前活动和主持人面板数据缓存,活动或投票变化时失效
+activity_cache = VersionedCache(ttl=settings.state_cache_ttl, name='activity')
+
+# 活动统计摘要缓存(activity_id -> 投票部分的摘要),有新投票或投票变化时失效
+summary_cache = VersionedCache(name='summary')
+
+# activity_cache 中的键
+CURRENT_ACTIVITY_KEY = 'current_activity'
+HOST_STATUS_KEY = 'host_status'
+
+_MISSING = object()
+
 class ActivityService:
     """活动管理服务"""
     
     @staticmethod
-    def create_activity(db: Session, activity: ActivityCreate) -> Activity:
+    async def create_activity(db: AsyncSession, activity: ActivityCreate) -> Activity:
         """创建新活动"""
         db_activity = Activity(
             name=activity.name,
@@ -19,77 +45,121 @@ class ActivityService:
             status='pending'
         )
         db.add(db_activity)
-        db.commit()
-        db.refresh(db_activity)
+        await db.commit()
+        await db.refresh(db_activity)
         
         # 自动从投票模板复制投票列表到新活动
         from backend.services.vote_template import VoteTemplateService
-        VoteTemplateService.copy_templates_to_activity(db, db_activity.id)
+        await VoteTemplateService.copy_templates_to_activity(db, db_activity.id)
+        activity_cache.invalidate()
+        
+        # 开始记录签到和投票流水
+        journal_writer.create(db_activity.id, db_activity.name)
         
         return db_activity
     
     @staticmethod
-    def get_current_activity(db: Session) -> Optional[Activity]:
-        """获取当前活动(最新的活动)"""
-        return db.query(Activity).order_by(Activity.id.desc()).first()
+    async def get_activity(db: AsyncSession, activity_id: int) -> Optional[Activity]:
+        """获取活动"""
+        return await db.get(Activity, activity_id)
     
     @staticmethod
-    def update_activity_status(db: Session, activity_id: int, status: str) -> Activity:
+    async def get_current_activity(db: AsyncSession) -> Optional[ActivitySnapshot]:
+        """获取当前活动(最新的活动,优先读缓存)"""
+        cached = activity_cache.get(CURRENT_ACTIVITY_KEY, _MISSING)
+        if cached is not _MISSING:
+            return cached
+        
+        version = activity_cache.version
+        activity = await db.scalar(select(Activity).order_by(Activity.id.desc()).limit(1))
+        snapshot = ActivitySnapshot(
+            id=activity.id,
+            name=activity.name,
+            theme=activity.theme,
+            status=activity.status,
+            created_at=activity.created_at
+        ) if activity else None
+        activity_cache.set(CURRENT_ACTIVITY_KEY, snapshot, version)
+        return snapshot
+    
+    @staticmethod
+    async def update_activity_status(db: AsyncSession, activity_id: int, status: str) -> Activity:
         """更新活动状态"""
-        activity = db.query(Activity).filter(Activity.id == activity_id).first()
+        activity = await db.get(Activity, activity_id)
         if activity:
             activity.status = status
-            db.commit()
-            db.refresh(activity)
+            await db.commit()
+            await db.refresh(activity)
+            activity_cache.invalidate()
         return activity
     
     @staticmethod
-    def get_activity_summary(db: Session, activity_id: int) -> dict:
-        """获取活动统计摘要"""
-        # 签到人数
-        total_participants = db.query(Participant).filter(
-            Participant.activity_id == activity_id
-        ).count()
+    async def get_activity_summary(db: AsyncSession, activity_id: int) -> dict:
+        """获取活动统计摘要(投票部分按活动缓存,有新投票时失效)"""
+        from backend.services.participant import participant_counter
         
-        # 投票数量
-        votes = db.query(Vote).filter(Vote.activity_id == activity_id).all()
-        votes_completed = len(votes)
+        # 签到人数(内存计数)
+        total_participants = await participant_counter.get(db, activity_id)
         
-        # 每个投票的参与情况
-        votes_summary = []
-        vote_participation = {}  # 用于找出参与度最高的问卷
+        summary = summary_cache.get(activity_id)
+        if summary is None:
+            version = summary_cache.version
+            summary = await ActivityService._summarize_votes(db, activity_id)
+            summary_cache.set(activity_id, summary, version)
         
-        for vote in votes:
-            vote_count = db.query(VoteRecord).filter(
-                VoteRecord.vote_id == vote.id
-            ).count()
-            votes_summary.append({
-                'title': vote.title,
-                'type': vote.type,
-                'participants': vote_count
-            })
-            vote_participation[vote.id] = {
+        return {
+            'total_participants': total_participants,
+            **summary
+        }
+    
+    @staticmethod
+    async def _summarize_votes(db: AsyncSession, activity_id: int) -> dict:
+        """统计各投票参与人数和参与最多的人员(两条聚合查询)"""
+        # 每个投票的参与人数,一条分组聚合查询
+        vote_counts = (await db.execute(
+            select(
+                Vote.id,
+                Vote.title,
+                Vote.type,
+                func.count(VoteRecord.id).label('vote_count')
+            ).outerjoin(
+                VoteRecord, VoteRecord.vote_id == Vote.id
+            ).where(
+                Vote.activity_id == activity_id
+            ).group_by(
+                Vote.id
+            ).order_by(
+                Vote.id
+            )
+        )).all()
+        votes_completed = len(vote_counts)
+        
+        votes_summary = [
+            {
                 'title': vote.title,
                 'type': vote.type,
-                'participants': vote_count
+                'participants': vote.vote_count
             }
+            for vote in vote_counts
+        ]
         
         # 统计参与问卷次数最多的前三名人员
-        from sqlalchemy import func, desc
-        top_participants_query = db.query(
-            Participant.id,
-            Participant.name,
-            Participant.department,
-            func.count(VoteRecord.id).label('vote_count')
-        ).join(
-            VoteRecord, VoteRecord.participant_id == Participant.id
-        ).filter(
-            Participant.activity_id == activity_id
-        ).group_by(
-            Participant.id, Participant.name, Participant.department
-        ).order_by(
-            desc('vote_count')
-        ).limit(3).all()
+        top_participants_query = (await db.execute(
+            select(
+                Participant.id,
+                Participant.name,
+                Participant.department,
+                func.count(VoteRecord.id).label('vote_count')
+            ).join(
+                VoteRecord, VoteRecord.participant_id == Participant.id
+            ).where(
+                Participant.activity_id == activity_id
+            ).group_by(
+                Participant.id, Participant.name, Participant.department
+            ).order_by(
+                desc('vote_count')
+            ).limit(3)
+        )).all()
         
         top_participants = [
             {
@@ -102,16 +172,12 @@ class ActivityService:
         
         # 找出参与度最高的问卷
         most_popular_vote = None
-        if vote_participation:
-            max_participants = max(v['participants'] for v in vote_participation.values())
+        if votes_summary:
+            max_participants = max(v['participants'] for v in votes_summary)
             if max_participants > 0:
-                for vote_data in vote_participation.values():
-                    if vote_data['participants'] == max_participants:
-                        most_popular_vote = vote_data
-                        break
+                most_popular_vote = next(v for v in votes_summary if v['participants'] == max_participants)
         
         return {
-            'total_participants': total_participants,
             'votes_completed': votes_completed,
             'votes_summary': votes_summary,
             'top_participants': top_participants,
@@ -119,18 +185,40 @@ class ActivityService:
         }
     
     @staticmethod
-    def reset_activity_data(db: Session, activity_id: int):
+    async def reset_activity_data(db: AsyncSession, activity_id: int):
         """重置活动数据(清空签到和投票记录)"""
         # 删除投票记录
-        db.query(VoteRecord).filter(
-            VoteRecord.vote_id.in_(
-                db.query(Vote.id).filter(Vote.activity_id == activity_id)
-            )
-        ).delete(synchronize_session=False)
+        await db.execute(
+            delete(VoteRecord).where(
+                VoteRecord.vote_id.in_(
+                    select(Vote.id).where(Vote.activity_id == activity_id)
+                )
+            ).execution_options(synchronize_session=False)
+        )
         
         # 删除参会人
-        db.query(Participant).filter(
-            Participant.activity_id == activity_id
-        ).delete(synchronize_session=False)
+        await db.execute(
+            delete(Participant).where(
+                Participant.activity_id == activity_id
+            ).execution_options(synchronize_session=False)
+        )
+        
+        await db.commit()
         
-        db.commit()
+        ActivityService.discard_activity_state(activity_id)
+        summary_cache.invalidate()
+        # 其他进程同样清空内存状态
+        backplane.publish('activity_reset', {'activity_id': activity_id})
+    
+    @staticmethod
+    def discard_activity_state(activity_id: int):
+        """清空计票引擎中该活动的计数器、签到人数和 session 缓存"""
+        from backend.services.tally import tally_engine
+        from backend.services.participant import participant_counter, session_cache
+        tally_engine.discard_activity(activity_id)
+        participant_counter.reset(activity_id)
+        # 已删除参会人的 session 失效
+        session_cache.discard_where(lambda participant: participant.activity_id == activity_id)
+
+# 其他进程重置活动数据时,同步清空本进程的内存状态
+backplane.on('activity_reset', lambda data: ActivityService.discard_activity_state(data['activity_id']))
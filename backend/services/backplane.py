@@ -0,0 +1,539 @@
+"""
+多进程消息总线 - 在多个 worker 进程之间同步广播和共享状态
+
+每个 worker 进程只持有自己的 WebSocket 连接和内存状态(计票、签到人数、缓存)。
+主持人操作的广播、投票和签到的增量、缓存失效等通过总线发给其他进程,
+由各进程在本地处理;当前投票、管理员令牌等共享状态保存在总线的存储中,
+进程启动(或重启)时加载;共享状态可以设置过期时间,到期后从存储中清除。
+
+- memory: 单进程(默认),不做任何同步
+- sqlite: 同一台机器上的多个 worker,通过共享的 SQLite 文件轮询消息
+- redis: 通过 Redis 的 PUBLISH/SUBSCRIBE 和哈希表,可跨机器
+"""
+from backend.config import settings
+from backend.utils.cache import VersionedCache
+from backend.utils.metrics import metrics
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import json
+import time
+import uuid
+
+backplane_messages = metrics.counter(
+    'backplane_messages_total', '消息总线收发的消息数', ('direction',)
+)
+
+_MISSING = object()
+
+# 消息处理函数,接收消息数据
+Handler = Callable[[Any], None]
+
+class Backplane:
+    """
+    消息总线(单进程实现)
+    
+    publish() 把事件发给其他进程,本进程不会收到自己发出的事件;
+    set_state() 立即修改本地的共享状态,并同步给其他进程。
+    两者都不等待网络,按调用顺序发送
+    
+    过期时间使用 time.time(),各进程共用
+    """
+    
+    def __init__(self):
+        # 进程标识,用于忽略自己发出的消息
+        self.node_id = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._state_handlers: Dict[str, List[Handler]] = {}
+        self._state: Dict[str, Any] = {}
+        # 有过期时间的状态: key -> 过期时间
+        self._expires: Dict[str, float] = {}
+    
+    @property
+    def distributed(self) -> bool:
+        """是否有其他进程需要同步"""
+        return False
+    
+    def on(self, kind: str, handler: Handler):
+        """注册其他进程发来的事件的处理函数"""
+        self._handlers.setdefault(kind, []).append(handler)
+    
+    def on_state(self, key: str, handler: Handler):
+        """注册共享状态被其他进程修改(或启动时加载)后的处理函数"""
+        self._state_handlers.setdefault(key, []).append(handler)
+    
+    def publish(self, kind: str, data: Any):
+        """发布事件到其他进程"""
+    
+    def get_state(self, key: str, default: Any = None) -> Any:
+        """读取共享状态(已过期的视为不存在)"""
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._store(key, None, None)
+            return default
+        return self._state.get(key, default)
+    
+    def get_states(self, prefix: str) -> Dict[str, Any]:
+        """读取键以 prefix 开头的所有共享状态"""
+        return {
+            key: value for key, value in list(self._state.items())
+            if key.startswith(prefix) and self.get_state(key, _MISSING) is not _MISSING
+        }
+    
+    def set_state(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        修改共享状态
+        
+        Args:
+            key: 键
+            value: 值(可 JSON 序列化),None 表示删除
+            ttl: 过期时间(秒),None 表示不过期
+        """
+        self._store(key, value, time.time() + ttl if ttl else None)
+    
+    def _store(self, key: str, value: Any, expires: Optional[float]):
+        """修改本地的共享状态,并清除已过期的状态"""
+        if value is None:
+            self._state.pop(key, None)
+            self._expires.pop(key, None)
+            return
+        self._state[key] = value
+        if expires is None:
+            self._expires.pop(key, None)
+            return
+        self._expires[key] = expires
+        now = time.time()
+        for expired in [k for k, t in self._expires.items() if t <= now]:
+            self._state.pop(expired, None)
+            del self._expires[expired]
+    
+    async def start(self):
+        """启动(连接存储、加载共享状态、开始接收消息)"""
+    
+    async def stop(self):
+        """发送完待发消息后停止"""
+    
+    def _deliver(self, envelope: dict):
+        """处理其他进程发来的消息"""
+        if envelope.get('origin') == self.node_id:
+            return
+        backplane_messages.inc('received')
+        kind = envelope.get('kind')
+        data = envelope.get('data')
+        if kind == 'state':
+            key, value = data['key'], data['value']
+            self._store(key, value, data.get('expires'))
+            handlers = self._state_handlers.get(key, ())
+            data = value
+        else:
+            handlers = self._handlers.get(kind, ())
+        for handler in handlers:
+            try:
+                handler(data)
+            except Exception as e:
+                print(f"消息总线处理 {kind} 失败: {e}")
+    
+    def _load_state(self, state: Dict[str, Tuple[Any, Optional[float]]]):
+        """
+        加载存储中的共享状态,并通知处理函数
+        
+        Args:
+            state: key -> (值, 过期时间)
+        """
+        for key, (value, expires) in state.items():
+            self._store(key, value, expires)
+            for handler in self._state_handlers.get(key, ()):
+                try:
+                    handler(value)
+                except Exception as e:
+                    print(f"消息总线加载状态 {key} 失败: {e}")
+
+class QueuedBackplane(Backplane):
+    """
+    多进程消息总线基类
+    
+    待发消息进入队列,由后台任务成批发送,保证发送顺序与调用顺序一致
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+    
+    @property
+    def distributed(self) -> bool:
+        return True
+    
+    def _enqueue(self, envelope: dict):
+        if self._outbox is None:
+            return
+        self._outbox.put_nowait(envelope)
+        backplane_messages.inc('sent')
+    
+    def publish(self, kind: str, data: Any):
+        self._enqueue({'origin': self.node_id, 'kind': kind, 'data': data})
+    
+    def set_state(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires = time.time() + ttl if ttl else None
+        self._store(key, value, expires)
+        self._enqueue({
+            'origin': self.node_id,
+            'kind': 'state',
+            'data': {'key': key, 'value': value, 'expires': expires}
+        })
+    
+    async def start(self):
+        self._outbox = asyncio.Queue()
+        await self._connect()
+        self._tasks = [
+            asyncio.create_task(self._sender()),
+            asyncio.create_task(self._receiver())
+        ]
+    
+    async def stop(self):
+        if self._outbox is None:
+            return
+        # 发送完剩余消息
+        await self._outbox.put(None)
+        await asyncio.gather(self._tasks[0], return_exceptions=True)
+        for task in self._tasks[1:]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._outbox = None
+        await self._close()
+    
+    async def _sender(self):
+        """后台任务: 取出队列中的全部消息,成批发送"""
+        stopping = False
+        while not stopping:
+            envelope = await self._outbox.get()
+            if envelope is None:
+                break
+            batch = [envelope]
+            while not self._outbox.empty():
+                envelope = self._outbox.get_nowait()
+                if envelope is None:
+                    stopping = True
+                    break
+                batch.append(envelope)
+            try:
+                await self._send(batch)
+            except Exception as e:
+                print(f"消息总线发送失败({len(batch)} 条): {e}")
+    
+    async def _connect(self):
+        raise NotImplementedError
+    
+    async def _close(self):
+        raise NotImplementedError
+    
+    async def _send(self, batch: List[dict]):
+        raise NotImplementedError
+    
+    async def _receiver(self):
+        raise NotImplementedError
+
+class SQLiteBackplane(QueuedBackplane):
+    """
+    基于 SQLite 文件的消息总线(同一台机器上的多个 worker)
+    
+    消息追加到 messages 表,各进程每隔 poll_interval 秒读取新消息;
+    共享状态保存在 state 表。超过 retention 秒的消息和已过期的状态定期清理
+    """
+    
+    PRUNE_INTERVAL = 10
+    
+    def __init__(self, path: str, poll_interval: float, retention: float = 60):
+        super().__init__()
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._db = None
+        self._last_id = 0
+    
+    async def _connect(self):
+        import aiosqlite
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = await aiosqlite.connect(self.path, isolation_level=None)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA synchronous=NORMAL")
+        await self._db.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+        await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, body TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        # 旧版本创建的 state 表没有过期时间列
+        async with self._db.execute("PRAGMA table_info(state)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if 'expires_at' not in columns:
+            await self._db.execute("ALTER TABLE state ADD COLUMN expires_at REAL")
+        
+        # 只接收启动之后的消息
+        async with self._db.execute("SELECT COALESCE(MAX(id), 0) FROM messages") as cursor:
+            self._last_id = (await cursor.fetchone())[0]
+        async with self._db.execute(
+            "SELECT key, value, expires_at FROM state WHERE expires_at IS NULL OR expires_at > ?", (time.time(),)
+        ) as cursor:
+            self._load_state({
+                key: (json.loads(value), expires_at) for key, value, expires_at in await cursor.fetchall()
+            })
+    
+    async def _close(self):
+        await self._db.close()
+        self._db = None
+    
+    async def _send(self, batch: List[dict]):
+        now = time.time()
+        await self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for envelope in batch:
+                if envelope['kind'] == 'state':
+                    data = envelope['data']
+                    if data['value'] is None:
+                        await self._db.execute("DELETE FROM state WHERE key = ?", (data['key'],))
+                    else:
+                        await self._db.execute(
+                            "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                            (data['key'], json.dumps(data['value'], ensure_ascii=False), data['expires'])
+                        )
+            await self._db.executemany(
+                "INSERT INTO messages (origin, body, created) VALUES (?, ?, ?)",
+                [(self.node_id, json.dumps(envelope, ensure_ascii=False), now) for envelope in batch]
+            )
+            await self._db.execute("COMMIT")
+        except Exception:
+            await self._db.execute("ROLLBACK")
+            raise
+    
+    async def _receiver(self):
+        """后台任务: 轮询新消息"""
+        last_prune = time.monotonic()
+        while True:
+            try:
+                async with self._db.execute(
+                    "SELECT id, origin, body FROM messages WHERE id > ? ORDER BY id", (self._last_id,)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                for message_id, origin, body in rows:
+                    self._last_id = message_id
+                    if origin != self.node_id:
+                        self._deliver(json.loads(body))
+                
+                if time.monotonic() - last_prune > self.PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    await self._db.execute("DELETE FROM messages WHERE created < ?", (time.time() - self.retention,))
+                    await self._db.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"消息总线读取失败: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+class RedisError(Exception):
+    """Redis 返回的错误"""
+
+class RedisConnection:
+    """最小的 Redis 协议(RESP2)客户端,只支持本模块用到的命令"""
+    
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+    
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self.execute('AUTH', self.password)
+        if self.db:
+            await self.execute('SELECT', self.db)
+    
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+    
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b''.join(parts)
+    
+    async def read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('Redis 连接已断开')
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b'+':
+            return body.decode('utf-8')
+        if prefix == b'-':
+            raise RedisError(body.decode('utf-8'))
+        if prefix == b':':
+            return int(body)
+        if prefix == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RedisError(f'无法解析的回复: {line!r}')
+    
+    async def execute(self, *args) -> Any:
+        """执行一条命令"""
+        return (await self.pipeline([args]))[0]
+    
+    async def pipeline(self, commands: List[Tuple]) -> List[Any]:
+        """一次发送多条命令,按顺序返回回复(错误回复以 RedisError 对象返回)"""
+        self._writer.write(b''.join(self.encode(*command) for command in commands))
+        await self._writer.drain()
+        replies = []
+        for _ in commands:
+            try:
+                replies.append(await self.read_reply())
+            except RedisError as e:
+                replies.append(e)
+        return replies
+
+class RedisBackplane(QueuedBackplane):
+    """
+    基于 Redis 的消息总线
+    
+    事件通过 PUBLISH/SUBSCRIBE 分发,每个共享状态保存为一个键(有过期时间的使用 SET ... PX),
+    由 Redis 到期删除。订阅连接断开后自动重连,并重新加载共享状态
+    """
+    
+    RECONNECT_DELAY = 1.0
+    
+    def __init__(self, url: str, prefix: str = 'ai-votes'):
+        super().__init__()
+        self.url = url
+        self.channel = f"{prefix}:events"
+        self.state_prefix = f"{prefix}:state:"
+        self._commands: Optional[RedisConnection] = None
+        # 发送任务和订阅任务(重连后重新加载状态)共用命令连接,
+        # 一次流水线的发送和读取回复必须独占连接,否则会读到对方的回复
+        self._commands_lock = asyncio.Lock()
+    
+    async def _connect(self):
+        self._commands = RedisConnection(self.url)
+        await self._commands.connect()
+        await self._reload_state()
+    
+    async def _reload_state(self):
+        keys = []
+        async with self._commands_lock:
+            cursor = '0'
+            while True:
+                cursor, batch = await self._commands.execute(
+                    'SCAN', cursor, 'MATCH', self.state_prefix + '*', 'COUNT', 500
+                )
+                keys.extend(batch)
+                cursor = cursor.decode('utf-8')
+                if cursor == '0':
+                    break
+            
+            replies = await self._commands.pipeline(
+                [command for key in keys for command in (('GET', key), ('PTTL', key))]
+            ) if keys else []
+        now = time.time()
+        state = {}
+        for i, key in enumerate(keys):
+            value, pttl = replies[2 * i], replies[2 * i + 1]
+            if value is None or isinstance(value, RedisError):
+                continue
+            expires = now + pttl / 1000 if isinstance(pttl, int) and pttl >= 0 else None
+            state[key.decode('utf-8')[len(self.state_prefix):]] = (json.loads(value), expires)
+        self._load_state(state)
+    
+    async def _close(self):
+        await self._commands.close()
+        self._commands = None
+    
+    async def _send(self, batch: List[dict]):
+        commands = []
+        for envelope in batch:
+            if envelope['kind'] == 'state':
+                data = envelope['data']
+                key = self.state_prefix + data['key']
+                ttl_ms = int((data['expires'] - time.time()) * 1000) if data['expires'] else None
+                if data['value'] is None or (ttl_ms is not None and ttl_ms <= 0):
+                    commands.append(('DEL', key))
+                elif ttl_ms is None:
+                    commands.append(('SET', key, json.dumps(data['value'], ensure_ascii=False)))
+                else:
+                    commands.append(('SET', key, json.dumps(data['value'], ensure_ascii=False), 'PX', ttl_ms))
+            commands.append(('PUBLISH', self.channel, json.dumps(envelope, ensure_ascii=False)))
+        async with self._commands_lock:
+            try:
+                await self._commands.pipeline(commands)
+            except (ConnectionError, OSError):
+                # 重连后重发一次
+                await self._commands.close()
+                await self._commands.connect()
+                await self._commands.pipeline(commands)
+    
+    async def _receiver(self):
+        """后台任务: 订阅事件频道"""
+        first = True
+        while True:
+            subscriber = RedisConnection(self.url)
+            try:
+                await subscriber.connect()
+                await subscriber.execute('SUBSCRIBE', self.channel)
+                if not first:
+                    # 断开期间可能错过了状态变化
+                    await self._reload_state()
+                first = False
+                while True:
+                    reply = await subscriber.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b'message':
+                        self._deliver(json.loads(reply[2]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"消息总线订阅断开: {e}")
+            finally:
+                await subscriber.close()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+def create_backplane() -> Backplane:
+    """按配置创建消息总线"""
+    kind = settings.backplane
+    if kind == 'sqlite':
+        return SQLiteBackplane(settings.backplane_url or 'data/backplane.db', settings.backplane_poll_ms / 1000)
+    if kind == 'redis':
+        return RedisBackplane(settings.backplane_url or 'redis://127.0.0.1:6379/0')
+    return Backplane()
+
+# 全局消息总线实例
+backplane = create_backplane()
+
+# 有名称的缓存失效时通知其他进程
+VersionedCache.invalidation_listeners.append(lambda name: backplane.publish('cache', {'name': name}))
+
+def _invalidate_cache(data: dict):
+    cache = VersionedCache.registry.get(data['name'])
+    if cache is not None:
+        cache.invalidate(propagate=False)
+
+backplane.on('cache', _invalidate_cache)
@@ -0,0 +1,115 @@
+"""
+组提交队列 - 合并并发写请求
+"""
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from backend.utils.metrics import ingest_items, ingest_failures, ingest_batch_size, ingest_flush_duration
+import asyncio
+import time
+
+class GroupCommitQueue:
+    """
+    组提交队列
+    
+    并发提交的写请求先进入队列,由单个后台任务每隔 interval 秒(或攒满 max_batch 条)
+    合并成一批,在一个事务中写入;每个调用方在所属批次落库后才拿到结果
+    """
+    
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Awaitable[List[Any]]],
+        interval: float,
+        max_batch: int,
+        name: str = 'default'
+    ):
+        """
+        Args:
+            flush: 批量写入函数,接收一批请求,按顺序返回每个请求的结果
+                (结果为异常对象时只让对应的请求失败)
+            interval: 攒批等待时间(秒)
+            max_batch: 每批最大请求数
+            name: 队列名称,用于运行指标
+        """
+        self.flush = flush
+        self.interval = interval
+        self.max_batch = max_batch
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """启动后台写入任务"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """写完队列中剩余的请求后停止"""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+    
+    async def submit(self, item: Any) -> Any:
+        """
+        提交一个写请求,等待所属批次落库
+        
+        Args:
+            item: 请求内容
+        
+        Returns:
+            flush 返回的对应结果
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+    
+    async def _run(self):
+        """后台任务: 攒批并写入"""
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            
+            # 等待一小段时间,让并发请求进入同一批
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.interval)
+            
+            batch: List[Tuple[Any, asyncio.Future]] = [first]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                entry = self._queue.get_nowait()
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            
+            await self._flush_batch(batch)
+    
+    async def _flush_batch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """写入一批请求并通知调用方"""
+        started = time.perf_counter()
+        ingest_batch_size.observe(len(batch), self.name)
+        try:
+            results = await self.flush([item for item, _ in batch])
+        except Exception as e:
+            ingest_failures.inc(self.name, amount=len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            ingest_flush_duration.observe(time.perf_counter() - started, self.name)
+        
+        failed = 0
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                if not future.done():
+                    future.set_exception(result)
+            elif not future.done():
+                future.set_result(result)
+        ingest_items.inc(self.name, amount=len(batch) - failed)
+        if failed:
+            ingest_failures.inc(self.name, amount=failed)
@@ -0,0 +1,143 @@
+"""
+问答题相似回答聚类
+
+回答提交时计算字符三元组的 MinHash 签名,通过 LSH 分段桶找到候选簇,
+每条回答只和候选簇的代表回答比较,整体耗时随回答数线性增长
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import random
+import re
+import zlib
+
+# 去掉空白和标点,只比较文字内容
+_NOISE = re.compile(r'[\W_]+')
+
+def shingles(text: str, size: int = 3) -> Set[int]:
+    """
+    回答的字符 n 元组集合(以 crc32 表示)
+    
+    Args:
+        text: 回答内容
+        size: n 元组长度
+    
+    Returns:
+        n 元组哈希集合,内容为空时返回空集合
+    """
+    text = _NOISE.sub('', text.lower())
+    if not text:
+        return set()
+    if len(text) <= size:
+        return {zlib.crc32(text.encode('utf-8'))}
+    return {zlib.crc32(text[i:i + size].encode('utf-8')) for i in range(len(text) - size + 1)}
+
+class MinHasher:
+    """
+    MinHash 签名计算
+    
+    n 元组已经过 crc32 散列,每个哈希函数取为与一个随机掩码异或,
+    比取模的线性哈希快数倍,回答提交时的开销更小
+    """
+    
+    def __init__(self, num_perm: int, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._masks = [rng.getrandbits(32) for _ in range(num_perm)]
+    
+    def signature(self, features: Set[int]) -> Tuple[int, ...]:
+        """计算特征集合的 MinHash 签名"""
+        return tuple(min(feature ^ mask for feature in features) for mask in self._masks)
+
+class AnswerCluster:
+    """一组相似回答"""
+    
+    def __init__(self, cluster_id: int, text: str, signature: Tuple[int, ...]):
+        self.id = cluster_id
+        # 代表回答(簇中的第一条回答)
+        self.text = text
+        self.signature = signature
+        self.members: Set[int] = set()
+
+class AnswerClusterer:
+    """
+    增量相似回答聚类
+    
+    签名分成 bands 段,任意一段完全相同的回答进入同一个桶,桶中的簇即为候选;
+    候选簇代表回答与新回答的估计 Jaccard 相似度达到 threshold 时并入该簇
+    """
+    
+    NUM_PERM = 32
+    BANDS = 8
+    
+    _hasher: Optional[MinHasher] = None
+    
+    def __init__(self, threshold: float = 0.5):
+        if AnswerClusterer._hasher is None:
+            AnswerClusterer._hasher = MinHasher(self.NUM_PERM)
+        self.threshold = threshold
+        self.rows = self.NUM_PERM // self.BANDS
+        self._clusters: List[AnswerCluster] = []
+        # (段号, 段签名) -> 簇 ID 列表
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        # participant_id -> 簇 ID
+        self._membership: Dict[int, int] = {}
+    
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(self.BANDS):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+    
+    @staticmethod
+    def _similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        """由签名估计 Jaccard 相似度"""
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+    
+    def add(self, participant_id: int, text: str):
+        """加入一条回答(同一参会人再次提交时先移出原来的簇)"""
+        self.remove(participant_id)
+        
+        features = shingles(text)
+        if not features:
+            return
+        signature = self._hasher.signature(features)
+        
+        # 在候选簇中找最相似的一个
+        best: Optional[AnswerCluster] = None
+        best_similarity = self.threshold
+        seen: Set[int] = set()
+        for key in self._bands(signature):
+            for cluster_id in self._buckets.get(key, ()):
+                if cluster_id in seen:
+                    continue
+                seen.add(cluster_id)
+                cluster = self._clusters[cluster_id]
+                similarity = self._similarity(signature, cluster.signature)
+                if similarity >= best_similarity:
+                    best, best_similarity = cluster, similarity
+        
+        if best is None:
+            best = AnswerCluster(len(self._clusters), text, signature)
+            self._clusters.append(best)
+            for key in self._bands(signature):
+                self._buckets.setdefault(key, []).append(best.id)
+        
+        best.members.add(participant_id)
+        self._membership[participant_id] = best.id
+    
+    def remove(self, participant_id: int):
+        """移出一条回答"""
+        cluster_id = self._membership.pop(participant_id, None)
+        if cluster_id is not None:
+            self._clusters[cluster_id].members.discard(participant_id)
+    
+    def top(self, n: int, min_count: int = 2) -> List[dict]:
+        """
+        人数最多的 n 个簇
+        
+        Returns:
+            [{'text': 代表回答, 'count': 人数}, ...],按人数降序
+        """
+        clusters = sorted(
+            (cluster for cluster in self._clusters if len(cluster.members) >= min_count),
+            key=lambda cluster: len(cluster.members),
+            reverse=True
+        )
+        return [{'text': cluster.text, 'count': len(cluster.members)} for cluster in clusters[:n]]
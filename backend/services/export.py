@@ -1,171 +1,652 @@
 """
-CSV 导出服务
+数据导出服务(CSV 和压缩归档)
 """
 import csv
+import gzip
+import io
+from contextlib import ExitStack
+from collections import OrderedDict
 from pathlib import Path
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import AsyncSessionLocal
 from backend.models import Activity, Vote, VoteRecord, Participant
+from backend.services.journal import ActivityJournal, journal_writer
+from backend.services.backplane import backplane
+from backend.config import settings
+from backend.utils.metrics import export_duration
+from backend.utils.query_audit import audit_queries
 from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import asyncio
 import json
+import time
+import uuid
+
+EXPORT_DIR = Path("data/exports")
+
+# 归档文件后缀(gzip 压缩的 JSON Lines)
+ARCHIVE_SUFFIX = ".jsonl.gz"
+
+class JournalRecord(NamedTuple):
+    """从流水文件还原的投票记录(字段与 _stream_records 的记录行相同)"""
+    vote_id: int
+    vote_title: str
+    vote_type: str
+    participant_id: int
+    name: str
+    department: Optional[str]
+    answer: str
+    voted_at: datetime
+
+class ExportJob:
+    """后台导出任务"""
+    
+    def __init__(self, activity_id: int):
+        self.id = uuid.uuid4().hex
+        self.activity_id = activity_id
+        self.status = 'pending'  # pending / running / done / failed
+        self.total = 0
+        self.written = 0
+        self.files: Optional[Dict[str, str]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+    
+    def to_dict(self) -> dict:
+        """任务状态(接口返回)"""
+        return {
+            'job_id': self.id,
+            'activity_id': self.activity_id,
+            'status': self.status,
+            'total': self.total,
+            'written': self.written,
+            'progress': round(self.written / self.total * 100, 1) if self.total else (100.0 if self.status == 'done' else 0.0),
+            'files': self.files,
+            'error': self.error,
+            'created_at': self.created_at.isoformat()
+        }
+
+class RecordCounter:
+    """
+    导出时累计单个投票的统计
+    
+    数据库中每人每个投票只有一条记录,只需按选项计数,不做改票处理,也不统计关键词和相似回答
+    """
+    
+    def __init__(self, vote_id: int, vote_type: str, options: List[str], keep_texts: bool = False):
+        """
+        Args:
+            vote_id: 投票 ID
+            vote_type: 投票类型
+            options: 选项列表
+            keep_texts: 是否保存问答题的回答内容(写归档时需要)
+        """
+        self.vote_id = vote_id
+        self.type = vote_type
+        self.options = options
+        self.counts: Dict[str, int] = {option: 0 for option in options}
+        self.ratings = [0] * 5
+        self.total_count = 0
+        self.keep_texts = keep_texts
+        # 问答: (participant_id, 回答内容)
+        self.texts: List[Tuple[int, str]] = []
+    
+    def add(self, participant_id: int, answer: dict):
+        """累计一条投票记录"""
+        if not isinstance(answer, dict):
+            answer = {}
+        self.total_count += 1
+        if self.type == 'single':
+            selected = answer.get('selected')
+            if isinstance(selected, str) and selected in self.counts:
+                self.counts[selected] += 1
+        elif self.type == 'multiple':
+            selected = answer.get('selected')
+            for option in selected if isinstance(selected, list) else []:
+                if isinstance(option, str) and option in self.counts:
+                    self.counts[option] += 1
+        elif self.type == 'rating':
+            rating = answer.get('rating', 0)
+            if isinstance(rating, int) and 1 <= rating <= 5:
+                self.ratings[rating - 1] += 1
+        elif self.type == 'text' and self.keep_texts:
+            text = answer.get('text', '')
+            self.texts.append((participant_id, text if isinstance(text, str) else ''))
+    
+    def results(self) -> dict:
+        """生成结果统计(格式与 VoteTally.results 相同,问答题不含关键词和相似回答)"""
+        total_count = self.total_count
+        
+        if self.type in ['single', 'multiple', 'rating']:
+            if self.type == 'rating':
+                counts = {f"{i + 1}星": count for i, count in enumerate(self.ratings)}
+            else:
+                counts = self.counts
+            result_list = [
+                {
+                    'option': option,
+                    'count': count,
+                    'percentage': f"{count / total_count * 100:.1f}%" if total_count > 0 else "0%"
+                }
+                for option, count in counts.items()
+            ]
+            results = {
+                'vote_id': self.vote_id,
+                'type': self.type,
+                'results': result_list
+            }
+            if self.type == 'rating':
+                total_rating = sum((i + 1) * count for i, count in enumerate(self.ratings))
+                results['average'] = round(total_rating / total_count, 2) if total_count > 0 else 0
+            return results
+        
+        elif self.type == 'text':
+            # 问答题返回 participant_id,由调用方补充姓名
+            return {
+                'vote_id': self.vote_id,
+                'type': self.type,
+                'total_count': total_count,
+                'answers': [
+                    {'participant_id': participant_id, 'text': text}
+                    for participant_id, text in self.texts
+                ]
+            }
+        
+        return {}
 
 class ExportService:
     """CSV 导出服务"""
     
+    # 流式读取时每批取回的记录数
+    EXPORT_CHUNK_SIZE = 500
+    
+    RECORDS_HEADER = ['活动名称', '投票标题', '参会人姓名', '参会人部门', '投票内容', '投票时间']
+    STATISTICS_HEADER = ['投票标题', '选项', '票数', '百分比']
+    
     @staticmethod
-    def export_activity_data(db: Session, activity_id: int) -> tuple[str, str]:
+    async def export_activity_data(
+        db: AsyncSession,
+        activity_id: int,
+        job: Optional[ExportJob] = None,
+        finalize: bool = False
+    ) -> tuple[str, str, Optional[str]]:
         """
-        导出活动数据为 CSV 文件
+        导出活动数据为 CSV 文件和压缩归档
+        
+        单进程部署且活动有流水文件时从流水文件还原投票记录,否则从数据库读取一遍投票记录;
+        记录文件和归档(gzip 压缩的 JSONL)在同一遍读取中写出,同时累计统计
         
         Args:
             db: 数据库会话
             activity_id: 活动 ID
+            job: 后台导出任务(用于汇报进度)
+            finalize: 是否结束流水文件(关闭活动时),结束后开始新的流水文件
         
         Returns:
-            (投票记录文件路径, 统计结果文件路径)
+            (投票记录文件路径, 统计结果文件路径, 归档文件路径)
         """
-        activity = db.query(Activity).filter(Activity.id == activity_id).first()
+        activity = await db.get(Activity, activity_id)
         if not activity:
-            return None, None
+            return None, None, None
         
         # 确保导出目录存在
-        export_dir = Path("data/exports")
-        export_dir.mkdir(parents=True, exist_ok=True)
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
         
-        # 生成文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        records_file = export_dir / f"activity_{activity_id}_records_{timestamp}.csv"
-        stats_file = export_dir / f"activity_{activity_id}_statistics_{timestamp}.csv"
+        records_file, stats_file, archive_file = ExportService._export_paths(EXPORT_DIR, activity_id)
+        if not settings.export_archive:
+            archive_file = None
+        
+        votes = (await db.execute(
+            select(Vote).where(Vote.activity_id == activity_id).order_by(Vote.id)
+        )).scalars().all()
+        
+        # 多进程部署时各进程各自缓冲流水行,移动流水文件会丢掉其他进程尚未写盘的行,
+        # 只有单进程时才直接使用流水文件
+        journal = None
+        if settings.journal_enabled and not backplane.distributed:
+            journal = journal_writer.get(activity_id)
+        journal_records = None
+        if journal is not None:
+            journal_records = await asyncio.to_thread(ExportService._read_journal, journal, votes, finalize)
+        if journal_records is not None:
+            # 流水每隔 journal_fsync_interval 才写盘,进程崩溃后可能缺少已落库的投票,
+            # 记录数与数据库不一致时改为从数据库导出
+            committed = await ExportService._count_records(db, activity_id)
+            if len(journal_records) != committed:
+                print(f"活动 {activity_id} 的流水文件与数据库记录数不一致({len(journal_records)}/{committed}),从数据库导出")
+                journal_records = None
         
-        # 导出投票记录
-        ExportService._export_vote_records(db, activity_id, records_file)
+        tallies = await ExportService._scan_records(
+            db, activity, votes, job,
+            records_file=records_file, archive_file=archive_file, journal_records=journal_records
+        )
         
         # 导出统计结果
-        ExportService._export_statistics(db, activity_id, stats_file)
+        with open(stats_file, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(ExportService.STATISTICS_HEADER)
+            for vote in votes:
+                writer.writerows(ExportService._statistics_rows(vote.title, tallies[vote.id]))
         
-        return str(records_file), str(stats_file)
+        return str(records_file), str(stats_file), str(archive_file) if archive_file else None
     
     @staticmethod
-    def _export_vote_records(db: Session, activity_id: int, filepath: Path):
-        """导出投票记录"""
-        with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            # 写入表头
-            writer.writerow(['活动名称', '投票标题', '参会人姓名', '参会人部门', '投票内容', '投票时间'])
+    async def _scan_records(
+        db: AsyncSession,
+        activity: Activity,
+        votes: List[Vote],
+        job: Optional[ExportJob] = None,
+        records_file: Optional[Path] = None,
+        archive_file: Optional[Path] = None,
+        journal_records: Optional[List[JournalRecord]] = None
+    ) -> Dict[int, RecordCounter]:
+        """
+        读取一遍投票记录,写出 CSV 记录文件和/或归档
+        
+        Args:
+            journal_records: 从流水文件还原的投票记录,为 None 时从数据库读取
+        
+        Returns:
+            边导出边累计的各投票统计
+        """
+        if journal_records is not None:
+            batches = ExportService._record_batches(journal_records)
+            if job is not None:
+                job.total = len(journal_records)
+        else:
+            batches = ExportService._stream_records(db, activity.id)
+            if job is not None:
+                job.total = await ExportService._count_records(db, activity.id)
+        
+        # 统计结果边读边累计,不再二次扫描投票记录
+        tallies = {
+            vote.id: RecordCounter(
+                vote.id, vote.type, json.loads(vote.options) if vote.options else [],
+                keep_texts=archive_file is not None
+            )
+            for vote in votes
+        }
+        names: Dict[int, str] = {}
+        
+        with ExitStack() as stack:
+            writer = None
+            if records_file is not None:
+                f = stack.enter_context(open(records_file, 'w', newline='', encoding='utf-8-sig'))
+                writer = csv.writer(f)
+                writer.writerow(ExportService.RECORDS_HEADER)
             
-            # 获取活动信息
-            activity = db.query(Activity).filter(Activity.id == activity_id).first()
+            archive = None
+            if archive_file is not None:
+                archive = stack.enter_context(gzip.open(archive_file, 'wt', encoding='utf-8'))
+                ExportService._write_archive_line(archive, {
+                    'type': 'activity',
+                    'activity_id': activity.id,
+                    'name': activity.name,
+                    'theme': activity.theme,
+                    'created_at': activity.created_at.isoformat() if activity.created_at else None,
+                    'exported_at': datetime.now().isoformat()
+                })
+                for vote in votes:
+                    tally = tallies[vote.id]
+                    ExportService._write_archive_line(archive, {
+                        'type': 'vote',
+                        'vote_id': vote.id,
+                        'title': vote.title,
+                        'vote_type': vote.type,
+                        'options': tally.options
+                    })
             
-            # 获取所有投票
-            votes = db.query(Vote).filter(Vote.activity_id == activity_id).all()
+            async for rows in batches:
+                for row in rows:
+                    answer = json.loads(row.answer)
+                    tally = tallies[row.vote_id]
+                    tally.add(row.participant_id, answer)
+                    if writer is not None:
+                        writer.writerow(ExportService._record_row(activity.name, row, answer))
+                    if archive is not None:
+                        names[row.participant_id] = row.name if row.name is not None else '未知'
+                        ExportService._write_archive_line(
+                            archive, ExportService._archive_record(tally.options, row, answer)
+                        )
+                if job is not None:
+                    job.written += len(rows)
             
-            for vote in votes:
-                # 获取该投票的所有记录
-                records = db.query(VoteRecord).filter(VoteRecord.vote_id == vote.id).all()
-                
-                for record in records:
-                    # 获取参会人信息
-                    participant = db.query(Participant).filter(
-                        Participant.id == record.participant_id
-                    ).first()
-                    
-                    # 解析答案
-                    answer = json.loads(record.answer)
-                    answer_text = ExportService._format_answer(vote.type, answer)
-                    
-                    # 写入数据
-                    writer.writerow([
-                        activity.name,
-                        vote.title,
-                        participant.name if participant else '未知',
-                        participant.department if participant and participant.department else '',
-                        answer_text,
-                        record.voted_at.strftime('%Y-%m-%d %H:%M:%S')
-                    ])
-    
-    @staticmethod
-    def _export_statistics(db: Session, activity_id: int, filepath: Path):
-        """导出统计结果"""
-        with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            # 写入表头
-            writer.writerow(['投票标题', '选项', '票数', '百分比'])
+            if archive is not None:
+                for vote in votes:
+                    results = tallies[vote.id].results()
+                    if vote.type == 'text':
+                        results['answers'] = [
+                            {'participant': names.get(answer['participant_id'], '匿名'), 'text': answer['text']}
+                            for answer in results['answers']
+                        ]
+                    ExportService._write_archive_line(archive, {
+                        'type': 'result',
+                        'vote_id': vote.id,
+                        'results': results
+                    })
+        
+        return tallies
+    
+    @staticmethod
+    async def _count_records(db: AsyncSession, activity_id: int) -> int:
+        """活动已落库的投票记录数"""
+        return await db.scalar(
+            select(func.count(VoteRecord.id)).join(Vote, Vote.id == VoteRecord.vote_id).where(
+                Vote.activity_id == activity_id
+            )
+        )
+    
+    @staticmethod
+    async def _record_batches(records: List[JournalRecord]) -> AsyncIterator[List[JournalRecord]]:
+        """把内存中的投票记录分批返回,批次之间让出事件循环"""
+        for start in range(0, len(records), ExportService.EXPORT_CHUNK_SIZE):
+            yield records[start:start + ExportService.EXPORT_CHUNK_SIZE]
+            await asyncio.sleep(0)
+    
+    @staticmethod
+    def _read_journal(journal: ActivityJournal, votes: List[Vote], finalize: bool) -> Optional[List[JournalRecord]]:
+        """
+        从流水文件还原投票记录(在线程中执行)
+        
+        流水记录了每一次提交,同一参会人对同一投票只保留最后一次答案,投票时间取首次提交的时间,
+        与数据库中的投票记录一致;签到行和已删除投票的行被跳过
+        
+        Args:
+            journal: 活动的流水文件
+            votes: 活动的全部投票
+            finalize: 是否结束流水文件(之后开始新的流水文件)
+        
+        Returns:
+            按投票、首次提交顺序排列的投票记录;流水文件缺少投票 ID 等列(旧版本创建)时返回 None
+        """
+        with open(journal.path, newline='', encoding='utf-8-sig') as f:
+            if next(csv.reader(f), None) != ActivityJournal.HEADER:
+                return None
+        
+        # 先取出流水文件的快照,读取期间的新投票继续写入流水文件
+        snapshot = journal.path.with_name(f"{journal.path.stem}_{uuid.uuid4().hex}.export")
+        if finalize:
+            journal.move_to(snapshot)
+        else:
+            journal.copy_to(snapshot)
+        
+        vote_map = {vote.id: vote for vote in votes}
+        records: Dict[Tuple[int, int], JournalRecord] = {}
+        try:
+            with open(snapshot, newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader:
+                    # 跳过签到行,以及进程崩溃时只写了一半的行
+                    if len(row) != len(ActivityJournal.HEADER) or not row[7]:
+                        continue
+                    _, _, _, name, department, _, timestamp, vote_id, participant_id, answer = row
+                    vote = vote_map.get(int(vote_id))
+                    if vote is None:
+                        continue
+                    key = (vote.id, int(participant_id))
+                    previous = records.get(key)
+                    records[key] = JournalRecord(
+                        vote_id=vote.id,
+                        vote_title=vote.title,
+                        vote_type=vote.type,
+                        participant_id=int(participant_id),
+                        name=name,
+                        department=department or None,
+                        answer=answer,
+                        voted_at=previous.voted_at if previous is not None else datetime.strptime(
+                            timestamp, '%Y-%m-%d %H:%M:%S'
+                        )
+                    )
+        finally:
+            snapshot.unlink(missing_ok=True)
+        
+        # 字典保持首次提交的顺序,按投票稳定排序
+        return sorted(records.values(), key=lambda record: record.vote_id)
+    
+    @staticmethod
+    def _archive_record(options: List[str], row, answer: dict) -> dict:
+        """
+        生成一条归档投票记录
+        
+        选项以下标保存(多选为下标列表),评分为整数,时间为 ISO 8601 字符串
+        """
+        if not isinstance(answer, dict):
+            answer = {}
+        selected = answer.get('selected')
+        option_index = None
+        if row.vote_type == 'single' and selected in options:
+            option_index = options.index(selected)
+        elif row.vote_type == 'multiple' and isinstance(selected, list):
+            option_index = [options.index(option) for option in selected if option in options]
+        
+        rating = answer.get('rating') if row.vote_type == 'rating' else None
+        return {
+            'type': 'record',
+            'vote_id': row.vote_id,
+            'participant_id': row.participant_id,
+            'participant': row.name if row.name is not None else '未知',
+            'department': row.department,
+            'option_index': option_index,
+            'rating': rating if isinstance(rating, int) else None,
+            'text': answer.get('text') if row.vote_type == 'text' else None,
+            'voted_at': row.voted_at.isoformat() if row.voted_at else None
+        }
+    
+    @staticmethod
+    def _write_archive_line(archive, data: dict):
+        archive.write(json.dumps(data, ensure_ascii=False))
+        archive.write('\n')
+    
+    @staticmethod
+    def load_archive_results(filename: str) -> Optional[dict]:
+        """
+        读取归档中的活动信息和统计结果(跳过投票记录)
+        
+        Args:
+            filename: 归档文件名
+        
+        Returns:
+            {'activity': ..., 'votes': [...]},文件不存在或不是归档时返回 None
+        """
+        filepath = ExportService._export_file_path(filename)
+        if filepath is None or not filename.endswith(ARCHIVE_SUFFIX):
+            return None
+        
+        activity = None
+        votes: Dict[int, dict] = {}
+        with gzip.open(filepath, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                # 投票记录占归档的绝大部分,不解析
+                if line.startswith('{"type": "record"'):
+                    continue
+                data = json.loads(line)
+                if data['type'] == 'activity':
+                    activity = data
+                elif data['type'] == 'vote':
+                    votes[data['vote_id']] = data
+                elif data['type'] == 'result' and data['vote_id'] in votes:
+                    votes[data['vote_id']]['results'] = data['results']
+        
+        return {'activity': activity, 'votes': list(votes.values())}
+    
+    @staticmethod
+    def _export_paths(export_dir: Path, activity_id: int) -> tuple[Path, Path, Path]:
+        """生成导出文件名,同一秒内多次导出时追加序号避免互相覆盖"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = ''
+        index = 0
+        while True:
+            records_file = export_dir / f"activity_{activity_id}_records_{timestamp}{suffix}.csv"
+            stats_file = export_dir / f"activity_{activity_id}_statistics_{timestamp}{suffix}.csv"
+            archive_file = export_dir / f"activity_{activity_id}_archive_{timestamp}{suffix}{ARCHIVE_SUFFIX}"
+            if not any(path.exists() for path in (records_file, stats_file, archive_file)):
+                # 先占用文件名,导出过程中的其他任务不会选到同一个
+                records_file.touch()
+                return records_file, stats_file, archive_file
+            index += 1
+            suffix = f"_{index}"
+    
+    @staticmethod
+    async def stream_vote_records(activity_id: int) -> AsyncIterator[str]:
+        """
+        以 CSV 文本块的形式流式输出投票记录(用于直接下载进行中的活动)
+        
+        使用独立的数据库会话,响应发送期间保持打开
+        """
+        async with AsyncSessionLocal() as db:
+            activity = await db.get(Activity, activity_id)
+            if not activity:
+                return
             
-            # 获取所有投票
-            votes = db.query(Vote).filter(Vote.activity_id == activity_id).all()
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffer.write('\ufeff')
+            writer.writerow(ExportService.RECORDS_HEADER)
             
-            for vote in votes:
-                records = db.query(VoteRecord).filter(VoteRecord.vote_id == vote.id).all()
-                total_count = len(records)
-                
-                if vote.type in ['single', 'multiple']:
-                    # 单选/多选统计
-                    options = json.loads(vote.options) if vote.options else []
-                    results = {option: 0 for option in options}
-                    
-                    for record in records:
-                        answer = json.loads(record.answer)
-                        if vote.type == 'single':
-                            selected = answer.get('selected')
-                            if selected in results:
-                                results[selected] += 1
-                        else:  # multiple
-                            selected_list = answer.get('selected', [])
-                            for option in selected_list:
-                                if option in results:
-                                    results[option] += 1
-                    
-                    # 写入数据
-                    for option, count in results.items():
-                        percentage = f"{count / total_count * 100:.1f}%" if total_count > 0 else "0%"
-                        writer.writerow([vote.title, option, count, percentage])
-                
-                elif vote.type == 'rating':
-                    # 评分统计
-                    ratings = [0] * 5
-                    for record in records:
-                        answer = json.loads(record.answer)
-                        rating = answer.get('rating', 0)
-                        if 1 <= rating <= 5:
-                            ratings[rating - 1] += 1
-                    
-                    for i, count in enumerate(ratings):
-                        percentage = f"{count / total_count * 100:.1f}%" if total_count > 0 else "0%"
-                        writer.writerow([vote.title, f"{i + 1}星", count, percentage])
-                    
-                    # 计算平均分
-                    total_rating = sum((i + 1) * count for i, count in enumerate(ratings))
-                    avg_rating = total_rating / total_count if total_count > 0 else 0
-                    writer.writerow([vote.title, "平均分", f"{avg_rating:.2f}", ""])
-                
-                elif vote.type == 'text':
-                    # 问答题统计
-                    writer.writerow([vote.title, f"共{total_count}条回答", total_count, "100%"])
-    
-    @staticmethod
-    def _format_answer(vote_type: str, answer: dict) -> str:
-        """格式化答案为字符串"""
+            async for rows in ExportService._stream_records(db, activity_id):
+                for row in rows:
+                    writer.writerow(ExportService._record_row(activity.name, row, json.loads(row.answer)))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            
+            if buffer.tell():
+                yield buffer.getvalue()
+    
+    @staticmethod
+    async def _stream_records(db: AsyncSession, activity_id: int) -> AsyncIterator[list]:
+        """
+        一条联表查询读取活动的全部投票记录,分批返回
+        
+        Yields:
+            每批记录行(vote_id, vote_title, vote_type, participant_id, name, department, answer, voted_at)
+        """
+        stmt = (
+            select(
+                VoteRecord.vote_id,
+                Vote.title.label('vote_title'),
+                Vote.type.label('vote_type'),
+                VoteRecord.participant_id,
+                Participant.name,
+                Participant.department,
+                VoteRecord.answer,
+                VoteRecord.voted_at
+            )
+            .join(Vote, Vote.id == VoteRecord.vote_id)
+            .outerjoin(Participant, Participant.id == VoteRecord.participant_id)
+            .where(Vote.activity_id == activity_id)
+            .order_by(Vote.id, VoteRecord.id)
+            .execution_options(yield_per=ExportService.EXPORT_CHUNK_SIZE)
+        )
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield rows
+    
+    @staticmethod
+    def _record_row(activity_name: str, row, answer: dict) -> list:
+        """生成一行投票记录"""
+        return [
+            activity_name,
+            row.vote_title,
+            row.name if row.name is not None else '未知',
+            row.department or '',
+            ExportService.format_answer(row.vote_type, answer),
+            row.voted_at.strftime('%Y-%m-%d %H:%M:%S')
+        ]
+    
+    @staticmethod
+    def _statistics_rows(title: str, tally: RecordCounter) -> List[list]:
+        """根据计数器生成一个投票的统计行"""
+        results = tally.results()
+        rows = []
+        
+        if tally.type in ['single', 'multiple']:
+            # 单选/多选统计
+            for item in results['results']:
+                rows.append([title, item['option'], item['count'], item['percentage']])
+        
+        elif tally.type == 'rating':
+            # 评分统计
+            for item in results['results']:
+                rows.append([title, item['option'], item['count'], item['percentage']])
+            rows.append([title, "平均分", f"{results['average']:.2f}", ""])
+        
+        elif tally.type == 'text':
+            # 问答题统计
+            total_count = results['total_count']
+            rows.append([title, f"共{total_count}条回答", total_count, "100%"])
+        
+        return rows
+    
+    @staticmethod
+    def format_answer(vote_type: str, answer: dict) -> str:
+        """格式化答案为字符串(格式不符的答案不会抛出异常)"""
+        if not isinstance(answer, dict):
+            answer = {}
         if vote_type == 'single':
-            return answer.get('selected', '')
+            selected = answer.get('selected')
+            return '' if selected is None else str(selected)
         elif vote_type == 'multiple':
-            selected = answer.get('selected', [])
-            return ', '.join(selected)
+            selected = answer.get('selected')
+            if not isinstance(selected, list):
+                return ''
+            return ', '.join(str(option) for option in selected)
         elif vote_type == 'text':
-            return answer.get('text', '')
+            text = answer.get('text')
+            return '' if text is None else str(text)
         elif vote_type == 'rating':
             return f"{answer.get('rating', 0)}星"
         return ''
     
+    @staticmethod
+    def _is_export_file(filename: str) -> bool:
+        """是否为导出文件(CSV 或归档)"""
+        return filename.endswith('.csv') or filename.endswith(ARCHIVE_SUFFIX)
+    
+    @staticmethod
+    def _export_file_path(filename: str) -> Optional[Path]:
+        """
+        校验导出文件名并返回文件路径
+        
+        Returns:
+            文件路径,文件名不合法或文件不存在时返回 None
+        """
+        # 安全性验证：防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return None
+        
+        filepath = EXPORT_DIR / filename
+        
+        # 确保文件存在且是导出文件
+        if not filepath.exists() or not ExportService._is_export_file(filename):
+            return None
+        
+        # 确保文件在导出目录内
+        if not filepath.resolve().parent == EXPORT_DIR.resolve():
+            return None
+        
+        return filepath
+    
+    @staticmethod
+    def get_export_file(filename: str) -> Optional[Path]:
+        """获取导出文件路径(用于下载)"""
+        return ExportService._export_file_path(filename)
+    
     @staticmethod
     def list_export_files() -> list:
-        """列出所有导出的 CSV 文件"""
-        export_dir = Path("data/exports")
-        if not export_dir.exists():
+        """列出所有导出文件(CSV 和归档)"""
+        if not EXPORT_DIR.exists():
             return []
         
         files = []
-        for file in export_dir.glob("*.csv"):
+        for file in EXPORT_DIR.iterdir():
+            if not file.is_file() or not ExportService._is_export_file(file.name):
+                continue
             files.append({
                 'filename': file.name,
+                'format': 'archive' if file.name.endswith(ARCHIVE_SUFFIX) else 'csv',
+                'size': file.stat().st_size,
                 'created_at': datetime.fromtimestamp(file.stat().st_mtime).isoformat()
             })
         
@@ -184,19 +665,8 @@ class ExportService:
         Returns:
             是否删除成功
         """
-        # 安全性验证：防止路径遍历攻击
-        if '..' in filename or '/' in filename or '\\' in filename:
-            return False
-        
-        export_dir = Path("data/exports")
-        filepath = export_dir / filename
-        
-        # 确保文件存在且是 CSV 文件
-        if not filepath.exists() or filepath.suffix != '.csv':
-            return False
-        
-        # 确保文件在导出目录内
-        if not filepath.resolve().parent == export_dir.resolve():
+        filepath = ExportService._export_file_path(filename)
+        if filepath is None:
             return False
         
         try:
@@ -204,3 +674,119 @@ class ExportService:
             return True
         except Exception:
             return False
+
+class ExportJobManager:
+    """
+    后台导出任务管理,导出在独立的数据库会话中进行,不阻塞请求
+    
+    任务状态同时发布到消息总线的共享状态中,多进程时查询请求落到其他进程也能看到进度
+    """
+    
+    # 保留的已结束任务数
+    MAX_FINISHED_JOBS = 50
+    # 共享状态中的键前缀
+    STATE_PREFIX = 'export_job:'
+    # 共享状态的保留时间(秒)
+    STATE_TTL = 24 * 3600
+    # 导出进行中发布进度的间隔(秒)
+    PUBLISH_INTERVAL = 1.0
+    
+    def __init__(self):
+        self._jobs: Dict[str, ExportJob] = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def start(
+        self,
+        activity_id: int,
+        on_done: Optional[Callable[[AsyncSession, ExportJob], Awaitable[None]]] = None,
+        finalize: bool = False
+    ) -> ExportJob:
+        """
+        启动导出任务
+        
+        Args:
+            activity_id: 活动 ID
+            on_done: 导出成功后在同一会话中执行的回调(如重置活动数据)
+            finalize: 是否结束活动的流水文件
+        
+        Returns:
+            导出任务
+        """
+        job = ExportJob(activity_id)
+        self._jobs[job.id] = job
+        self._prune()
+        self._publish(job)
+        
+        task = asyncio.get_running_loop().create_task(self._run(job, on_done, finalize))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+    
+    def get(self, job_id: str) -> Optional[dict]:
+        """获取导出任务状态(包括其他进程启动的任务)"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return backplane.get_state(self.STATE_PREFIX + job_id)
+    
+    def list_jobs(self) -> List[dict]:
+        """所有导出任务的状态(最新的在前)"""
+        jobs = {
+            status['job_id']: status
+            for status in backplane.get_states(self.STATE_PREFIX).values()
+        }
+        for job in self._jobs.values():
+            jobs[job.id] = job.to_dict()
+        return sorted(jobs.values(), key=lambda status: status['created_at'], reverse=True)
+    
+    def _publish(self, job: ExportJob):
+        """发布任务状态到共享状态"""
+        backplane.set_state(self.STATE_PREFIX + job.id, job.to_dict(), ttl=self.STATE_TTL)
+    
+    async def _publish_progress(self, job: ExportJob):
+        """导出进行中定期发布进度"""
+        while True:
+            await asyncio.sleep(self.PUBLISH_INTERVAL)
+            self._publish(job)
+    
+    async def _run(self, job: ExportJob, on_done, finalize: bool):
+        job.status = 'running'
+        self._publish(job)
+        reporter = asyncio.create_task(self._publish_progress(job))
+        try:
+            async with audit_queries(f"导出任务 {job.id}"), AsyncSessionLocal() as db:
+                started = time.perf_counter()
+                try:
+                    records_file, stats_file, archive_file = await ExportService.export_activity_data(
+                        db, job.activity_id, job, finalize=finalize
+                    )
+                except Exception:
+                    export_duration.observe(time.perf_counter() - started, 'failed')
+                    raise
+                export_duration.observe(time.perf_counter() - started, 'done')
+                job.files = {'records': records_file, 'statistics': stats_file, 'archive': archive_file}
+                if on_done is not None:
+                    await on_done(db, job)
+            job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            print(f"导出任务 {job.id} 失败: {e}")
+        finally:
+            reporter.cancel()
+            self._publish(job)
+    
+    async def join(self):
+        """等待进行中的导出任务完成(服务关闭时调用)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    def _prune(self):
+        """丢弃最早的已结束任务"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            backplane.set_state(self.STATE_PREFIX + job_id, None)
+
+# 全局导出任务管理
+export_jobs = ExportJobManager()
@@ -0,0 +1,36 @@
+"""
+写入管道 - 高并发写请求的组提交队列
+"""
+from typing import List, Optional, Tuple
+from backend.config import settings
+from backend.database import AsyncSessionLocal
+from backend.services.batching import GroupCommitQueue
+from backend.services.vote import VoteService
+from backend.services.participant import ParticipantService
+
+async def _write_votes(submissions: List[Tuple[int, int, dict]]) -> List[int]:
+    """批量写入投票,返回记录 ID"""
+    async with AsyncSessionLocal() as db:
+        return await VoteService.submit_votes(db, submissions)
+
+async def _write_signins(signins: List[Tuple[int, str, Optional[str], str]]) -> List[str]:
+    """批量写入签到,返回 session_id"""
+    async with AsyncSessionLocal() as db:
+        participants = await ParticipantService.create_participants(db, signins)
+        return [participant.session_id for participant in participants]
+
+# 投票提交队列: 每批在一个事务中写入
+vote_queue = GroupCommitQueue(
+    _write_votes,
+    interval=settings.vote_batch_interval_ms / 1000,
+    max_batch=settings.vote_batch_size,
+    name='vote'
+)
+
+# 签到提交队列
+signin_queue = GroupCommitQueue(
+    _write_signins,
+    interval=settings.signin_batch_interval_ms / 1000,
+    max_batch=settings.signin_batch_size,
+    name='signin'
+)
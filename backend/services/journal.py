@@ -0,0 +1,187 @@
+"""
+活动流水日志 - 签到和投票的只追加记录
+
+每次签到、投票落库后追加一行到活动的流水文件(CSV),写入先进入内存缓冲,
+由后台任务按 journal_fsync_interval 定期写盘并 fsync。单进程部署时导出直接由流水文件
+还原投票记录(多进程时各进程的缓冲不同步,导出改为读数据库),重置活动数据也不会删除它
+"""
+from backend.config import settings
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+import asyncio
+import csv
+import io
+import os
+import shutil
+import threading
+
+JOURNAL_DIR = Path("data/journal")
+
+class ActivityJournal:
+    """单个活动的流水文件"""
+    
+    # 最后三列用于导出时从流水还原投票记录
+    HEADER = ['事件', '活动名称', '投票标题', '参会人姓名', '参会人部门', '投票内容', '时间', '投票ID', '参会人ID', '答案']
+    
+    def __init__(self, activity_id: int, activity_name: str, path: Path):
+        self.activity_id = activity_id
+        self.activity_name = activity_name
+        self.path = path
+        self._pending: List[list] = []
+        self._lock = threading.Lock()
+    
+    def append(
+        self,
+        event: str,
+        vote_title: str,
+        name: str,
+        department: Optional[str],
+        answer: str,
+        vote_id: Optional[int] = None,
+        participant_id: Optional[int] = None,
+        answer_json: str = ''
+    ):
+        """追加一行(先写入缓冲)"""
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        row = [
+            event, self.activity_name, vote_title, name, department or '', answer, timestamp,
+            vote_id if vote_id is not None else '',
+            participant_id if participant_id is not None else '',
+            answer_json
+        ]
+        with self._lock:
+            self._pending.append(row)
+    
+    def flush(self):
+        """把缓冲写入文件并 fsync"""
+        with self._lock:
+            self._write_pending()
+    
+    def _write_pending(self):
+        if not self._pending:
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(self._pending)
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+    
+    def create(self):
+        """新建流水文件(覆盖同名旧文件)"""
+        with self._lock:
+            self._pending = []
+            with open(self.path, 'w', newline='', encoding='utf-8-sig') as f:
+                csv.writer(f).writerow(self.HEADER)
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def move_to(self, target: Path):
+        """写完缓冲后把流水文件移动到 target,并开始新的流水文件"""
+        with self._lock:
+            self._write_pending()
+            os.replace(self.path, target)
+        self.create()
+    
+    def copy_to(self, target: Path):
+        """写完缓冲后把流水文件复制到 target"""
+        with self._lock:
+            self._write_pending()
+            shutil.copyfile(self.path, target)
+
+class JournalWriter:
+    """流水日志管理"""
+    
+    def __init__(self, directory: Path = JOURNAL_DIR):
+        self.directory = directory
+        self._journals: Dict[int, ActivityJournal] = {}
+        self._lock = threading.Lock()
+    
+    def _path(self, activity_id: int) -> Path:
+        return self.directory / f"activity_{activity_id}.csv"
+    
+    def _meta_path(self, activity_id: int) -> Path:
+        return self.directory / f"activity_{activity_id}.name"
+    
+    def create(self, activity_id: int, activity_name: str):
+        """为新活动创建流水文件(创建活动时调用)"""
+        if not settings.journal_enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._meta_path(activity_id).write_text(activity_name, encoding='utf-8')
+        journal = ActivityJournal(activity_id, activity_name, self._path(activity_id))
+        journal.create()
+        with self._lock:
+            self._journals[activity_id] = journal
+    
+    def get(self, activity_id: int) -> Optional[ActivityJournal]:
+        """
+        获取活动的流水文件
+        
+        只有随活动一起创建的流水文件才是完整的;启用流水日志之前创建的活动返回 None
+        """
+        with self._lock:
+            journal = self._journals.get(activity_id)
+            if journal is not None:
+                return journal
+            
+            path = self._path(activity_id)
+            meta_path = self._meta_path(activity_id)
+            if not path.exists() or not meta_path.exists():
+                return None
+            journal = ActivityJournal(activity_id, meta_path.read_text(encoding='utf-8'), path)
+            self._journals[activity_id] = journal
+            return journal
+    
+    def record(
+        self,
+        activity_id: int,
+        event: str,
+        vote_title: str,
+        name: str,
+        department: Optional[str],
+        answer: str,
+        vote_id: Optional[int] = None,
+        participant_id: Optional[int] = None,
+        answer_json: str = ''
+    ):
+        """
+        追加一行流水(活动没有流水文件时忽略)
+        
+        Args:
+            answer: 格式化后的投票内容
+            vote_id: 投票 ID(签到为空)
+            participant_id: 参会人 ID
+            answer_json: 原始答案 JSON(签到为空)
+        """
+        if not settings.journal_enabled:
+            return
+        journal = self.get(activity_id)
+        if journal is not None:
+            journal.append(event, vote_title, name, department, answer, vote_id, participant_id, answer_json)
+    
+    def flush_all(self):
+        """所有流水文件写盘"""
+        with self._lock:
+            journals = list(self._journals.values())
+        for journal in journals:
+            try:
+                journal.flush()
+            except OSError as e:
+                print(f"写入流水日志失败 ({journal.path}): {e}")
+    
+    async def run(self, interval: float):
+        """后台任务: 定期写盘"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush_all)
+    
+    def clear(self):
+        """丢弃所有流水文件句柄"""
+        with self._lock:
+            self._journals.clear()
+
+# 全局流水日志
+journal_writer = JournalWriter()
@@ -0,0 +1,123 @@
+"""
+问答题关键词统计
+
+回答提交时增量分词并计数。计数使用 Space-Saving 算法,只保留固定数量的候选词,
+内存占用和每条回答的处理开销不随回答数增长
+"""
+from typing import Dict, List, Set, Tuple
+import heapq
+import re
+
+# 中文字符(含扩展 A 区)
+_CJK_RUN = re.compile(r'[㐀-䶿一-鿿]+')
+# 英文单词和数字
+_WORD = re.compile(r'[a-z0-9]+')
+
+# 虚词、代词等常见字,包含这些字的二元组不计入关键词
+STOP_CHARS = set('的了是我你他她它们很也都和与及在有就不这那个之其吧吗呢啊呀哦着过把被让给对为以于而且或但还又更最太真非常')
+
+# 按虚词断开中文片段
+_STOP_SPLIT = re.compile('[' + ''.join(sorted(STOP_CHARS)) + ']+')
+
+# 英文停用词
+STOP_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'is', 'are', 'was', 'were', 'be', 'to', 'of',
+    'in', 'on', 'at', 'for', 'with', 'it', 'this', 'that', 'i', 'we', 'you', 'my', 'our',
+    'so', 'very', 'not', 'no', 'yes'
+}
+
+def tokenize(text: str) -> Set[str]:
+    """
+    提取回答中的关键词
+    
+    中文先在虚词处断开,再把每段从头按两字一组切分(二元组互不重叠,
+    避免"今天开会"切出跨词的"天开");英文按单词切分;同一回答中重复的词只计一次
+    
+    Args:
+        text: 回答内容
+    
+    Returns:
+        关键词集合
+    """
+    text = text.lower()
+    tokens = set()
+    
+    for run in _CJK_RUN.findall(text):
+        for segment in _STOP_SPLIT.split(run):
+            for i in range(0, len(segment) - 1, 2):
+                tokens.add(segment[i:i + 2])
+    
+    for word in _WORD.findall(text):
+        if len(word) > 1 and word not in STOP_WORDS:
+            tokens.add(word)
+    
+    return tokens
+
+class KeywordCounter:
+    """
+    Space-Saving 近似 top-k 计数器
+    
+    最多跟踪 capacity 个词;计数器满时新词替换当前计数最小的词,并继承其计数
+    (error 记录继承的部分)。计数最小的词用惰性删除的小根堆查找
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # 词 -> [计数, 误差上界]
+        self._counts: Dict[str, List[int]] = {}
+        # (计数, 词),可能包含过期条目
+        self._heap: List[Tuple[int, str]] = []
+    
+    def add(self, tokens: Set[str]):
+        """记录一条回答中的关键词"""
+        for token in tokens:
+            entry = self._counts.get(token)
+            if entry is not None:
+                entry[0] += 1
+            elif len(self._counts) < self.capacity:
+                entry = self._counts[token] = [1, 0]
+            else:
+                floor = self._pop_min()
+                entry = self._counts[token] = [floor + 1, floor]
+            heapq.heappush(self._heap, (entry[0], token))
+        self._compact()
+    
+    def remove(self, tokens: Set[str]):
+        """撤销一条回答中的关键词(改票时)"""
+        for token in tokens:
+            entry = self._counts.get(token)
+            if entry is not None and entry[0] > 0:
+                entry[0] -= 1
+                heapq.heappush(self._heap, (entry[0], token))
+        self._compact()
+    
+    def _pop_min(self) -> int:
+        """移除计数最小的词,返回其计数"""
+        while True:
+            count, token = heapq.heappop(self._heap)
+            entry = self._counts.get(token)
+            if entry is not None and entry[0] == count:
+                del self._counts[token]
+                return count
+    
+    def _compact(self):
+        """过期条目过多时重建堆"""
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(entry[0], token) for token, entry in self._counts.items()]
+            heapq.heapify(self._heap)
+    
+    def top(self, n: int) -> List[dict]:
+        """
+        出现次数最多的 n 个词
+        
+        按确定的次数(计数减去继承的误差)排序,避免刚替换进来的偶发词排在前面
+        
+        Returns:
+            [{'word': 词, 'count': 次数}, ...],按次数降序
+        """
+        items = heapq.nlargest(n, self._counts.items(), key=lambda item: item[1][0] - item[1][1])
+        return [
+            {'word': token, 'count': entry[0] - entry[1]}
+            for token, entry in items
+            if entry[0] - entry[1] > 0
+        ]
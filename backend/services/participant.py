@@ -1,64 +1,213 @@
 """
 参会人管理服务
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.models import Participant
-from typing import Optional
+from backend.config import settings
+from backend.utils.cache import TTLCache
+from backend.services.journal import journal_writer
+from backend.services.backplane import backplane
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import time
 import uuid
 
+class SessionParticipant(NamedTuple):
+    """缓存中的参会人信息(请求鉴权使用)"""
+    id: int
+    activity_id: int
+    name: str
+    department: Optional[str]
+    role: str
+    session_id: str
+    signed_in_at: datetime
+
+# session_id -> SessionParticipant 缓存,鉴权时免去数据库查询
+session_cache = TTLCache(maxsize=settings.session_cache_size, ttl=settings.session_cache_ttl)
+
+class ParticipantCounter:
+    """
+    签到人数计数器
+    
+    签到人数保存在内存中,签到时直接累加;超过 participant_count_reconcile_s 秒
+    未与数据库核对的计数会在下次读取时重新 COUNT 一次
+    """
+    
+    def __init__(self):
+        # activity_id -> (人数, 最近一次核对时间)
+        self._counts: Dict[int, Tuple[int, float]] = {}
+    
+    def _fresh(self, activity_id: int) -> bool:
+        entry = self._counts.get(activity_id)
+        return entry is not None and time.monotonic() - entry[1] < settings.participant_count_reconcile_s
+    
+    async def reconcile(self, db: AsyncSession, activity_id: int) -> int:
+        """从数据库重新统计签到人数"""
+        count = await db.scalar(
+            select(func.count(Participant.id)).where(Participant.activity_id == activity_id)
+        )
+        self._counts[activity_id] = (count, time.monotonic())
+        return count
+    
+    async def get(self, db: AsyncSession, activity_id: int) -> int:
+        """获取签到人数"""
+        if self._fresh(activity_id):
+            return self._counts[activity_id][0]
+        return await self.reconcile(db, activity_id)
+    
+    def peek(self, activity_id: int) -> Optional[int]:
+        """获取内存中的签到人数(不访问数据库)"""
+        entry = self._counts.get(activity_id)
+        return entry[0] if entry else None
+    
+    async def add(self, db: AsyncSession, activity_id: int, count: int):
+        """累加已落库的签到人数"""
+        if self._fresh(activity_id):
+            value, checked_at = self._counts[activity_id]
+            self._counts[activity_id] = (value + count, checked_at)
+        else:
+            # 未加载或已过期,直接从数据库统计(已包含本次签到)
+            await self.reconcile(db, activity_id)
+    
+    def merge(self, activity_id: int, count: int):
+        """
+        合并其他进程的签到人数
+        
+        签到人数只增不减(重置活动时整体丢弃),乱序到达的旧人数不会覆盖新人数
+        """
+        entry = self._counts.get(activity_id)
+        if entry is None or not self._fresh(activity_id) or count > entry[0]:
+            self._counts[activity_id] = (count, time.monotonic())
+    
+    def reset(self, activity_id: int):
+        """丢弃活动的计数(重置活动数据时)"""
+        self._counts.pop(activity_id, None)
+
+# 全局签到人数计数器
+participant_counter = ParticipantCounter()
+
+# 其他进程的签到
+backplane.on('participants', lambda data: participant_counter.merge(data['activity_id'], data['count']))
+
 class ParticipantService:
     """参会人管理服务"""
     
     @staticmethod
-    def create_participant(
-        db: Session,
+    async def create_participant(
+        db: AsyncSession,
         activity_id: int,
         name: str,
         department: Optional[str],
         role: str
     ) -> Participant:
         """创建参会人(签到)"""
-        session_id = str(uuid.uuid4())
-        
-        participant = Participant(
-            activity_id=activity_id,
-            name=name,
-            department=department,
-            role=role,
-            session_id=session_id
+        participants = await ParticipantService.create_participants(
+            db, [(activity_id, name, department, role)]
         )
-        db.add(participant)
-        db.commit()
-        db.refresh(participant)
-        return participant
+        return participants[0]
+    
+    @staticmethod
+    async def create_participants(
+        db: AsyncSession,
+        signins: List[Tuple[int, str, Optional[str], str]]
+    ) -> List[Participant]:
+        """
+        批量创建参会人(一个事务)
+        
+        Args:
+            db: 数据库会话
+            signins: [(activity_id, name, department, role), ...]
+        
+        Returns:
+            与 signins 一一对应的参会人
+        """
+        participants = [
+            Participant(
+                activity_id=activity_id,
+                name=name,
+                department=department,
+                role=role,
+                session_id=str(uuid.uuid4())
+            )
+            for activity_id, name, department, role in signins
+        ]
+        db.add_all(participants)
+        await db.commit()
+        
+        # 新 session 不应命中旧的缓存
+        for participant in participants:
+            session_cache.pop(participant.session_id)
+            journal_writer.record(
+                participant.activity_id,
+                '主持人签到' if participant.role == 'host' else '签到',
+                '',
+                participant.name,
+                participant.department,
+                '',
+                participant_id=participant.id
+            )
+        
+        # 更新内存中的签到人数
+        added: Dict[int, int] = {}
+        for participant in participants:
+            added[participant.activity_id] = added.get(participant.activity_id, 0) + 1
+        for activity_id, count in added.items():
+            await participant_counter.add(db, activity_id, count)
+            backplane.publish('participants', {
+                'activity_id': activity_id,
+                'count': participant_counter.peek(activity_id)
+            })
+        
+        return participants
     
     @staticmethod
-    def get_participant_by_session(db: Session, session_id: str) -> Optional[Participant]:
-        """通过 session_id 获取参会人"""
-        return db.query(Participant).filter(
-            Participant.session_id == session_id
-        ).first()
+    async def get_participant_by_session(db: AsyncSession, session_id: str) -> Optional[SessionParticipant]:
+        """通过 session_id 获取参会人(优先读缓存)"""
+        cached = session_cache.get(session_id)
+        if cached is not None:
+            return cached
+        
+        participant = await db.scalar(
+            select(Participant).where(Participant.session_id == session_id).limit(1)
+        )
+        if not participant:
+            return None
+        
+        cached = SessionParticipant(
+            id=participant.id,
+            activity_id=participant.activity_id,
+            name=participant.name,
+            department=participant.department,
+            role=participant.role,
+            session_id=participant.session_id,
+            signed_in_at=participant.signed_in_at
+        )
+        session_cache.set(session_id, cached)
+        return cached
     
     @staticmethod
-    def check_duplicate_signin(db: Session, activity_id: int, session_id: str) -> bool:
+    async def check_duplicate_signin(db: AsyncSession, activity_id: int, session_id: str) -> bool:
         """检查是否重复签到"""
-        existing = db.query(Participant).filter(
-            Participant.activity_id == activity_id,
-            Participant.session_id == session_id
-        ).first()
+        existing = await db.scalar(
+            select(Participant.id).where(
+                Participant.activity_id == activity_id,
+                Participant.session_id == session_id
+            ).limit(1)
+        )
         return existing is not None
     
     @staticmethod
-    def get_participants_count(db: Session, activity_id: int) -> int:
-        """获取签到人数"""
-        return db.query(Participant).filter(
-            Participant.activity_id == activity_id
-        ).count()
+    async def get_participants_count(db: AsyncSession, activity_id: int) -> int:
+        """获取签到人数(内存计数,定期与数据库核对)"""
+        return await participant_counter.get(db, activity_id)
     
     @staticmethod
-    def get_host(db: Session, activity_id: int) -> Optional[Participant]:
+    async def get_host(db: AsyncSession, activity_id: int) -> Optional[Participant]:
         """获取主持人"""
-        return db.query(Participant).filter(
-            Participant.activity_id == activity_id,
-            Participant.role == 'host'
-        ).first()
+        return await db.scalar(
+            select(Participant).where(
+                Participant.activity_id == activity_id,
+                Participant.role == 'host'
+            ).limit(1)
+        )
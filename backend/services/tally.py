@@ -0,0 +1,285 @@
+"""
+投票实时计票引擎
+
+每次提交投票时增量更新计数器,读取结果只需遍历选项,无需重新扫描全部投票记录
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.models import Activity, Vote, VoteRecord
+from backend.config import settings
+from backend.services.keywords import KeywordCounter, tokenize
+from backend.services.clustering import AnswerClusterer
+from typing import Dict, List, Optional
+import threading
+import json
+
+class VoteTally:
+    """单个投票的计数器"""
+    
+    def __init__(self, vote_id: int, activity_id: int, vote_type: str, options: List[str]):
+        self.vote_id = vote_id
+        self.activity_id = activity_id
+        self.type = vote_type
+        self.options = options
+        # 单选/多选: 选项 -> 票数
+        self.counts: Dict[str, int] = {option: 0 for option in options}
+        # 评分: 1-5 分的直方图
+        self.ratings = [0] * 5
+        # 问答: participant_id -> 回答内容(保持提交顺序)
+        self.texts: Dict[int, str] = {}
+        # 问答: 关键词计数
+        self.keywords = KeywordCounter(settings.keyword_capacity) if vote_type == 'text' else None
+        # 问答: 相似回答聚类
+        self.clusters = AnswerClusterer(settings.cluster_threshold) if vote_type == 'text' else None
+        # 每个参会人当前生效的答案,用于处理改票
+        self.answers: Dict[int, dict] = {}
+    
+    @property
+    def total_count(self) -> int:
+        """参与人数"""
+        return len(self.answers)
+    
+    def apply(self, participant_id: int, answer: dict):
+        """
+        记录一次投票(重复提交视为改票)
+        
+        Args:
+            participant_id: 参会人 ID
+            answer: 答案字典
+        """
+        if not isinstance(answer, dict):
+            answer = {}
+        previous = self.answers.get(participant_id)
+        if previous is not None:
+            self._count(participant_id, previous, -1)
+        self.answers[participant_id] = answer
+        self._count(participant_id, answer, 1)
+    
+    def _count(self, participant_id: int, answer: dict, delta: int):
+        """按答案增减计数器"""
+        if self.type == 'single':
+            selected = answer.get('selected')
+            if isinstance(selected, str) and selected in self.counts:
+                self.counts[selected] += delta
+        elif self.type == 'multiple':
+            selected = answer.get('selected')
+            for option in selected if isinstance(selected, list) else []:
+                if isinstance(option, str) and option in self.counts:
+                    self.counts[option] += delta
+        elif self.type == 'rating':
+            rating = answer.get('rating', 0)
+            if isinstance(rating, int) and 1 <= rating <= 5:
+                self.ratings[rating - 1] += delta
+        elif self.type == 'text':
+            text = answer.get('text', '')
+            if not isinstance(text, str):
+                text = ''
+            if delta > 0:
+                # 改票时原地替换,保持回答的原始顺序
+                self.texts[participant_id] = text
+                self.keywords.add(tokenize(text))
+                self.clusters.add(participant_id, text)
+            else:
+                self.keywords.remove(tokenize(text))
+                self.clusters.remove(participant_id)
+    
+    def top_keywords(self) -> List[dict]:
+        """问答题出现最多的关键词(词云数据)"""
+        if self.keywords is None:
+            return []
+        return self.keywords.top(settings.keyword_top_n)
+    
+    def top_clusters(self) -> List[dict]:
+        """问答题人数最多的相似回答簇"""
+        if self.clusters is None:
+            return []
+        return self.clusters.top(settings.cluster_top_n)
+    
+    def counters(self) -> Dict[str, int]:
+        """当前计数器快照,用于投票进度推送"""
+        if self.type in ['single', 'multiple']:
+            return dict(self.counts)
+        elif self.type == 'rating':
+            return {f"{i + 1}星": count for i, count in enumerate(self.ratings)}
+        return {}
+    
+    def results(self) -> dict:
+        """生成结果统计(问答题包含全部回答,用于导出)"""
+        total_count = self.total_count
+        
+        if self.type in ['single', 'multiple']:
+            result_list = []
+            for option, count in self.counts.items():
+                percentage = f"{count / total_count * 100:.1f}%" if total_count > 0 else "0%"
+                result_list.append({
+                    'option': option,
+                    'count': count,
+                    'percentage': percentage
+                })
+            
+            return {
+                'vote_id': self.vote_id,
+                'type': self.type,
+                'results': result_list
+            }
+        
+        elif self.type == 'rating':
+            result_list = []
+            for i, count in enumerate(self.ratings):
+                percentage = f"{count / total_count * 100:.1f}%" if total_count > 0 else "0%"
+                result_list.append({
+                    'option': f"{i + 1}星",
+                    'count': count,
+                    'percentage': percentage
+                })
+            
+            total_rating = sum((i + 1) * count for i, count in enumerate(self.ratings))
+            avg_rating = total_rating / total_count if total_count > 0 else 0
+            
+            return {
+                'vote_id': self.vote_id,
+                'type': self.type,
+                'results': result_list,
+                'average': round(avg_rating, 2)
+            }
+        
+        elif self.type == 'text':
+            # 问答题返回 participant_id,由调用方补充姓名
+            return {
+                'vote_id': self.vote_id,
+                'type': self.type,
+                'total_count': total_count,
+                'keywords': self.top_keywords(),
+                'clusters': self.top_clusters(),
+                'answers': [
+                    {'participant_id': participant_id, 'text': text}
+                    for participant_id, text in self.texts.items()
+                ]
+            }
+        
+        return {}
+
+class TallyEngine:
+    """计票引擎,缓存所有已加载投票的计数器"""
+    
+    def __init__(self):
+        self._tallies: Dict[int, VoteTally] = {}
+        # 加载中的投票 -> 加载期间其他进程提交的投票,加载完成后补记
+        self._loading: Dict[int, List[tuple]] = {}
+        self._lock = threading.RLock()
+    
+    @staticmethod
+    def _new_tally(vote: Vote) -> VoteTally:
+        options = json.loads(vote.options) if vote.options else []
+        return VoteTally(vote.id, vote.activity_id, vote.type, options)
+    
+    async def _load(self, db: AsyncSession, votes: List[Vote]):
+        """从数据库加载指定投票的全部记录"""
+        tallies = {vote.id: self._new_tally(vote) for vote in votes}
+        with self._lock:
+            for vote_id in tallies:
+                if vote_id not in self._tallies:
+                    self._loading.setdefault(vote_id, [])
+        try:
+            if tallies:
+                records = await db.execute(
+                    select(VoteRecord.vote_id, VoteRecord.participant_id, VoteRecord.answer)
+                    .where(VoteRecord.vote_id.in_(list(tallies.keys())))
+                    .order_by(VoteRecord.id)
+                )
+                
+                for vote_id, participant_id, answer in records:
+                    tallies[vote_id].apply(participant_id, json.loads(answer))
+        finally:
+            with self._lock:
+                pending = {vote_id: self._loading.pop(vote_id, None) for vote_id in tallies}
+        
+        with self._lock:
+            # 并发加载时保留先加载完成的计数器,之后的投票都会记到它上面
+            for vote_id, tally in tallies.items():
+                if vote_id in self._tallies:
+                    continue
+                # 补记加载期间其他进程提交的投票(改票覆盖,重复记录不影响结果)
+                for participant_id, answer in pending[vote_id] or ():
+                    tally.apply(participant_id, answer)
+                self._tallies[vote_id] = tally
+    
+    async def rebuild(self, db: AsyncSession):
+        """从数据库重建当前活动的计数器(启动时调用)"""
+        with self._lock:
+            self._tallies.clear()
+        
+        activity = await db.scalar(select(Activity).order_by(Activity.id.desc()).limit(1))
+        if not activity:
+            return
+        
+        votes = (await db.execute(
+            select(Vote).where(Vote.activity_id == activity.id)
+        )).scalars().all()
+        await self._load(db, votes)
+    
+    async def get(self, db: AsyncSession, vote_id: int) -> Optional[VoteTally]:
+        """获取投票计数器,未加载时从数据库加载"""
+        with self._lock:
+            tally = self._tallies.get(vote_id)
+        if tally is not None:
+            return tally
+        
+        vote = await db.get(Vote, vote_id)
+        if not vote:
+            return None
+        await self._load(db, [vote])
+        with self._lock:
+            return self._tallies.get(vote_id)
+    
+    def peek(self, vote_id: int) -> Optional[VoteTally]:
+        """获取已加载的投票计数器(不访问数据库)"""
+        with self._lock:
+            return self._tallies.get(vote_id)
+    
+    async def record(self, db: AsyncSession, vote_id: int, participant_id: int, answer: dict):
+        """记录一次已落库的投票"""
+        tally = await self.get(db, vote_id)
+        if tally is None:
+            return
+        with self._lock:
+            tally.apply(participant_id, answer)
+    
+    def apply_records(self, records: List[list]):
+        """
+        记录其他进程已落库的投票
+        
+        只更新已加载或正在加载的计数器,未加载的下次访问时从数据库加载
+        
+        Args:
+            records: [[vote_id, participant_id, answer], ...]
+        """
+        with self._lock:
+            for vote_id, participant_id, answer in records:
+                tally = self._tallies.get(vote_id)
+                if tally is not None:
+                    tally.apply(participant_id, answer)
+                elif vote_id in self._loading:
+                    self._loading[vote_id].append((participant_id, answer))
+    
+    def discard(self, vote_id: int):
+        """丢弃投票计数器(投票被修改或删除时),下次访问重新加载"""
+        with self._lock:
+            self._tallies.pop(vote_id, None)
+    
+    def discard_activity(self, activity_id: int):
+        """丢弃活动下所有投票的计数器"""
+        with self._lock:
+            for vote_id in [
+                vote_id for vote_id, tally in self._tallies.items()
+                if tally.activity_id == activity_id
+            ]:
+                del self._tallies[vote_id]
+    
+    def clear(self):
+        """清空所有计数器"""
+        with self._lock:
+            self._tallies.clear()
+
+# 全局计票引擎实例
+tally_engine = TallyEngine()
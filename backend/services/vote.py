@@ -1,17 +1,30 @@
 """
 投票管理服务
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.models import Vote, VoteRecord, Participant
 from backend.schemas import VoteCreate, VoteUpdate
-from typing import List, Optional
+from backend.services.tally import tally_engine
+from backend.services.activity import activity_cache, summary_cache
+from backend.services.journal import journal_writer
+from backend.services.export import ExportService
+from backend.services.backplane import backplane
+from typing import Any, Dict, List, Optional, Tuple
 import json
 
 class VoteService:
     """投票管理服务"""
     
+    # 每条 INSERT 语句最多写入的记录数(每条记录 3 个参数)
+    UPSERT_CHUNK_SIZE = 300
+    
+    # 问答题回答每页条数
+    TEXT_ANSWERS_PAGE_SIZE = 20
+    
     @staticmethod
-    def create_vote(db: Session, vote: VoteCreate) -> Vote:
+    async def create_vote(db: AsyncSession, vote: VoteCreate) -> Vote:
         """创建投票"""
         # 将选项列表转换为 JSON 字符串
         options_json = json.dumps(vote.options, ensure_ascii=False) if vote.options else None
@@ -24,26 +37,51 @@ class VoteService:
             order_index=vote.order_index
         )
         db.add(db_vote)
-        db.commit()
-        db.refresh(db_vote)
+        await db.commit()
+        await db.refresh(db_vote)
+        activity_cache.invalidate()
+        summary_cache.invalidate()
         return db_vote
     
     @staticmethod
-    def get_vote(db: Session, vote_id: int) -> Optional[Vote]:
+    async def get_vote(db: AsyncSession, vote_id: int) -> Optional[Vote]:
         """获取投票"""
-        return db.query(Vote).filter(Vote.id == vote_id).first()
+        return await db.get(Vote, vote_id)
+    
+    @staticmethod
+    def validate_answer(vote_type: str, answer: Any) -> bool:
+        """
+        检查答案格式是否与投票类型相符
+        
+        单选 {"selected": str},多选 {"selected": [str, ...]},
+        问答 {"text": str},评分 {"rating": 1-5 的整数}
+        """
+        if not isinstance(answer, dict):
+            return False
+        if vote_type == 'single':
+            return isinstance(answer.get('selected'), str)
+        elif vote_type == 'multiple':
+            selected = answer.get('selected')
+            return isinstance(selected, list) and all(isinstance(option, str) for option in selected)
+        elif vote_type == 'text':
+            return isinstance(answer.get('text'), str)
+        elif vote_type == 'rating':
+            rating = answer.get('rating')
+            return isinstance(rating, int) and not isinstance(rating, bool) and 1 <= rating <= 5
+        return False
     
     @staticmethod
-    def get_votes_by_activity(db: Session, activity_id: int) -> List[Vote]:
+    async def get_votes_by_activity(db: AsyncSession, activity_id: int) -> List[Vote]:
         """获取活动的所有投票"""
-        return db.query(Vote).filter(
-            Vote.activity_id == activity_id
-        ).order_by(Vote.order_index).all()
+        result = await db.execute(
+            select(Vote).where(Vote.activity_id == activity_id).order_by(Vote.order_index)
+        )
+        return list(result.scalars().all())
     
     @staticmethod
-    def update_vote(db: Session, vote_id: int, vote_update: VoteUpdate) -> Optional[Vote]:
+    async def update_vote(db: AsyncSession, vote_id: int, vote_update: VoteUpdate) -> Optional[Vote]:
         """更新投票"""
-        db_vote = db.query(Vote).filter(Vote.id == vote_id).first()
+        db_vote = await db.get(Vote, vote_id)
         if not db_vote:
             return None
         
@@ -56,141 +94,212 @@ class VoteService:
         if vote_update.order_index is not None:
             db_vote.order_index = vote_update.order_index
         
-        db.commit()
-        db.refresh(db_vote)
+        await db.commit()
+        await db.refresh(db_vote)
+        # 题型或选项可能变化,计数器需重新加载
+        tally_engine.discard(vote_id)
+        backplane.publish('tally_discard', {'vote_id': vote_id})
+        activity_cache.invalidate()
+        summary_cache.invalidate()
         return db_vote
     
     @staticmethod
-    def delete_vote(db: Session, vote_id: int) -> bool:
+    async def delete_vote(db: AsyncSession, vote_id: int) -> bool:
         """删除投票"""
-        db_vote = db.query(Vote).filter(Vote.id == vote_id).first()
+        db_vote = await db.get(Vote, vote_id)
         if not db_vote:
             return False
         
         # 先删除相关的投票记录
-        db.query(VoteRecord).filter(VoteRecord.vote_id == vote_id).delete()
+        await db.execute(delete(VoteRecord).where(VoteRecord.vote_id == vote_id))
         
-        db.delete(db_vote)
-        db.commit()
+        await db.delete(db_vote)
+        await db.commit()
+        tally_engine.discard(vote_id)
+        backplane.publish('tally_discard', {'vote_id': vote_id})
+        activity_cache.invalidate()
+        summary_cache.invalidate()
         return True
     
     @staticmethod
-    def submit_vote(db: Session, vote_id: int, participant_id: int, answer: dict) -> VoteRecord:
-        """提交投票"""
-        # 检查是否已经投过票
-        existing = db.query(VoteRecord).filter(
-            VoteRecord.vote_id == vote_id,
-            VoteRecord.participant_id == participant_id
-        ).first()
-        
-        if existing:
-            # 更新答案
-            existing.answer = json.dumps(answer, ensure_ascii=False)
-            db.commit()
-            db.refresh(existing)
-            return existing
-        else:
-            # 创建新记录
-            record = VoteRecord(
-                vote_id=vote_id,
-                participant_id=participant_id,
-                answer=json.dumps(answer, ensure_ascii=False)
-            )
-            db.add(record)
-            db.commit()
-            db.refresh(record)
-            return record
+    async def submit_vote(db: AsyncSession, vote_id: int, participant_id: int, answer: dict) -> Optional[VoteRecord]:
+        """提交投票(投票不存在返回 None)"""
+        record_ids = await VoteService.submit_votes(db, [(vote_id, participant_id, answer)])
+        if record_ids[0] is None:
+            return None
+        return await db.get(VoteRecord, record_ids[0])
     
     @staticmethod
-    def get_vote_results(db: Session, vote_id: int) -> dict:
-        """获取投票结果统计"""
-        vote = db.query(Vote).filter(Vote.id == vote_id).first()
-        if not vote:
-            return {}
+    async def submit_votes(db: AsyncSession, submissions: List[Tuple[int, int, dict]]) -> List[Optional[int]]:
+        """
+        批量提交投票(一个事务)
         
-        records = db.query(VoteRecord).filter(VoteRecord.vote_id == vote_id).all()
-        total_count = len(records)
+        使用 INSERT ... ON CONFLICT 写入,已投过票的更新答案;
+        同一参会人对同一投票的多次提交以最后一次为准
         
-        if vote.type in ['single', 'multiple']:
-            # 单选/多选统计
-            options = json.loads(vote.options) if vote.options else []
-            results = {option: 0 for option in options}
-            
-            for record in records:
-                answer = json.loads(record.answer)
-                if vote.type == 'single':
-                    selected = answer.get('selected')
-                    if selected in results:
-                        results[selected] += 1
-                else:  # multiple
-                    selected_list = answer.get('selected', [])
-                    for option in selected_list:
-                        if option in results:
-                            results[option] += 1
-            
-            # 转换为列表格式
-            result_list = []
-            for option, count in results.items():
-                percentage = f"{count / total_count * 100:.1f}%" if total_count > 0 else "0%"
-                result_list.append({
-                    'option': option,
-                    'count': count,
-                    'percentage': percentage
-                })
-            
-            return {
-                'vote_id': vote_id,
-                'type': vote.type,
-                'results': result_list
-            }
+        Args:
+            db: 数据库会话
+            submissions: [(vote_id, participant_id, answer), ...]
         
-        elif vote.type == 'rating':
-            # 评分统计
-            ratings = [0] * 5  # 1-5 分
-            for record in records:
-                answer = json.loads(record.answer)
-                rating = answer.get('rating', 0)
-                if 1 <= rating <= 5:
-                    ratings[rating - 1] += 1
-            
-            result_list = []
-            for i, count in enumerate(ratings):
-                percentage = f"{count / total_count * 100:.1f}%" if total_count > 0 else "0%"
-                result_list.append({
-                    'option': f"{i + 1}星",
-                    'count': count,
-                    'percentage': percentage
-                })
-            
-            # 计算平均分
-            total_rating = sum((i + 1) * count for i, count in enumerate(ratings))
-            avg_rating = total_rating / total_count if total_count > 0 else 0
-            
-            return {
+        Returns:
+            与 submissions 一一对应的投票记录 ID,投票不存在(或已被删除)的为 None
+        """
+        # 跳过不存在的投票,不影响同一批的其他提交
+        existing = set((await db.scalars(
+            select(Vote.id).where(Vote.id.in_({vote_id for vote_id, _, _ in submissions}))
+        )).all())
+        
+        # 同一批内去重,保留最后一次答案
+        latest: Dict[Tuple[int, int], dict] = {}
+        for vote_id, participant_id, answer in submissions:
+            if vote_id in existing:
+                latest[(vote_id, participant_id)] = answer
+        if not latest:
+            return [None] * len(submissions)
+        
+        rows = [
+            {
                 'vote_id': vote_id,
-                'type': vote.type,
-                'results': result_list,
-                'average': round(avg_rating, 2)
+                'participant_id': participant_id,
+                'answer': json.dumps(answer, ensure_ascii=False)
             }
+            for (vote_id, participant_id), answer in latest.items()
+        ]
         
-        elif vote.type == 'text':
-            # 问答题返回所有答案
-            answers = []
-            for record in records:
-                answer = json.loads(record.answer)
-                participant = db.query(Participant).filter(
-                    Participant.id == record.participant_id
-                ).first()
-                answers.append({
-                    'participant': participant.name if participant else '匿名',
-                    'text': answer.get('text', '')
-                })
+        # 分段写入,避免超出 SQLite 单条语句的参数个数上限
+        for start in range(0, len(rows), VoteService.UPSERT_CHUNK_SIZE):
+            stmt = sqlite_insert(VoteRecord).values(rows[start:start + VoteService.UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[VoteRecord.vote_id, VoteRecord.participant_id],
+                set_={'answer': stmt.excluded.answer}
+            )
+            await db.execute(stmt)
+        
+        # 取回记录 ID,以及写流水日志需要的投票标题和参会人信息
+        result = await db.execute(
+            select(
+                VoteRecord.id,
+                VoteRecord.vote_id,
+                VoteRecord.participant_id,
+                Vote.activity_id,
+                Vote.title,
+                Vote.type,
+                Participant.name,
+                Participant.department
+            )
+            .join(Vote, Vote.id == VoteRecord.vote_id)
+            .outerjoin(Participant, Participant.id == VoteRecord.participant_id)
+            .where(
+                VoteRecord.vote_id.in_({vote_id for vote_id, _ in latest}),
+                VoteRecord.participant_id.in_({participant_id for _, participant_id in latest})
+            )
+        )
+        rows = {(row.vote_id, row.participant_id): row for row in result}
+        
+        await db.commit()
+        summary_cache.invalidate()
+        
+        # 记录已经落库: 单条投票更新计数器或写流水失败时只记录错误,
+        # 不影响同一批的其他投票,也不能跳过下面的跨进程同步
+        for key, answer in latest.items():
+            vote_id, participant_id = key
+            try:
+                await tally_engine.record(db, vote_id, participant_id, answer)
+            except Exception as e:
+                print(f"更新投票 {vote_id} 的计数器失败: {e}")
             
+            row = rows.get(key)
+            if row is None:
+                continue
+            try:
+                journal_writer.record(
+                    row.activity_id,
+                    '投票',
+                    row.title,
+                    row.name if row.name is not None else '未知',
+                    row.department,
+                    ExportService.format_answer(row.type, answer),
+                    vote_id=vote_id,
+                    participant_id=participant_id,
+                    answer_json=json.dumps(answer, ensure_ascii=False)
+                )
+            except Exception as e:
+                print(f"写入投票 {vote_id} 的流水失败: {e}")
+        
+        # 其他进程更新各自的计数器
+        backplane.publish('tally', {
+            'records': [[vote_id, participant_id, answer] for (vote_id, participant_id), answer in latest.items()]
+        })
+        
+        return [
+            rows[key].id if key in rows else None
+            for key in ((vote_id, participant_id) for vote_id, participant_id, _ in submissions)
+        ]
+    
+    @staticmethod
+    async def get_vote_results(db: AsyncSession, vote_id: int) -> dict:
+        """
+        获取投票结果统计(读取计票引擎的实时计数器)
+        
+        问答题只返回回答数、关键词和相似回答簇,回答内容由大屏通过 get_text_answers 分页获取
+        """
+        tally = await tally_engine.get(db, vote_id)
+        if tally is None:
+            return {}
+        
+        if tally.type == 'text':
             return {
                 'vote_id': vote_id,
-                'type': vote.type,
-                'total_count': total_count,
-                'answers': answers
+                'type': tally.type,
+                'total_count': tally.total_count,
+                'keywords': tally.top_keywords(),
+                'clusters': tally.top_clusters(),
+                'page_size': VoteService.TEXT_ANSWERS_PAGE_SIZE
             }
         
-        return {}
+        return tally.results()
+    
+    @staticmethod
+    async def get_text_answers(db: AsyncSession, vote_id: int, offset: int = 0, limit: int = TEXT_ANSWERS_PAGE_SIZE) -> dict:
+        """
+        分页获取问答题的回答(一条联表查询,按首次提交顺序)
+        
+        Args:
+            db: 数据库会话
+            vote_id: 投票 ID
+            offset: 起始位置
+            limit: 每页条数
+        
+        Returns:
+            {'vote_id', 'total_count', 'offset', 'answers': [{'participant', 'text'}, ...]}
+        """
+        tally = await tally_engine.get(db, vote_id)
+        total_count = tally.total_count if tally is not None else 0
+        
+        rows = (await db.execute(
+            select(Participant.name, VoteRecord.answer)
+            .select_from(VoteRecord)
+            .outerjoin(Participant, Participant.id == VoteRecord.participant_id)
+            .where(VoteRecord.vote_id == vote_id)
+            .order_by(VoteRecord.id)
+            .offset(offset)
+            .limit(limit)
+        )).all()
+        
+        answers = []
+        for name, answer in rows:
+            answers.append({
+                'participant': name if name is not None else '匿名',
+                'text': json.loads(answer).get('text', '')
+            })
+        
+        return {
+            'vote_id': vote_id,
+            'total_count': total_count,
+            'offset': offset,
+            'answers': answers
+        }
+
+# 其他进程提交的投票和失效的计数器
+backplane.on('tally', lambda data: tally_engine.apply_records(data['records']))
+backplane.on('tally_discard', lambda data: tally_engine.discard(data['vote_id']))
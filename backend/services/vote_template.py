@@ -1,7 +1,8 @@
 """
 投票模板管理服务
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.models import VoteTemplate, Vote
 from typing import List, Optional
 import json
@@ -10,7 +11,7 @@ class VoteTemplateService:
     """投票模板管理服务"""
     
     @staticmethod
-    def create_template(db: Session, title: str, type: str, options: list = None, order_index: int = None) -> VoteTemplate:
+    async def create_template(db: AsyncSession, title: str, type: str, options: list = None, order_index: int = None) -> VoteTemplate:
         """创建投票模板"""
         options_json = json.dumps(options, ensure_ascii=False) if options else None
         
@@ -21,25 +22,26 @@ class VoteTemplateService:
             order_index=order_index
         )
         db.add(db_template)
-        db.commit()
-        db.refresh(db_template)
+        await db.commit()
+        await db.refresh(db_template)
         return db_template
     
     @staticmethod
-    def get_all_templates(db: Session) -> List[VoteTemplate]:
+    async def get_all_templates(db: AsyncSession) -> List[VoteTemplate]:
         """获取所有投票模板"""
-        return db.query(VoteTemplate).order_by(VoteTemplate.order_index).all()
+        result = await db.execute(select(VoteTemplate).order_by(VoteTemplate.order_index))
+        return list(result.scalars().all())
     
     @staticmethod
-    def get_template(db: Session, template_id: int) -> Optional[VoteTemplate]:
+    async def get_template(db: AsyncSession, template_id: int) -> Optional[VoteTemplate]:
         """获取单个投票模板"""
-        return db.query(VoteTemplate).filter(VoteTemplate.id == template_id).first()
+        return await db.get(VoteTemplate, template_id)
     
     @staticmethod
-    def update_template(db: Session, template_id: int, title: str = None, type: str = None, 
+    async def update_template(db: AsyncSession, template_id: int, title: str = None, type: str = None,
                        options: list = None, order_index: int = None) -> Optional[VoteTemplate]:
         """更新投票模板"""
-        db_template = db.query(VoteTemplate).filter(VoteTemplate.id == template_id).first()
+        db_template = await db.get(VoteTemplate, template_id)
         if not db_template:
             return None
         
@@ -52,25 +54,25 @@ class VoteTemplateService:
         if order_index is not None:
             db_template.order_index = order_index
         
-        db.commit()
-        db.refresh(db_template)
+        await db.commit()
+        await db.refresh(db_template)
         return db_template
     
     @staticmethod
-    def delete_template(db: Session, template_id: int) -> bool:
+    async def delete_template(db: AsyncSession, template_id: int) -> bool:
         """删除投票模板"""
-        db_template = db.query(VoteTemplate).filter(VoteTemplate.id == template_id).first()
+        db_template = await db.get(VoteTemplate, template_id)
         if not db_template:
             return False
         
-        db.delete(db_template)
-        db.commit()
+        await db.delete(db_template)
+        await db.commit()
         return True
     
     @staticmethod
-    def copy_templates_to_activity(db: Session, activity_id: int) -> List[Vote]:
+    async def copy_templates_to_activity(db: AsyncSession, activity_id: int) -> List[Vote]:
         """将所有投票模板复制为活动投票列表"""
-        templates = VoteTemplateService.get_all_templates(db)
+        templates = await VoteTemplateService.get_all_templates(db)
         votes = []
         
         for template in templates:
@@ -84,5 +86,5 @@ class VoteTemplateService:
             db.add(vote)
             votes.append(vote)
         
-        db.commit()
+        await db.commit()
         return votes
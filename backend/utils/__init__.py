@@ -1,8 +1,8 @@
 """
 工具模块初始化
 """
-from .qrcode_gen import generate_qrcode
-from .network import get_local_ip, get_server_url
+from .qrcode_gen import generate_qrcode, render_qrcode, render_qrcode_async
+from .network import get_local_ip, get_server_url, refresh_local_ip, invalidate_local_ip
 from .auth import (
     verify_password,
     create_session,
@@ -13,8 +13,12 @@ from .auth import (
 
 __all__ = [
     'generate_qrcode',
+    'render_qrcode',
+    'render_qrcode_async',
     'get_local_ip',
     'get_server_url',
+    'refresh_local_ip',
+    'invalidate_local_ip',
     'verify_password',
     'create_session',
     'get_session',
@@ -0,0 +1,128 @@
+"""
+缓存工具 - 进程内 LRU/TTL 缓存
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import threading
+import time
+
+class TTLCache:
+    """
+    带过期时间的 LRU 缓存
+    
+    超过 maxsize 时淘汰最久未使用的条目;ttl 秒后条目过期(ttl 为 0 表示不过期)
+    """
+    
+    def __init__(self, maxsize: int = 1024, ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (value, 写入时间)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值,不存在或已过期返回 default"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, stored_at = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: Hashable, value: Any):
+        """写入缓存"""
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除并返回缓存值"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[0] if entry is not None else default
+    
+    def discard_where(self, predicate: Callable[[Any], bool]):
+        """删除所有满足条件的缓存值"""
+        with self._lock:
+            for key in [key for key, (value, _) in self._data.items() if predicate(value)]:
+                del self._data[key]
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+_MISSING = object()
+
+class VersionedCache:
+    """
+    版本号失效的缓存
+    
+    invalidate() 递增版本号并清空所有条目;写入时携带读取数据前的版本号,
+    期间发生过失效则不写入,避免缓存旧数据。ttl 大于 0 时条目到期也会失效
+    
+    有名称的缓存失效时通知 invalidation_listeners(多进程时由消息总线通知其他进程),
+    其他进程按名称在 registry 中找到对应缓存并使其失效
+    """
+    
+    # 名称 -> 缓存
+    registry: Dict[str, 'VersionedCache'] = {}
+    # 失效通知函数,接收缓存名称
+    invalidation_listeners: List[Callable[[str], None]] = []
+    
+    def __init__(self, ttl: float = 0, name: Optional[str] = None):
+        self.ttl = ttl
+        self.name = name
+        if name is not None:
+            VersionedCache.registry[name] = self
+        self.version = 0
+        # key -> (value, 写入时间)
+        self._data = {}
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值,不存在或已过期返回 default"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, stored_at = entry
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            self._data.pop(key, None)
+            return default
+        return value
+    
+    def set(self, key: Hashable, value: Any, version: int):
+        """
+        写入缓存
+        
+        Args:
+            key: 键
+            value: 值
+            version: 开始读取数据时的版本号
+        """
+        if version == self.version:
+            self._data[key] = (value, time.monotonic())
+    
+    def invalidate(self, propagate: bool = True):
+        """
+        使所有条目失效
+        
+        Args:
+            propagate: 是否通知 invalidation_listeners(处理其他进程的通知时为 False)
+        """
+        self.version += 1
+        self._data.clear()
+        if propagate and self.name is not None:
+            for listener in VersionedCache.invalidation_listeners:
+                listener(self.name)
@@ -0,0 +1,303 @@
+"""
+运行指标 - 进程内的计数器、仪表和直方图,以 Prometheus 文本格式输出
+
+指标只在内存中累加,记录一次的开销是一次字典查找和几次加法;
+由 GET /metrics 在抓取时统一格式化
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import time
+
+# 默认延迟分桶(秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class Metric:
+    """指标基类,按标签值分别累计"""
+    
+    type = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+    
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(指标名后缀, 标签, 值) 列表"""
+        raise NotImplementedError
+    
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}"
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    """只增不减的计数器"""
+    
+    type = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+    
+    def inc(self, *labels: str, amount: float = 1):
+        """
+        累加计数
+        
+        Args:
+            labels: 标签值(按 labelnames 顺序)
+            amount: 增量
+        """
+        self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+    
+    def samples(self):
+        return [('', _format_labels(self.labelnames, labels), value) for labels, value in self._values.items()]
+
+class Gauge(Metric):
+    """
+    可增可减的仪表
+    
+    传入 collect 时,抓取时调用它获取当前值({标签值元组: 值}),热路径上不需要任何记录
+    """
+    
+    type = 'gauge'
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[tuple, float]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._collect = collect
+    
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+    
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def dec(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+    
+    def samples(self):
+        values = self._collect() if self._collect is not None else self._values
+        return [('', _format_labels(self.labelnames, labels), value) for labels, value in values.items()]
+
+class Histogram(Metric):
+    """分桶直方图"""
+    
+    type = 'histogram'
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数(非累计,最后一个为 +Inf), 总和, 次数]
+        self._values: Dict[tuple, list] = {}
+    
+    def observe(self, value: float, *labels: str):
+        """记录一次观测值"""
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+    
+    def time(self, *labels: str) -> 'Timer':
+        """计时上下文管理器: with histogram.time(...): ..."""
+        return Timer(self, labels)
+    
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+    
+    def samples(self):
+        samples = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                samples.append(('_bucket', _format_labels(self.labelnames, labels, le), cumulative))
+            samples.append(('_sum', _format_labels(self.labelnames, labels), total))
+            samples.append(('_count', _format_labels(self.labelnames, labels), count))
+        return samples
+
+class Timer:
+    """记录代码块耗时到直方图"""
+    
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+class MetricsRegistry:
+    """指标注册表"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+    
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[tuple, float]]] = None
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, collect))
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+    
+    def render(self) -> str:
+        """Prometheus 文本格式(0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+# HTTP 请求
+http_request_duration = metrics.histogram(
+    'http_request_duration_seconds', 'HTTP 请求处理耗时', ('method', 'route', 'status')
+)
+
+# WebSocket 广播
+broadcast_enqueue_duration = metrics.histogram(
+    'ws_broadcast_enqueue_seconds', '广播消息放入一组连接的发送队列的耗时,不含网络发送(target: all 或客户端类型)', ('target',),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+ws_send_latency = metrics.histogram(
+    'ws_send_latency_seconds', '消息从入队到 send_text 完成的耗时(client_type: 客户端类型)', ('client_type',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+broadcast_messages = metrics.counter(
+    'ws_broadcast_messages_total', '广播入队的消息数(按连接计)', ('target',)
+)
+ws_dropped = metrics.counter(
+    'ws_dropped_connections_total', '被断开的连接数(slow: 发送队列已满, dead: 发送失败或超时)', ('reason',)
+)
+
+# 数据库
+db_query_duration = metrics.histogram(
+    'db_query_duration_seconds', '数据库语句执行耗时', ('statement',),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+
+# 写入管道
+ingest_items = metrics.counter('ingest_items_total', '组提交队列写入的请求数', ('queue',))
+ingest_failures = metrics.counter('ingest_failures_total', '组提交队列写入失败的请求数', ('queue',))
+ingest_batch_size = metrics.histogram(
+    'ingest_batch_size', '组提交每批的请求数', ('queue',),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+ingest_flush_duration = metrics.histogram(
+    'ingest_flush_duration_seconds', '组提交每批的写入耗时', ('queue',)
+)
+
+# 导出
+export_duration = metrics.histogram(
+    'export_duration_seconds', '活动数据导出耗时', ('status',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+
+def route_template(scope) -> str:
+    """请求匹配的路由模板(如 /api/host/exports/{job_id}),用作指标标签"""
+    route = scope.get('route')
+    if route is not None:
+        return getattr(route, 'path', 'unmatched')
+    # 挂载的静态文件目录
+    root_path = scope.get('app_root_path') or ''
+    if scope.get('root_path', '') != root_path:
+        return scope['root_path'][len(root_path):] + '/{path}'
+    return 'unmatched'
+
+class MetricsMiddleware:
+    """
+    记录每个 HTTP 请求的处理耗时(ASGI 中间件)
+    
+    按路由模板(如 /api/host/exports/{job_id})而不是实际路径分组,避免标签数量无限增长
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.observe(
+                time.perf_counter() - started, scope['method'], route_template(scope), str(status)
+            )
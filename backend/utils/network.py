@@ -1,7 +1,14 @@
 """
 网络工具 - IP 地址检测
 """
+import asyncio
 import socket
+import threading
+from typing import Optional
+
+# 缓存的本机 IP,请求处理时只读缓存,不做网卡探测
+_cached_local_ip: Optional[str] = None
+_probe_lock = threading.Lock()
 
 def get_local_ip() -> str:
     """
@@ -126,6 +133,57 @@ def get_server_url(manual_ip: str = "", port: int = 8000) -> str:
     if manual_ip:
         ip = manual_ip
     else:
-        ip = get_local_ip()
+        ip = get_cached_local_ip()
     
     return f"http://{ip}:{port}"
+
+def refresh_local_ip() -> str:
+    """
+    重新检测本机 IP 并更新缓存
+    
+    检测可能因 DNS 解析阻塞数秒,应在后台线程中调用
+    
+    Returns:
+        检测到的 IP 地址
+    """
+    global _cached_local_ip
+    with _probe_lock:
+        ip = get_local_ip()
+        _cached_local_ip = ip
+    return ip
+
+def get_cached_local_ip() -> str:
+    """
+    获取缓存的本机 IP(不阻塞)
+    
+    尚未检测时在后台开始检测,并暂时返回 127.0.0.1
+    
+    Returns:
+        IP 地址字符串
+    """
+    ip = _cached_local_ip
+    if ip is None:
+        invalidate_local_ip()
+        return "127.0.0.1"
+    return ip
+
+def invalidate_local_ip():
+    """使缓存的 IP 失效,在后台线程重新检测(检测完成前继续使用旧值)"""
+    if _probe_lock.locked():
+        # 已有检测在进行
+        return
+    threading.Thread(target=refresh_local_ip, daemon=True).start()
+
+async def run_local_ip_refresher(interval: float):
+    """
+    定期在后台重新检测本机 IP(网络切换后二维码地址自动更新)
+    
+    Args:
+        interval: 检测间隔(秒)
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(refresh_local_ip)
+        except Exception as e:
+            print(f"IP 检测失败: {e}")
@@ -0,0 +1,339 @@
+"""
+运行时性能分析 - 采样 CPU 分析和内存快照
+
+CPU: 后台线程定时读取事件循环线程的调用栈(sys._current_frames),按调用栈计数,
+写出折叠栈文件(flamegraph.pl、speedscope 等工具可直接生成火焰图);
+被分析的线程不需要任何插桩,采样间隔 5ms 时开销约为 1%
+
+内存: tracemalloc 快照,按代码行汇总分配,并记录内存随 WebSocket 连接数的变化
+"""
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+
+PROFILE_DIR = Path("data/profiles")
+
+# 折叠栈文件后缀
+COLLAPSED_SUFFIX = ".collapsed"
+# 内存快照文件后缀(tracemalloc.Snapshot.load 可读取)
+SNAPSHOT_SUFFIX = ".tracemalloc"
+# 内存随连接数变化的记录
+MEMORY_SERIES_FILE = "memory.jsonl"
+
+# 事件循环空闲时停在 selector 上
+_IDLE_FUNCTIONS = {'select', 'poll', 'epoll', 'kqueue', '_run_once'}
+# uvloop 等 C 实现的事件循环没有 Python 栈帧,空闲时栈顶是启动事件循环的函数
+# (asyncio.run、uvloop.run 等调用 run_until_complete / run_forever 的地方)
+_LOOP_ENTRY_FUNCTIONS = {'run', 'run_until_complete', 'run_forever'}
+_LOOP_ENTRY_PACKAGES = {'asyncio', 'uvloop'}
+# 无法读取线程状态时,栈顶为这些函数的其他线程视为空闲
+_WAIT_FUNCTIONS = _IDLE_FUNCTIONS | {'wait', '_wait_for_tstate_lock'}
+
+_STDLIB = sysconfig.get_paths()['stdlib'] + os.sep
+
+def _is_idle(frame) -> bool:
+    """事件循环线程的栈顶是否表示事件循环空闲(标准库 asyncio 和 uvloop 都适用)"""
+    code = frame.f_code
+    if code.co_name in _IDLE_FUNCTIONS:
+        return True
+    return (
+        code.co_name in _LOOP_ENTRY_FUNCTIONS
+        and os.path.basename(os.path.dirname(code.co_filename)) in _LOOP_ENTRY_PACKAGES
+    )
+
+def _short_path(filename: str) -> str:
+    """去掉 site-packages、标准库和工作目录前缀,缩短栈帧中的文件名"""
+    marker = 'site-packages' + os.sep
+    index = filename.rfind(marker)
+    if index >= 0:
+        return filename[index + len(marker):]
+    if filename.startswith(_STDLIB):
+        return filename[len(_STDLIB):]
+    cwd = os.getcwd() + os.sep
+    if filename.startswith(cwd):
+        return filename[len(cwd):]
+    return filename
+
+class SamplingProfiler:
+    """
+    采样分析器
+    
+    在独立线程中每隔 interval 秒读取一次目标线程的调用栈;all_threads 为 True 时
+    同时采样其他线程(如数据库驱动线程、导出线程),调用栈以线程名开头。
+    其他线程只记录正在运行的采样(Linux 上读取 /proc 中的线程状态),
+    否则空闲的工作线程会占满结果
+    """
+    
+    def __init__(self, thread_id: int, interval: float, all_threads: bool = False):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.all_threads = all_threads
+        # 折叠后的调用栈 -> 采样次数
+        self.stacks: Counter = Counter()
+        # 目标线程的采样次数和其中事件循环空闲的次数
+        self.samples = 0
+        self.idle_samples = 0
+        # 线程 ID -> (线程名, 系统线程 ID)
+        self._threads: Dict[int, tuple] = {}
+        # 代码对象 -> 栈帧名称
+        self._labels: Dict[object, str] = {}
+    
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+    
+    def _collapse(self, frame, root: Optional[str] = None) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        if root is not None:
+            labels.append(root)
+        labels.reverse()
+        return ';'.join(labels)
+    
+    def _thread(self, thread_id: int) -> tuple:
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            self._threads = {
+                thread.ident: (thread.name, getattr(thread, 'native_id', None))
+                for thread in threading.enumerate()
+            }
+            thread = self._threads.setdefault(thread_id, (f"thread-{thread_id}", None))
+        return thread
+    
+    @staticmethod
+    def _is_running(native_id: Optional[int], frame) -> bool:
+        """线程是否正在运行(而不是阻塞等待)"""
+        if native_id is not None:
+            try:
+                with open(f'/proc/self/task/{native_id}/stat', 'rb') as f:
+                    return f.read().rsplit(b')', 1)[1].split()[0] == b'R'
+            except (OSError, IndexError):
+                pass
+        return frame.f_code.co_name not in _WAIT_FUNCTIONS
+    
+    def _sample(self):
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.thread_id:
+                self.samples += 1
+                if _is_idle(frame):
+                    self.idle_samples += 1
+            elif not self.all_threads or thread_id == own_id:
+                continue
+            root = None
+            if self.all_threads:
+                name, native_id = self._thread(thread_id)
+                if thread_id != self.thread_id and not self._is_running(native_id, frame):
+                    continue
+                root = f"thread {name}"
+            self.stacks[self._collapse(frame, root)] += 1
+    
+    def run(self, seconds: float):
+        """采样 seconds 秒(阻塞,在独立线程中调用)"""
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            self._sample()
+            time.sleep(self.interval)
+    
+    def write_collapsed(self, path: Path):
+        """写出折叠栈文件: 每行 "栈帧;栈帧;... 次数" """
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+    
+    def summary(self, top_n: int = 20) -> dict:
+        """
+        采样汇总
+        
+        Returns:
+            目标线程的采样数、事件循环空闲比例,以及自身耗时(栈顶)和总耗时(出现在栈中)最多的函数
+            (百分比相对于目标线程的采样数)
+        """
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        
+        def percent(count: int) -> float:
+            return round(count / self.samples * 100, 1) if self.samples else 0.0
+        
+        return {
+            'samples': self.samples,
+            'idle_percent': percent(self.idle_samples),
+            'top_self': [{'function': label, 'percent': percent(count)} for label, count in own.most_common(top_n)],
+            'top_total': [{'function': label, 'percent': percent(count)} for label, count in total.most_common(top_n)]
+        }
+
+class ProfilerManager:
+    """性能分析管理(同一时间只运行一个 CPU 分析)"""
+    
+    def __init__(self, directory: Path = PROFILE_DIR):
+        self.directory = directory
+        self._running = threading.Lock()
+        # 上一次内存快照: (快照, 连接数, 已跟踪内存)
+        self._last_snapshot: Optional[tuple] = None
+    
+    @property
+    def busy(self) -> bool:
+        return self._running.locked()
+    
+    def _path(self, prefix: str, suffix: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = self.directory / f"{prefix}_{timestamp}{suffix}"
+        counter = 1
+        while path.exists():
+            path = self.directory / f"{prefix}_{timestamp}_{counter}{suffix}"
+            counter += 1
+        return path
+    
+    def profile_cpu(self, thread_id: int, seconds: float, interval: float, all_threads: bool = False) -> Optional[dict]:
+        """
+        对指定线程采样 seconds 秒并写出折叠栈文件(阻塞,在独立线程中调用)
+        
+        Args:
+            thread_id: 被分析线程(事件循环所在线程)
+            seconds: 采样时长
+            interval: 采样间隔(秒)
+            all_threads: 是否同时采样其他线程
+        
+        Returns:
+            文件名和采样汇总,已有分析在运行时返回 None
+        """
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            profiler = SamplingProfiler(thread_id, interval, all_threads)
+            profiler.run(seconds)
+            path = self._path('cpu', COLLAPSED_SUFFIX)
+            profiler.write_collapsed(path)
+            return {'filename': path.name, 'seconds': seconds, **profiler.summary()}
+        finally:
+            self._running.release()
+    
+    @staticmethod
+    def _rss_bytes() -> Optional[int]:
+        """当前进程常驻内存(仅 Linux)"""
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return None
+    
+    def start_memory_tracing(self, frames: int) -> bool:
+        """开始跟踪内存分配,返回是否为本次开启"""
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(frames)
+        self._last_snapshot = None
+        return True
+    
+    def stop_memory_tracing(self):
+        """停止跟踪内存分配(跟踪期间每次分配都有额外开销)"""
+        tracemalloc.stop()
+        self._last_snapshot = None
+    
+    def snapshot_memory(self, connections: Dict[str, int], top_n: int = 20) -> dict:
+        """
+        保存内存快照(阻塞,在独立线程中调用)
+        
+        与上一次快照比较,连接数有变化时给出每个连接平均增加的内存;
+        每次快照追加一行到 memory.jsonl,便于绘制内存随连接数变化的曲线
+        
+        Args:
+            connections: 各类型的 WebSocket 连接数
+            top_n: 返回分配最多的代码行数
+        
+        Returns:
+            快照文件名和汇总
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        traced, peak = tracemalloc.get_traced_memory()
+        connection_count = sum(connections.values())
+        
+        path = self._path('memory', SNAPSHOT_SUFFIX)
+        snapshot.dump(str(path))
+        
+        result = {
+            'filename': path.name,
+            'connections': connections,
+            'traced_bytes': traced,
+            'peak_bytes': peak,
+            'rss_bytes': self._rss_bytes(),
+            'top_lines': [
+                {'location': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                 'size': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:top_n]
+            ]
+        }
+        
+        if self._last_snapshot is not None:
+            last_snapshot, last_connections, last_traced = self._last_snapshot
+            result['top_growth'] = [
+                {'location': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+                for stat in snapshot.compare_to(last_snapshot, 'lineno')[:top_n]
+            ]
+            if connection_count != last_connections:
+                result['bytes_per_connection'] = round(
+                    (traced - last_traced) / (connection_count - last_connections)
+                )
+        self._last_snapshot = (snapshot, connection_count, traced)
+        
+        with open(self.directory / MEMORY_SERIES_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'connections': connection_count,
+                'traced_bytes': traced,
+                'rss_bytes': result['rss_bytes'],
+                'bytes_per_connection': result.get('bytes_per_connection')
+            }) + '\n')
+        
+        return result
+    
+    def list_files(self) -> List[dict]:
+        """列出分析文件"""
+        if not self.directory.exists():
+            return []
+        files = [
+            {
+                'filename': file.name,
+                'size': file.stat().st_size,
+                'created_at': datetime.fromtimestamp(file.stat().st_mtime).isoformat()
+            }
+            for file in self.directory.iterdir()
+            if file.is_file() and (file.name.endswith(COLLAPSED_SUFFIX) or file.name.endswith(SNAPSHOT_SUFFIX)
+                                   or file.name == MEMORY_SERIES_FILE)
+        ]
+        files.sort(key=lambda x: x['created_at'], reverse=True)
+        return files
+    
+    def get_file(self, filename: str) -> Optional[Path]:
+        """校验文件名并返回分析文件路径(用于下载)"""
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return None
+        filepath = self.directory / filename
+        if not filepath.is_file() or filepath.resolve().parent != self.directory.resolve():
+            return None
+        return filepath
+
+# 全局性能分析管理
+profiler_manager = ProfilerManager()
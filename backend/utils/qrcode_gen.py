@@ -2,20 +2,64 @@
 二维码生成工具
 """
 import qrcode
+import qrcode.image.svg
 from io import BytesIO
+from typing import NamedTuple
+from backend.utils.cache import TTLCache
+import asyncio
 import base64
+import hashlib
 
-def generate_qrcode(url: str, size: int = 300) -> str:
+# 允许的 PNG 尺寸(像素),其他尺寸取不小于它的最近一档(超过最大档取最大档),
+# 避免任意尺寸占满缓存或渲染超大图片
+QRCODE_SIZES = (200, 300, 400, 600, 800)
+
+class QRCodeImage(NamedTuple):
+    """渲染好的二维码图片"""
+    content: bytes
+    media_type: str
+    etag: str
+
+# (url, size, format) -> 渲染好的图片
+_qrcode_cache = TTLCache(maxsize=32)
+
+def _cache_key(url: str, size: int, format: str) -> tuple:
+    """缓存键: 尺寸归到允许的档位,SVG 与尺寸无关"""
+    if format == "svg":
+        return (url, 0, format)
+    for allowed in QRCODE_SIZES:
+        if size <= allowed:
+            return (url, allowed, format)
+    return (url, QRCODE_SIZES[-1], format)
+
+def render_qrcode(url: str, size: int = 300, format: str = "png") -> QRCodeImage:
     """
-    生成二维码并返回 base64 编码的图片
+    渲染二维码图片(按 url/size/format 缓存,未命中时同步渲染)
     
     Args:
         url: 二维码内容(URL)
-        size: 二维码大小(像素)
+        size: 二维码大小(像素,仅对 PNG 生效,归到 QRCODE_SIZES 中的档位)
+        format: 图片格式 png 或 svg
     
     Returns:
-        base64 编码的 PNG 图片字符串
+        图片内容、MIME 类型和内容哈希(用作 ETag)
     """
+    key = _cache_key(url, size, format)
+    image = _qrcode_cache.get(key)
+    if image is None:
+        image = _render(*key)
+        _qrcode_cache.set(key, image)
+    return image
+
+async def render_qrcode_async(url: str, size: int = 300, format: str = "png") -> QRCodeImage:
+    """渲染二维码图片,缓存未命中时在线程中渲染,不阻塞事件循环(参数同 render_qrcode)"""
+    image = _qrcode_cache.get(_cache_key(url, size, format))
+    if image is None:
+        image = await asyncio.to_thread(render_qrcode, url, size, format)
+    return image
+
+def _render(url: str, size: int, format: str) -> QRCodeImage:
+    """渲染二维码图片(不经过缓存)"""
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -25,14 +69,36 @@ def generate_qrcode(url: str, size: int = 300) -> str:
     qr.add_data(url)
     qr.make(fit=True)
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    buffered = BytesIO()
+    if format == "svg":
+        # 矢量图,体积小且可任意缩放
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buffered)
+        media_type = "image/svg+xml"
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        
+        # 调整大小
+        img = img.resize((size, size))
+        img.save(buffered, format="PNG")
+        media_type = "image/png"
     
-    # 调整大小
-    img = img.resize((size, size))
+    content = buffered.getvalue()
+    etag = hashlib.sha1(content).hexdigest()[:16]
+    return QRCodeImage(content, media_type, etag)
+
+def generate_qrcode(url: str, size: int = 300) -> str:
+    """
+    生成二维码并返回 base64 编码的图片
     
-    # 转换为 base64
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
+    Args:
+        url: 二维码内容(URL)
+        size: 二维码大小(像素)
+    
+    Returns:
+        base64 编码的 PNG 图片字符串
+    """
+    image = render_qrcode(url, size, "png")
+    img_str = base64.b64encode(image.content).decode()
     
     return f"data:image/png;base64,{img_str}"
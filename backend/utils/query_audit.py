@@ -0,0 +1,189 @@
+"""
+SQL 语句审计 - 按请求统计语句数和耗时,发现慢语句和 N+1 查询
+
+数据库引擎的语句事件把每条语句记到当前上下文的 QueryStats 中(contextvar,
+每个请求/后台任务各自独立);请求结束后,超过 sql_slow_ms 的慢语句和
+同一请求中重复执行达到 sql_repeat_threshold 次的语句连同 EXPLAIN QUERY PLAN 一起打印
+"""
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from backend.config import settings
+from backend.utils.metrics import metrics, route_template
+import asyncio
+import re
+
+# IN (?, ?, ?) 展开的参数个数不同,视为同一条语句
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+# 可以 EXPLAIN 的语句类型
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+queries_per_request = metrics.histogram(
+    'db_queries_per_request', '每个请求执行的 SQL 语句数', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+)
+
+_current: ContextVar[Optional['QueryStats']] = ContextVar('query_stats', default=None)
+
+class StatementStats:
+    """同一条(归一化后)语句的统计"""
+    
+    __slots__ = ('count', 'total_time', 'max_time', 'statement', 'parameters')
+    
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # 耗时最长的一次执行(用于 EXPLAIN)
+        self.statement = ''
+        self.parameters: Any = None
+
+class QueryStats:
+    """一个请求(或后台任务)执行的 SQL 语句"""
+    
+    def __init__(self, label: str = '', parent: Optional['QueryStats'] = None):
+        self.label = label
+        # 嵌套统计时,语句同时记到外层(如 assert_max_queries 包住整个请求)
+        self.parent = parent
+        self.count = 0
+        self.total_time = 0.0
+        # 归一化语句 -> 统计
+        self.statements: Dict[str, StatementStats] = {}
+    
+    def record(self, statement: str, parameters: Any, elapsed: float, executemany: bool):
+        self.count += 1
+        self.total_time += elapsed
+        key = _IN_LIST.sub('(?)', statement)
+        entry = self.statements.get(key)
+        if entry is None:
+            entry = self.statements[key] = StatementStats()
+        entry.count += 1
+        entry.total_time += elapsed
+        if elapsed >= entry.max_time:
+            entry.max_time = elapsed
+            entry.statement = statement
+            entry.parameters = None if executemany else parameters
+    
+    def problems(self, slow_ms: float, repeat_threshold: int) -> List[Tuple[str, StatementStats]]:
+        """
+        慢语句和重复语句
+        
+        Returns:
+            [(原因, 统计), ...]
+        """
+        problems = []
+        for entry in self.statements.values():
+            if entry.max_time * 1000 >= slow_ms:
+                problems.append(('慢语句', entry))
+            elif entry.count >= repeat_threshold:
+                problems.append((f'重复 {entry.count} 次', entry))
+        return problems
+    
+    def format(self) -> str:
+        """按执行次数列出所有语句"""
+        lines = []
+        for key, entry in sorted(self.statements.items(), key=lambda item: -item[1].count):
+            lines.append(f"  {entry.count:>4} 次 {entry.total_time * 1000:8.2f}ms  {' '.join(key.split())}")
+        return '\n'.join(lines)
+
+def record_query(statement: str, parameters: Any, elapsed: float, executemany: bool):
+    """记录一条已执行的语句(由数据库引擎事件调用)"""
+    stats = _current.get()
+    while stats is not None:
+        stats.record(statement, parameters, elapsed, executemany)
+        stats = stats.parent
+
+@contextmanager
+def track_queries(label: str = '') -> Iterator[QueryStats]:
+    """
+    统计代码块执行的 SQL 语句
+    
+    用法:
+        with track_queries() as stats:
+            ...
+        print(stats.count)
+    """
+    stats = QueryStats(label, _current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def assert_max_queries(limit: int, label: str = '') -> Iterator[QueryStats]:
+    """
+    断言代码块执行的 SQL 语句不超过 limit 条(用于固定接口的查询次数,防止 N+1 回归)
+    
+    用法:
+        with assert_max_queries(3, 'GET /api/host/status'):
+            await client.get('/api/host/status', ...)
+    
+    Raises:
+        AssertionError: 语句数超过上限,消息中列出所有语句
+    """
+    with track_queries(label) as stats:
+        yield stats
+    if stats.count > limit:
+        raise AssertionError(
+            f"{label or '代码块'} 执行了 {stats.count} 条 SQL 语句,超过上限 {limit}:\n{stats.format()}"
+        )
+
+def explain(statement: str, parameters: Any) -> str:
+    """SQLite 的 EXPLAIN QUERY PLAN 结果(使用同步引擎的独立连接)"""
+    from backend.database import engine
+    
+    if engine.dialect.name != 'sqlite' or parameters is None:
+        return ''
+    if statement.lstrip().split(None, 1)[0].upper() not in _EXPLAINABLE:
+        return ''
+    try:
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, tuple(parameters)).all()
+    except Exception as e:
+        return f"(EXPLAIN 失败: {e})"
+    return '\n'.join(f"    {row[-1]}" for row in rows)
+
+async def report(stats: QueryStats):
+    """打印慢语句和重复语句及其执行计划"""
+    problems = stats.problems(settings.sql_slow_ms, settings.sql_repeat_threshold)
+    if not problems:
+        return
+    
+    lines = [f"[SQL] {stats.label}: {stats.count} 条语句,共 {stats.total_time * 1000:.1f}ms"]
+    for reason, entry in problems:
+        lines.append(
+            f"  {reason}(最长 {entry.max_time * 1000:.1f}ms,共 {entry.total_time * 1000:.1f}ms): "
+            f"{' '.join(entry.statement.split())}"
+        )
+        plan = await asyncio.to_thread(explain, entry.statement, entry.parameters)
+        if plan:
+            lines.append(plan)
+    print('\n'.join(lines))
+
+@asynccontextmanager
+async def audit_queries(label: str):
+    """统计代码块执行的 SQL 语句,结束后报告慢语句和重复语句(用于后台任务)"""
+    with track_queries(label) as stats:
+        yield stats
+    await report(stats)
+
+class QueryAuditMiddleware:
+    """按请求统计 SQL 语句(ASGI 中间件)"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        with track_queries() as stats:
+            await self.app(scope, receive, send)
+        
+        route = route_template(scope)
+        stats.label = f"{scope['method']} {route}"
+        queries_per_request.observe(stats.count, route)
+        await report(stats)
@@ -0,0 +1,41 @@
+"""
+节流工具 - 合并高频触发的异步任务
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+class Throttler:
+    """
+    节流执行器
+    
+    多次调用 mark() 会被合并,回调最多每 interval 秒执行一次;
+    首次标记立即执行,节流期间的标记在间隔结束后合并执行一次
+    """
+    
+    def __init__(self, callback: Callable[[], Awaitable[None]], interval: float):
+        self.callback = callback
+        self.interval = interval
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+    
+    def mark(self):
+        """标记有新数据待发送(需在事件循环中调用)"""
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def _run(self):
+        while self._dirty:
+            self._dirty = False
+            try:
+                await self.callback()
+            except Exception as e:
+                print(f"节流任务执行失败: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def cancel(self):
+        """取消待执行的任务"""
+        self._dirty = False
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
@@ -94,6 +94,8 @@ async function handleLogin(e) {
  * 处理退出登录
  */
 function handleLogout() {
+    // 通知服务端作废令牌,失败不影响本地退出
+    apiRequest('/api/admin/logout', { method: 'POST' }).catch(() => {});
     adminToken = null;
     localStorage.removeItem('admin_token');
     showLoginView();
@@ -123,6 +125,8 @@ async function loadCurrentActivity() {
         const data = await apiRequest('/api/admin/activities/current');
 
         currentActivityId = data.id;
+        document.getElementById('current-records-link').href =
+            `/api/admin/activities/${data.id}/records.csv?token=${adminToken}`;
         document.getElementById('current-activity').innerHTML = `
             <div class="card">
                 <h3>${data.name}</h3>
@@ -460,6 +464,7 @@ async function loadExportFiles() {
                     <div class="export-date">${new Date(file.created_at).toLocaleString('zh-CN')}</div>
                 </div>
                 <div>
+                    ${file.format === 'archive' ? `<button class="btn btn-success" onclick="showArchiveResults('${file.filename}')">查看结果</button>` : ''}
                     <a href="/api/admin/exports/${file.filename}?token=${adminToken}" 
                        class="btn btn-primary" download>下载</a>
                     <button class="btn btn-danger" onclick="deleteExportFile('${file.filename}')">删除</button>
@@ -471,6 +476,59 @@ async function loadExportFiles() {
     }
 }
 
+/**
+ * 显示归档中的统计结果
+ */
+async function showArchiveResults(filename) {
+    try {
+        const data = await apiRequest(`/api/admin/exports/${filename}/results`);
+        const container = document.getElementById('archive-results');
+        container.innerHTML = '';
+
+        // 活动名称、投票标题、选项和回答都是用户输入的内容,统一用 textContent 写入
+        const addText = (parent, tag, className, text) => {
+            const el = document.createElement(tag);
+            if (className) el.className = className;
+            el.textContent = text;
+            parent.appendChild(el);
+            return el;
+        };
+
+        const activity = data.activity || {};
+        addText(container, 'h2', 'mb-3', activity.name || filename);
+        addText(container, 'p', 'text-muted mb-3',
+            `导出时间: ${activity.exported_at ? new Date(activity.exported_at).toLocaleString('zh-CN') : '-'}`);
+
+        if (data.votes.length === 0) {
+            addText(container, 'p', 'text-muted', '没有投票');
+            return;
+        }
+
+        data.votes.forEach(vote => {
+            const results = vote.results || {};
+            const card = document.createElement('div');
+            card.className = 'card mb-3';
+            addText(card, 'h3', '', vote.title);
+            if (vote.vote_type === 'text') {
+                addText(card, 'p', 'text-sm', `共 ${results.total_count || 0} 条回答`);
+                (results.answers || []).forEach(answer => {
+                    addText(card, 'p', 'text-sm', `${answer.participant}: ${answer.text}`);
+                });
+            } else {
+                (results.results || []).forEach(item => {
+                    addText(card, 'p', 'text-sm', `${item.option}: ${item.count} (${item.percentage})`);
+                });
+                if (vote.vote_type === 'rating') {
+                    addText(card, 'p', 'text-sm', `平均分: ${results.average}`);
+                }
+            }
+            container.appendChild(card);
+        });
+    } catch (error) {
+        showMessage('读取归档失败: ' + error.message, 'error');
+    }
+}
+
 /**
  * 删除导出文件
  */
@@ -18,6 +18,7 @@ document.addEventListener('DOMContentLoaded', () => {
     wsClient.on('participant_signed_in', handleParticipantSignedIn);
     wsClient.on('activity_started', handleActivityStarted);
     wsClient.on('vote_started', handleVoteStarted);
+    wsClient.on('vote_progress', handleVoteProgress);
     wsClient.on('vote_ended', handleVoteEnded);
     wsClient.on('vote_exited', handleVoteExited);
     wsClient.on('activity_ended', handleActivityEnded);
@@ -51,6 +52,9 @@ async function loadSigninInfo() {
  * 切换视图
  */
 function switchView(viewName) {
+    // 离开结果页时停止回答墙翻页
+    stopAnswerWall();
+
     // 隐藏所有视图
     document.querySelectorAll('.view').forEach(view => {
         view.classList.remove('active');
@@ -94,16 +98,59 @@ function handleVoteStarted(data) {
 
     if (data.type === 'single' || data.type === 'multiple') {
         data.options.forEach(option => {
-            const optionEl = document.createElement('div');
-            optionEl.className = 'vote-option fade-in';
-            optionEl.textContent = option;
-            optionsContainer.appendChild(optionEl);
+            optionsContainer.appendChild(createVoteOption(option, option));
         });
     } else if (data.type === 'rating') {
-        optionsContainer.innerHTML = '<div class="vote-option fade-in">评分题 (1-5星)</div>';
+        for (let i = 1; i <= 5; i++) {
+            optionsContainer.appendChild(createVoteOption(`${i}星`, `${i}星`));
+        }
     } else if (data.type === 'text') {
         optionsContainer.innerHTML = '<div class="vote-option fade-in">问答题</div>';
     }
+
+    // 实时参与人数
+    const totalEl = document.createElement('div');
+    totalEl.className = 'vote-progress-total';
+    totalEl.innerHTML = '已有 <span id="vote-progress-total">0</span> 人参与';
+    optionsContainer.appendChild(totalEl);
+}
+
+/**
+ * 创建带实时计数的投票选项
+ */
+function createVoteOption(label, key) {
+    const optionEl = document.createElement('div');
+    optionEl.className = 'vote-option fade-in';
+    optionEl.dataset.option = key;
+
+    const labelEl = document.createElement('div');
+    labelEl.textContent = label;
+    const countEl = document.createElement('div');
+    countEl.className = 'vote-option-count';
+    countEl.textContent = '0 票';
+
+    optionEl.appendChild(labelEl);
+    optionEl.appendChild(countEl);
+    return optionEl;
+}
+
+/**
+ * 处理投票进度(只包含变化的计数器)
+ */
+function handleVoteProgress(data) {
+    if (currentView !== 'voting') return;
+
+    const totalEl = document.getElementById('vote-progress-total');
+    if (totalEl) {
+        totalEl.textContent = data.total_count;
+    }
+
+    document.querySelectorAll('#vote-options .vote-option[data-option]').forEach(optionEl => {
+        const key = optionEl.dataset.option;
+        if (key in data.counts) {
+            optionEl.querySelector('.vote-option-count').textContent = `${data.counts[key]} 票`;
+        }
+    });
 }
 
 /**
@@ -153,23 +200,152 @@ function handleVoteEnded(data) {
         }, data.results.length * 200);
     }
 
-    // 显示问答题结果 (新增)
-    if (data.answers) {
-        data.answers.forEach((answer, index) => {
-            setTimeout(() => {
-                const answerEl = document.createElement('div');
-                answerEl.className = 'result-item fade-in';
-                answerEl.style.flexDirection = 'column';
-                answerEl.style.alignItems = 'flex-start';
-                answerEl.innerHTML = `
-                    <div class="result-option" style="font-size: var(--text-sm); color: var(--text-muted);">${answer.participant}</div>
-                    <div style="font-size: var(--text-lg); margin-top: 4px; padding: 12px; background: rgba(255,255,255,0.05); border-radius: 8px; width: 100%;">
-                        ${answer.text}
-                    </div>
+    // 显示问答题结果: 回答墙分页获取,每页停留一段时间后自动翻页
+    if (data.type === 'text') {
+        const totalEl = document.createElement('div');
+        totalEl.className = 'result-item fade-in';
+        totalEl.innerHTML = `
+            <div class="result-option">回答数</div>
+            <div class="result-count" style="flex: 1; text-align: center; font-size: var(--text-3xl);">
+                ${data.total_count} 条
+            </div>
+        `;
+        resultContainer.appendChild(totalEl);
+
+        // 关键词词云: 字号按出现次数缩放
+        if (data.keywords && data.keywords.length > 0) {
+            const maxCount = data.keywords[0].count;
+            const cloudEl = document.createElement('div');
+            cloudEl.className = 'result-item fade-in keyword-cloud';
+            // 关键词来自参会人的回答,用 textContent 写入,避免被当作 HTML 解析
+            data.keywords.forEach(keyword => {
+                const keywordEl = document.createElement('span');
+                keywordEl.className = 'keyword';
+                keywordEl.style.fontSize = `${1 + 1.5 * keyword.count / maxCount}em`;
+                keywordEl.title = `${keyword.count} 次`;
+                keywordEl.textContent = keyword.word;
+                cloudEl.appendChild(keywordEl);
+            });
+            resultContainer.appendChild(cloudEl);
+        }
+
+        // 相似回答: "N 人说了类似的话"
+        if (data.clusters) {
+            data.clusters.forEach(cluster => {
+                const clusterEl = document.createElement('div');
+                clusterEl.className = 'result-item fade-in';
+                clusterEl.innerHTML = `
+                    <div class="result-count">${cluster.count} 人</div>
+                    <div style="flex: 1; font-size: var(--text-lg);"></div>
                 `;
-                resultContainer.appendChild(answerEl);
-            }, index * 150);
-        });
+                // 代表回答是参会人的原文,用 textContent 写入
+                clusterEl.lastElementChild.textContent = `说了类似的话: ${cluster.text}`;
+                resultContainer.appendChild(clusterEl);
+            });
+        }
+
+        const wallEl = document.createElement('div');
+        wallEl.id = 'answer-wall';
+        resultContainer.appendChild(wallEl);
+
+        startAnswerWall(data.vote_id, data.total_count, data.page_size);
+    }
+}
+
+// 回答墙状态: 已获取的页面缓存在 pages 中,翻页不重复请求
+let answerWall = null;
+
+// 回答墙自动翻页间隔(毫秒)
+const ANSWER_PAGE_INTERVAL = 10000;
+
+/**
+ * 开始显示回答墙
+ */
+function startAnswerWall(voteId, total, pageSize) {
+    stopAnswerWall();
+    answerWall = {
+        voteId,
+        pageSize,
+        pageCount: Math.max(1, Math.ceil(total / pageSize)),
+        page: 0,
+        pages: new Map(),
+        timer: null
+    };
+    showAnswerPage(0);
+    if (answerWall.pageCount > 1) {
+        answerWall.timer = setInterval(() => {
+            showAnswerPage((answerWall.page + 1) % answerWall.pageCount);
+        }, ANSWER_PAGE_INTERVAL);
+    }
+}
+
+/**
+ * 停止回答墙翻页
+ */
+function stopAnswerWall() {
+    if (answerWall && answerWall.timer) {
+        clearInterval(answerWall.timer);
+    }
+    answerWall = null;
+}
+
+/**
+ * 显示回答墙的某一页
+ */
+async function showAnswerPage(page) {
+    const wall = answerWall;
+    if (!wall) return;
+
+    let answers = wall.pages.get(page);
+    if (!answers) {
+        try {
+            const data = await apiRequest(`/api/display/votes/${wall.voteId}/answers`, {
+                params: { offset: page * wall.pageSize, limit: wall.pageSize }
+            });
+            answers = data.answers;
+            wall.pages.set(page, answers);
+        } catch (error) {
+            console.error('加载回答失败:', error);
+            return;
+        }
+    }
+
+    // 等待请求期间回答墙可能已切换
+    if (wall !== answerWall) return;
+    wall.page = page;
+
+    const wallEl = document.getElementById('answer-wall');
+    if (!wallEl) return;
+    wallEl.innerHTML = '';
+
+    answers.forEach((answer, index) => {
+        setTimeout(() => {
+            const answerEl = document.createElement('div');
+            answerEl.className = 'result-item fade-in';
+            answerEl.style.flexDirection = 'column';
+            answerEl.style.alignItems = 'flex-start';
+            // 姓名和回答都是参会人输入的内容,用 textContent 写入
+            const nameEl = document.createElement('div');
+            nameEl.className = 'result-option';
+            nameEl.style.fontSize = 'var(--text-sm)';
+            nameEl.style.color = 'var(--text-muted)';
+            nameEl.textContent = answer.participant;
+
+            const textEl = document.createElement('div');
+            textEl.style.cssText = 'font-size: var(--text-lg); margin-top: 4px; padding: 12px; background: rgba(255,255,255,0.05); border-radius: 8px; width: 100%;';
+            textEl.textContent = answer.text;
+
+            answerEl.append(nameEl, textEl);
+            wallEl.appendChild(answerEl);
+        }, index * 150);
+    });
+
+    if (wall.pageCount > 1) {
+        const pagerEl = document.createElement('div');
+        pagerEl.className = 'text-muted';
+        pagerEl.style.textAlign = 'center';
+        pagerEl.textContent = `${page + 1} / ${wall.pageCount}`;
+        wallEl.appendChild(pagerEl);
     }
 }
 
@@ -218,8 +218,34 @@ async function endActivity() {
 async function closeActivity() {
     if (!confirm('确定关闭并同步数据吗?')) return;
     try {
-        await apiRequest('/api/host/activity/close', { method: 'POST' });
+        const data = await apiRequest('/api/host/activity/close', { method: 'POST' });
+        showMessage('数据保存中...', 'info');
+        pollExportJob(data.job.job_id);
     } catch (error) {
         showMessage('操作失败: ' + error.message, 'error');
     }
 }
+
+/**
+ * 轮询导出进度,完成后由 activity_closed 消息跳转
+ */
+async function pollExportJob(jobId, failures = 0) {
+    try {
+        const job = await apiRequest(`/api/host/exports/${jobId}`);
+        if (job.status === 'failed') {
+            showMessage('数据保存失败: ' + job.error, 'error');
+            return;
+        }
+        if (job.status === 'done') return;
+        showMessage(`数据保存中 ${job.progress}%`, 'info');
+        failures = 0;
+    } catch (error) {
+        // 偶发失败继续重试,连续失败时提示主持人
+        failures += 1;
+        if (failures >= 5) {
+            showMessage('无法获取数据保存进度: ' + error.message, 'error');
+            return;
+        }
+    }
+    setTimeout(() => pollExportJob(jobId, failures), 1000);
+}
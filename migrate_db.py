@@ -1,8 +1,7 @@
 """
-数据库迁移脚本 - 添加 vote_templates 表
+数据库迁移脚本 - 添加 vote_templates 表、热点查询索引和投票记录唯一索引
 """
-from backend.database import engine, init_db
-from backend.models import Base
+from backend.database import engine, migrate_schema
 from sqlalchemy import text
 
 print("正在更新数据库架构...")
@@ -19,8 +18,20 @@ with engine.connect() as conn:
         print("✓ vote_templates 表已存在，无需迁移")
     else:
         print("→ vote_templates 表不存在，正在创建...")
-        # 创建新表
-        Base.metadata.create_all(bind=engine, checkfirst=True)
-        print("✓ vote_templates 表创建成功")
+
+# 创建缺失的表和索引(投票记录去重后再建唯一索引)
+steps = migrate_schema()
+if not table_exists:
+    print("✓ vote_templates 表创建成功")
+if steps:
+    for step in steps:
+        print(f"✓ {step}")
+else:
+    print("✓ 索引已是最新，无需迁移")
+
+# 切换到 WAL 日志模式(设置会持久保存在数据库文件中)
+with engine.connect() as conn:
+    journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+    print(f"✓ 日志模式: {journal_mode}")
 
 print("\n数据库迁移完成！")
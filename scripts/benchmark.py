@@ -0,0 +1,524 @@
+"""
+服务层基准测试
+
+在临时目录中生成指定规模的测试数据(活动、参会人、投票和投票记录),对热点服务函数计时:
+
+- VoteService.get_vote_results(各题型,冷/热计数器)
+- ActivityService.get_activity_summary(冷/热缓存)
+- ExportService.export_activity_data
+- ActivityService.reset_activity_data
+- VoteTemplateService.copy_templates_to_activity
+- ConnectionManager.broadcast(模拟连接,统计入队和全部送达的耗时)
+- 主持人接口 GET /api/host/status、POST /api/host/vote/end(经过路由和中间件)
+
+每次运行的结果连同 git 提交号追加到历史文件,并与上一次相同参数、不同提交的结果对比,
+耗时增加超过阈值的项目标记为退化:
+    
+    python scripts/benchmark.py
+    python scripts/benchmark.py --participants 10000 --votes 20 --repeat 3
+    python scripts/benchmark.py --fail-on-regression   # 有退化时返回非零退出码
+
+QUERY_BUDGETS 中的项目每次执行的 SQL 语句数不得超过上限(与数据规模无关),
+超出说明出现了 N+1 查询,无论是否指定 --fail-on-regression 都返回非零退出码
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 投票题型按顺序循环使用
+VOTE_TYPES = ['single', 'multiple', 'rating', 'text']
+OPTIONS = ['选项A', '选项B', '选项C', '选项D', '选项E']
+TEXT_ANSWERS = [
+    '内容很充实,收获很大', '希望下次多一些互动环节', '时间安排有点紧', '讲得非常精彩',
+    '案例很实用,可以直接用到工作中', '场地和设备都很好', 'PPT 字太小了', '希望能分享课件'
+]
+
+# SQL 语句数上限: 项目名称 -> 每次执行最多的语句数
+QUERY_BUDGETS = {
+    'get_vote_results[text] cold': 2,
+    'get_activity_summary cold': 3,
+    'export_activity_data': 3,
+    'GET /api/host/status cold': 4,
+    'POST /api/host/vote/end[text] cold': 2,
+}
+
+def random_answer(vote_type: str) -> dict:
+    """按题型生成随机答案"""
+    if vote_type == 'single':
+        return {'selected': random.choice(OPTIONS)}
+    if vote_type == 'multiple':
+        return {'selected': random.sample(OPTIONS, random.randint(1, 3))}
+    if vote_type == 'rating':
+        return {'rating': random.randint(1, 5)}
+    return {'text': random.choice(TEXT_ANSWERS) + str(random.randint(0, 9))}
+
+class DataGenerator:
+    """测试数据生成器(同步引擎批量插入)"""
+    
+    def __init__(self, participants: int, votes: int, answer_rate: float):
+        self.participants = participants
+        self.votes = votes
+        self.answer_rate = answer_rate
+    
+    def seed_templates(self, count: int):
+        """生成投票模板"""
+        from sqlalchemy import insert
+        from backend.database import engine
+        from backend.models import VoteTemplate
+        
+        with engine.begin() as conn:
+            conn.execute(insert(VoteTemplate), [
+                {
+                    'title': f'模板{i + 1}',
+                    'type': VOTE_TYPES[i % len(VOTE_TYPES)],
+                    'options': json.dumps(OPTIONS, ensure_ascii=False) if VOTE_TYPES[i % len(VOTE_TYPES)] in ['single', 'multiple'] else None,
+                    'order_index': i
+                }
+                for i in range(count)
+            ])
+    
+    def seed_activity(self, name: str) -> int:
+        """
+        生成一个活动及其参会人、投票和投票记录
+        
+        Returns:
+            活动 ID
+        """
+        from sqlalchemy import insert, select
+        from backend.database import engine
+        from backend.models import Activity, Participant, Vote, VoteRecord
+        
+        with engine.begin() as conn:
+            activity_id = conn.execute(
+                insert(Activity).values(name=name, theme='benchmark', status='active')
+            ).inserted_primary_key[0]
+            
+            conn.execute(insert(Participant), [
+                {
+                    'activity_id': activity_id,
+                    'name': f'参会人{i}',
+                    'department': f'部门{i % 20}',
+                    'role': 'participant',
+                    'session_id': f'bench-{activity_id}-{i}'
+                }
+                for i in range(self.participants)
+            ])
+            participant_ids = conn.execute(
+                select(Participant.id).where(Participant.activity_id == activity_id)
+            ).scalars().all()
+            
+            votes = []
+            for i in range(self.votes):
+                vote_type = VOTE_TYPES[i % len(VOTE_TYPES)]
+                vote_id = conn.execute(insert(Vote).values(
+                    activity_id=activity_id,
+                    title=f'投票{i + 1}',
+                    type=vote_type,
+                    options=json.dumps(OPTIONS, ensure_ascii=False) if vote_type in ['single', 'multiple'] else None,
+                    order_index=i
+                )).inserted_primary_key[0]
+                votes.append((vote_id, vote_type))
+            
+            for vote_id, vote_type in votes:
+                conn.execute(insert(VoteRecord), [
+                    {
+                        'vote_id': vote_id,
+                        'participant_id': participant_id,
+                        'answer': json.dumps(random_answer(vote_type), ensure_ascii=False)
+                    }
+                    for participant_id in participant_ids
+                    if random.random() < self.answer_rate
+                ])
+        
+        return activity_id
+
+class FakeWebSocket:
+    """模拟 WebSocket 连接,只统计收到的消息"""
+    
+    def __init__(self, on_message: Callable[[], None]):
+        self.on_message = on_message
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text: str):
+        self.on_message()
+    
+    async def close(self):
+        pass
+
+class Benchmark:
+    """基准测试执行和计时"""
+    
+    def __init__(self, args):
+        self.args = args
+        self.generator = DataGenerator(args.participants, args.votes, args.answer_rate)
+        # 名称 -> 每次耗时(毫秒)
+        self.results: Dict[str, List[float]] = {}
+        # 名称 -> 每次执行的 SQL 语句数
+        self.queries: Dict[str, int] = {}
+        # 超出 SQL 语句数上限的项目说明
+        self.budget_failures: List[str] = []
+    
+    def record(self, name: str, seconds: float, queries: Optional[int] = None):
+        self.results.setdefault(name, []).append(seconds * 1000)
+        if queries is not None:
+            self.queries[name] = max(self.queries.get(name, 0), queries)
+    
+    async def timeit(self, name: str, func, before=None, repeat: Optional[int] = None):
+        """
+        重复执行并计时
+        
+        Args:
+            name: 项目名称
+            func: 被测协程函数
+            before: 每次执行前的准备(不计时),如清空缓存
+            repeat: 执行次数,默认为 --repeat
+        """
+        from backend.utils.query_audit import assert_max_queries, track_queries
+        
+        budget = QUERY_BUDGETS.get(name)
+        for _ in range(repeat or self.args.repeat):
+            if before is not None:
+                before()
+            tracker = assert_max_queries(budget, name) if budget is not None else track_queries(name)
+            try:
+                with tracker as stats:
+                    started = time.perf_counter()
+                    await func()
+                    elapsed = time.perf_counter() - started
+            except AssertionError as e:
+                if not any(failure.startswith(name + ' ') for failure in self.budget_failures):
+                    self.budget_failures.append(str(e))
+            self.record(name, elapsed, stats.count)
+    
+    async def bench_vote_results(self, activity_id: int):
+        """各题型的投票结果(冷: 从数据库加载计数器;热: 计数器已在内存)"""
+        from sqlalchemy import select
+        from backend.database import AsyncSessionLocal
+        from backend.models import Vote
+        from backend.services.tally import tally_engine
+        from backend.services.vote import VoteService
+        
+        async with AsyncSessionLocal() as db:
+            votes = (await db.execute(
+                select(Vote.id, Vote.type).where(Vote.activity_id == activity_id).order_by(Vote.order_index)
+            )).all()
+            first_by_type = {}
+            for vote_id, vote_type in votes:
+                first_by_type.setdefault(vote_type, vote_id)
+            
+            for vote_type, vote_id in first_by_type.items():
+                async def run(vote_id=vote_id):
+                    await VoteService.get_vote_results(db, vote_id)
+                await self.timeit(
+                    f'get_vote_results[{vote_type}] cold', run,
+                    before=lambda vote_id=vote_id: tally_engine.discard(vote_id)
+                )
+                await self.timeit(f'get_vote_results[{vote_type}] warm', run)
+    
+    async def bench_summary(self, activity_id: int):
+        """活动汇总(冷: 清空汇总缓存;热: 命中缓存)"""
+        from backend.database import AsyncSessionLocal
+        from backend.services.activity import ActivityService, summary_cache
+        from backend.services.participant import participant_counter
+        
+        def cold():
+            summary_cache.invalidate()
+            participant_counter.reset(activity_id)
+        
+        async with AsyncSessionLocal() as db:
+            async def run():
+                await ActivityService.get_activity_summary(db, activity_id)
+            await self.timeit('get_activity_summary cold', run, before=cold)
+            await self.timeit('get_activity_summary warm', run)
+    
+    async def bench_export(self, activity_id: int):
+        """导出活动数据(CSV 和归档)"""
+        from backend.database import AsyncSessionLocal
+        from backend.services.export import ExportService
+        
+        async with AsyncSessionLocal() as db:
+            async def run():
+                await ExportService.export_activity_data(db, activity_id)
+            await self.timeit('export_activity_data', run)
+    
+    async def bench_host_routes(self, activity_id: int):
+        """主持人接口(冷: 清空面板缓存或计数器),统计包含鉴权在内的全部语句"""
+        import httpx
+        from fastapi import FastAPI
+        from sqlalchemy import select
+        from backend.database import AsyncSessionLocal
+        from backend.routers import host
+        from backend.models import Vote
+        from backend.services.activity import activity_cache
+        from backend.services.participant import ParticipantService, participant_counter
+        from backend.services.tally import tally_engine
+        
+        async with AsyncSessionLocal() as db:
+            host_participant = await ParticipantService.create_participant(db, activity_id, '主持人', None, 'host')
+            text_vote_id = await db.scalar(
+                select(Vote.id).where(Vote.activity_id == activity_id, Vote.type == 'text').limit(1)
+            )
+        headers = {'X-Session-ID': host_participant.session_id}
+        
+        def cold_status():
+            activity_cache.invalidate()
+            participant_counter.reset(activity_id)
+        
+        # 只挂载主持人路由(完整应用依赖前端静态目录)
+        app = FastAPI()
+        app.include_router(host.router)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            async def status():
+                response = await client.get('/api/host/status', headers=headers)
+                response.raise_for_status()
+            await self.timeit('GET /api/host/status cold', status, before=cold_status)
+            
+            if text_vote_id is not None:
+                async def end_vote():
+                    response = await client.post('/api/host/vote/end', params={'vote_id': text_vote_id}, headers=headers)
+                    response.raise_for_status()
+                await self.timeit(
+                    'POST /api/host/vote/end[text] cold', end_vote,
+                    before=lambda: tally_engine.discard(text_vote_id)
+                )
+    
+    async def bench_copy_templates(self):
+        """复制投票模板到新活动"""
+        from sqlalchemy import insert
+        from backend.database import AsyncSessionLocal
+        from backend.models import Activity
+        from backend.services.vote_template import VoteTemplateService
+        from backend.utils.query_audit import track_queries
+        
+        async with AsyncSessionLocal() as db:
+            for _ in range(self.args.repeat):
+                activity_id = (await db.execute(
+                    insert(Activity).values(name='模板复制', status='pending')
+                )).inserted_primary_key[0]
+                await db.commit()
+                with track_queries() as stats:
+                    started = time.perf_counter()
+                    await VoteTemplateService.copy_templates_to_activity(db, activity_id)
+                    elapsed = time.perf_counter() - started
+                self.record('copy_templates_to_activity', elapsed, stats.count)
+    
+    async def bench_reset(self):
+        """
+        重置活动数据
+        
+        重置会删除数据,每次执行前重新生成一个活动(生成不计时)
+        """
+        from backend.database import AsyncSessionLocal
+        from backend.services.activity import ActivityService
+        from backend.utils.query_audit import track_queries
+        
+        for i in range(self.args.reset_repeat):
+            activity_id = await asyncio.to_thread(self.generator.seed_activity, f'重置{i}')
+            async with AsyncSessionLocal() as db:
+                with track_queries() as stats:
+                    started = time.perf_counter()
+                    await ActivityService.reset_activity_data(db, activity_id)
+                    elapsed = time.perf_counter() - started
+                self.record('reset_activity_data', elapsed, stats.count)
+    
+    async def bench_broadcast(self):
+        """向模拟连接广播: 入队耗时和全部连接收到消息的耗时"""
+        from backend.routers.websocket import ConnectionManager
+        
+        connections = self.args.connections
+        manager = ConnectionManager()
+        state = {'received': 0, 'done': asyncio.Event()}
+        
+        def on_message():
+            state['received'] += 1
+            if state['received'] == connections:
+                state['done'].set()
+        
+        for i in range(connections):
+            await manager.connect(FakeWebSocket(on_message), 'participant' if i else 'display')
+        
+        message = {
+            'type': 'vote_started',
+            'data': {'vote_id': 1, 'title': '广播测试', 'type': 'single', 'options': OPTIONS}
+        }
+        for _ in range(self.args.repeat):
+            state['received'] = 0
+            state['done'] = asyncio.Event()
+            started = time.perf_counter()
+            await manager.broadcast(message)
+            self.record(f'broadcast[{connections}] enqueue', time.perf_counter() - started)
+            await state['done'].wait()
+            self.record(f'broadcast[{connections}] delivered', time.perf_counter() - started)
+        
+        for websocket in list(manager.active_connections):
+            manager.disconnect(websocket)
+    
+    async def run(self) -> Dict[str, dict]:
+        from backend.database import async_engine, init_db
+        
+        init_db()
+        started = time.perf_counter()
+        self.generator.seed_templates(self.args.votes)
+        activity_id = self.generator.seed_activity('基准测试')
+        print(
+            f"生成数据: {self.args.participants} 参会人 x {self.args.votes} 投票, "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+        
+        await self.bench_vote_results(activity_id)
+        await self.bench_summary(activity_id)
+        await self.bench_export(activity_id)
+        await self.bench_host_routes(activity_id)
+        await self.bench_copy_templates()
+        await self.bench_reset()
+        await self.bench_broadcast()
+        await async_engine.dispose()
+        
+        return {
+            name: {
+                'median': statistics.median(values),
+                'min': min(values),
+                'runs': len(values),
+                'queries': self.queries.get(name)
+            }
+            for name, values in self.results.items()
+        }
+
+def git_revision() -> str:
+    """当前 git 提交号(工作区有修改时加 -dirty)"""
+    try:
+        revision = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, text=True
+        ).strip()
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def load_baseline(history: Path, params: dict, revision: str) -> Optional[dict]:
+    """历史文件中最近一次相同参数、不同提交的结果"""
+    if not history.exists():
+        return None
+    baseline = None
+    with open(history, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('params') == params and entry.get('revision') != revision:
+                baseline = entry
+    return baseline
+
+def report(results: Dict[str, dict], baseline: Optional[dict], threshold: float, min_delta_ms: float) -> List[str]:
+    """
+    打印结果并与基线对比
+    
+    耗时增幅超过 threshold 且绝对增加超过 min_delta_ms 的项目视为退化
+    (亚毫秒级项目的相对波动很大,只看比例会误报);SQL 语句数增加也视为退化
+    
+    Returns:
+        退化的项目名称
+    """
+    regressions = []
+    if baseline:
+        print(f"\n对比基线: {baseline['revision']} ({baseline['time']})")
+    print(f"\n{'项目':<40}{'中位数(ms)':>12}{'最小(ms)':>12}{'SQL':>6}{'基线(ms)':>12}{'变化':>9}")
+    for name, result in results.items():
+        base = baseline['results'].get(name) if baseline else None
+        queries = result.get('queries')
+        line = f"{name:<42}{result['median']:>12.2f}{result['min']:>12.2f}{'' if queries is None else queries:>6}"
+        if base:
+            change = result['median'] / base['median'] - 1 if base['median'] > 0 else 0
+            flags = []
+            if change > threshold and result['median'] - base['median'] > min_delta_ms:
+                flags.append('退化')
+            base_queries = base.get('queries')
+            if queries is not None and base_queries is not None and queries > base_queries:
+                flags.append(f'SQL {base_queries} -> {queries}')
+            if flags:
+                regressions.append(name)
+            line += f"{base['median']:>12.2f}{change:>+9.0%}" + ''.join(f"  {flag}" for flag in flags)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='服务层基准测试')
+    parser.add_argument('--participants', type=int, default=2000, help='每个活动的参会人数')
+    parser.add_argument('--votes', type=int, default=20, help='每个活动的投票数(题型循环)')
+    parser.add_argument('--answer-rate', type=float, default=0.9, help='每个投票的参与比例')
+    parser.add_argument('--connections', type=int, default=1000, help='广播测试的模拟连接数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个项目的执行次数')
+    parser.add_argument('--reset-repeat', type=int, default=1, help='重置测试的执行次数(每次重新生成数据)')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    parser.add_argument('--history', default=str(ROOT / 'data' / 'benchmarks.jsonl'), help='历史结果文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定退化的耗时增幅')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='判定退化的最小绝对耗时增加(毫秒)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有退化时返回非零退出码')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录(数据库和导出文件)')
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    history = Path(args.history).resolve()
+    
+    # 配置和数据库路径相对于工作目录,在临时目录中运行,不影响 data/ 下的数据
+    workdir = Path(tempfile.mkdtemp(prefix='ai-votes-bench-'))
+    os.chdir(workdir)
+    sys.path.insert(0, str(ROOT))
+    benchmark = Benchmark(args)
+    try:
+        results = asyncio.run(benchmark.run())
+    finally:
+        if args.keep:
+            print(f"临时目录: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    params = {
+        'participants': args.participants,
+        'votes': args.votes,
+        'answer_rate': args.answer_rate,
+        'connections': args.connections
+    }
+    revision = git_revision()
+    regressions = report(results, load_baseline(history, params, revision), args.threshold, args.min_delta_ms)
+    
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with open(history, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'revision': revision,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'params': params,
+            'results': results
+        }, ensure_ascii=False) + '\n')
+    
+    if benchmark.budget_failures:
+        print(f"\n{len(benchmark.budget_failures)} 个项目超出 SQL 语句数上限:")
+        for failure in benchmark.budget_failures:
+            print(failure)
+    
+    if regressions:
+        print(f"\n{len(regressions)} 个项目耗时增加超过 {args.threshold:.0%}: {', '.join(regressions)}")
+    
+    if benchmark.budget_failures or (regressions and args.fail_on_regression):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
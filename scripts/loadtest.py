@@ -0,0 +1,471 @@
+"""
+端到端压测脚本 - 模拟一场完整的活动
+
+N 个模拟参会人通过 /api/signin/submit 签到,保持 /ws?client_type=participant 连接,
+收到 vote_started 后通过 /api/participant/vote 提交答案;脚本化的主持人依次执行
+开始活动、开始/结束/退出每个投票、结束活动和关闭活动。
+
+统计签到、投票确认和广播送达(主持人发起操作到参会人收到消息)的 p50/p95/p99,
+并模拟服务重启后所有参会人同时重连(重连风暴)。
+
+默认在临时目录中启动一个本地服务进程(独立数据库),不影响 data/ 下的数据:
+    
+    python scripts/loadtest.py --participants 200
+    python scripts/loadtest.py --sweep 50,100,200,400,800 --slo-ms 500
+
+也可以压测已在运行的服务(不做重启测试):
+    
+    python scripts/loadtest.py --url http://127.0.0.1:8000 --participants 100
+
+依赖: httpx, websockets
+"""
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from websockets.asyncio.client import connect as ws_connect
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 每种题型的测试投票和随机答案
+VOTES = [
+    {'title': '压测-单选', 'type': 'single', 'options': ['A', 'B', 'C', 'D']},
+    {'title': '压测-多选', 'type': 'multiple', 'options': ['A', 'B', 'C', 'D']},
+    {'title': '压测-评分', 'type': 'rating', 'options': None},
+    {'title': '压测-问答', 'type': 'text', 'options': None},
+]
+
+TEXT_ANSWERS = ['内容很充实', '希望多一些互动', '时间有点紧', '讲得非常精彩', '案例很实用']
+
+def random_answer(vote_type: str, options: Optional[List[str]]) -> dict:
+    """按题型生成随机答案"""
+    if vote_type == 'single':
+        return {'selected': random.choice(options)}
+    if vote_type == 'multiple':
+        return {'selected': random.sample(options, random.randint(1, len(options)))}
+    if vote_type == 'rating':
+        return {'rating': random.randint(1, 5)}
+    return {'text': random.choice(TEXT_ANSWERS) + random.choice(['', '!', '。'])}
+
+class Stats:
+    """延迟统计(毫秒)"""
+    
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+    
+    def add(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds * 1000)
+    
+    def error(self, name: str):
+        self.errors[name] = self.errors.get(name, 0) + 1
+    
+    @staticmethod
+    def percentile(values: List[float], p: float) -> float:
+        if not values:
+            return 0.0
+        values = sorted(values)
+        index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+        return values[index]
+    
+    def summary(self, name: str) -> dict:
+        values = self.samples.get(name, [])
+        return {
+            'count': len(values),
+            'errors': self.errors.get(name, 0),
+            'p50': self.percentile(values, 50),
+            'p95': self.percentile(values, 95),
+            'p99': self.percentile(values, 99),
+            'max': max(values) if values else 0.0
+        }
+    
+    def names(self) -> List[str]:
+        return sorted(set(self.samples) | set(self.errors))
+    
+    def report(self, title: str):
+        print(f"\n== {title} ==")
+        print(f"{'指标':<28}{'次数':>7}{'错误':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name in self.names():
+            s = self.summary(name)
+            print(
+                f"{name:<30}{s['count']:>7}{s['errors']:>6}"
+                f"{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}"
+            )
+
+class ManagedServer:
+    """在临时目录中启动的本地服务进程"""
+    
+    def __init__(self, port: int):
+        self.port = port
+        self.workdir = Path(tempfile.mkdtemp(prefix='ai-votes-loadtest-'))
+        self.process: Optional[subprocess.Popen] = None
+        
+        # 页面模板和静态文件使用仓库中的目录
+        try:
+            os.symlink(ROOT / 'frontend', self.workdir / 'frontend', target_is_directory=True)
+        except OSError:
+            shutil.copytree(ROOT / 'frontend', self.workdir / 'frontend')
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+    
+    async def start(self):
+        env = dict(os.environ, PYTHONPATH=str(ROOT))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'backend.main:app',
+             '--host', '127.0.0.1', '--port', str(self.port), '--log-level', 'warning'],
+            cwd=self.workdir,
+            env=env,
+            stdout=subprocess.DEVNULL
+        )
+        await self.wait_ready()
+    
+    async def wait_ready(self, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError('服务进程启动失败')
+                try:
+                    await client.get(f"{self.url}/api/signin/info", timeout=1)
+                    return
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.1)
+        raise RuntimeError('等待服务启动超时')
+    
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+    
+    def cleanup(self):
+        self.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+class BroadcastTracker:
+    """记录主持人操作到各参会人收到对应广播的延迟"""
+    
+    def __init__(self, stats: Stats):
+        self.stats = stats
+        self.expected: Optional[str] = None
+        self.started_at = 0.0
+        self.remaining = 0
+        self.done = asyncio.Event()
+    
+    def expect(self, message_type: str, receivers: int):
+        self.expected = message_type
+        self.started_at = time.perf_counter()
+        self.remaining = receivers
+        self.done = asyncio.Event()
+        if receivers == 0:
+            self.done.set()
+    
+    def received(self, message_type: str):
+        if message_type != self.expected or self.remaining <= 0:
+            return
+        self.stats.add(f"broadcast:{message_type}", time.perf_counter() - self.started_at)
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.done.set()
+    
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            for _ in range(self.remaining):
+                self.stats.error(f"broadcast:{self.expected}")
+            self.remaining = 0
+
+class SimulatedParticipant:
+    """模拟参会人: 签到、保持 WebSocket 连接、收到投票后提交答案"""
+    
+    def __init__(self, index: int, run: 'LoadTest'):
+        self.index = index
+        self.run = run
+        self.session_id: Optional[str] = None
+        self.connected = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+    
+    async def signin(self):
+        started = time.perf_counter()
+        try:
+            r = await self.run.http.post('/api/signin/submit', json={
+                'name': f'压测{self.index}',
+                'department': f'部门{self.index % 10}',
+                'role': 'participant'
+            })
+            r.raise_for_status()
+            self.session_id = r.json()['session_id']
+            self.run.stats.add('signin', time.perf_counter() - started)
+        except httpx.HTTPError:
+            self.run.stats.error('signin')
+    
+    def start(self):
+        self.task = asyncio.create_task(self._connection_loop())
+    
+    async def _connection_loop(self):
+        """保持连接,断开后按固定间隔重连(与浏览器端 websocket.js 一致)"""
+        url = self.run.ws_url + '/ws?client_type=participant'
+        while True:
+            started = time.perf_counter()
+            try:
+                async with ws_connect(url, open_timeout=30, ping_interval=None, max_queue=None) as ws:
+                    if self.run.restarting_at:
+                        self.run.stats.add('reconnect', time.perf_counter() - self.run.restarting_at)
+                    else:
+                        self.run.stats.add('ws_connect', time.perf_counter() - started)
+                    self.connected.set()
+                    async for raw in ws:
+                        await self._handle(raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            self.connected.clear()
+            await asyncio.sleep(self.run.args.reconnect_delay)
+    
+    async def _handle(self, raw: str):
+        message = json.loads(raw)
+        message_type = message.get('type')
+        self.run.tracker.received(message_type)
+        if message_type == 'vote_started':
+            data = message['data']
+            asyncio.create_task(self._vote(data))
+    
+    async def _vote(self, vote: dict):
+        await asyncio.sleep(random.uniform(0, self.run.args.think_time))
+        started = time.perf_counter()
+        try:
+            r = await self.run.http.post(
+                '/api/participant/vote',
+                headers={'X-Session-ID': self.session_id},
+                json={'vote_id': vote['vote_id'], 'answer': random_answer(vote['type'], vote.get('options'))}
+            )
+            r.raise_for_status()
+            self.run.stats.add('vote_ack', time.perf_counter() - started)
+        except httpx.HTTPError:
+            self.run.stats.error('vote_ack')
+        finally:
+            self.run.votes_done += 1
+            if self.run.votes_done >= self.run.votes_expected:
+                self.run.votes_event.set()
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+class LoadTest:
+    """一轮压测(N 个参会人)"""
+    
+    def __init__(self, args, url: str, participants: int, server: Optional[ManagedServer]):
+        self.args = args
+        self.url = url
+        self.ws_url = url.replace('http://', 'ws://').replace('https://', 'wss://')
+        self.server = server
+        self.stats = Stats()
+        self.tracker = BroadcastTracker(self.stats)
+        self.participants = [SimulatedParticipant(i, self) for i in range(participants)]
+        self.http: Optional[httpx.AsyncClient] = None
+        self.admin_token: Optional[str] = None
+        self.host_headers: Dict[str, str] = {}
+        self.restarting_at = 0.0
+        self.votes_done = 0
+        self.votes_expected = 0
+        self.votes_event = asyncio.Event()
+    
+    async def timed(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        r = await self.http.request(method, url, **kwargs)
+        if r.status_code >= 400:
+            self.stats.error(name)
+            raise RuntimeError(f"{name} 失败: {r.status_code} {r.text}")
+        self.stats.add(name, time.perf_counter() - started)
+        return r
+    
+    async def setup(self) -> List[dict]:
+        """管理员创建活动和投票,主持人签到"""
+        r = await self.http.post('/api/admin/login', json={'password': self.args.admin_password})
+        r.raise_for_status()
+        self.admin_token = r.json()['token']
+        params = {'token': self.admin_token}
+        
+        r = await self.http.post('/api/admin/activities', params=params, json={'name': '压测活动', 'theme': 'loadtest'})
+        r.raise_for_status()
+        activity_id = r.json()['id']
+        
+        votes = []
+        for order, vote in enumerate(VOTES):
+            r = await self.http.post('/api/admin/votes', params=params, json={
+                'activity_id': activity_id, 'title': vote['title'], 'type': vote['type'],
+                'options': vote['options'], 'order_index': order
+            })
+            r.raise_for_status()
+            votes.append(r.json())
+        
+        r = await self.http.post('/api/signin/submit', json={
+            'name': '压测主持人', 'role': 'host', 'password': self.args.host_password
+        })
+        r.raise_for_status()
+        self.host_headers = {'X-Session-ID': r.json()['session_id']}
+        return votes
+    
+    async def host_action(self, name: str, path: str, broadcast: Optional[str], **kwargs):
+        """主持人操作,并等待所有在线参会人收到对应广播"""
+        if broadcast:
+            self.tracker.expect(broadcast, sum(1 for p in self.participants if p.connected.is_set()))
+        await self.timed(f"host:{name}", 'POST', path, headers=self.host_headers, **kwargs)
+        if broadcast:
+            await self.tracker.wait(self.args.timeout)
+    
+    async def vote_round(self, vote: dict):
+        """一个投票: 开始 -> 等待全部提交 -> 结束 -> 退出"""
+        self.votes_done = 0
+        self.votes_expected = sum(1 for p in self.participants if p.session_id and p.connected.is_set())
+        self.votes_event = asyncio.Event()
+        if self.votes_expected == 0:
+            self.votes_event.set()
+        
+        await self.host_action('vote_start', '/api/host/vote/start', 'vote_started', params={'vote_id': vote['id']})
+        try:
+            await asyncio.wait_for(self.votes_event.wait(), self.args.timeout)
+        except asyncio.TimeoutError:
+            print(f"  投票 {vote['title']}: {self.votes_done}/{self.votes_expected} 在超时前提交")
+        await self.host_action('vote_end', '/api/host/vote/end', 'vote_ended', params={'vote_id': vote['id']})
+        await self.host_action('vote_exit', '/api/host/vote/exit', 'vote_exited')
+    
+    async def reconnect_storm(self):
+        """重启服务,所有参会人同时重连"""
+        print('  重启服务,等待参会人重连...')
+        self.server.stop()
+        await asyncio.sleep(0.5)
+        await self.server.start()
+        self.restarting_at = time.perf_counter()
+        
+        deadline = time.monotonic() + self.args.timeout
+        while time.monotonic() < deadline:
+            if all(p.connected.is_set() for p in self.participants):
+                break
+            await asyncio.sleep(0.05)
+        self.stats.add('reconnect_storm_total', time.perf_counter() - self.restarting_at)
+        missing = sum(1 for p in self.participants if not p.connected.is_set())
+        for _ in range(missing):
+            self.stats.error('reconnect')
+        self.restarting_at = 0.0
+    
+    async def execute(self):
+        limits = httpx.Limits(max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency)
+        async with httpx.AsyncClient(base_url=self.url, limits=limits, timeout=self.args.timeout) as self.http:
+            votes = await self.setup()
+            
+            # 签到风暴: 所有参会人同时签到
+            await asyncio.gather(*(p.signin() for p in self.participants))
+            
+            for participant in self.participants:
+                participant.start()
+            await asyncio.wait_for(
+                asyncio.gather(*(p.connected.wait() for p in self.participants)), self.args.timeout
+            )
+            
+            await self.host_action('activity_start', '/api/host/activity/start', 'activity_started')
+            for vote in votes:
+                await self.vote_round(vote)
+            
+            if self.server is not None and not self.args.no_restart:
+                await self.reconnect_storm()
+                # 重启后再进行一轮投票,验证会话仍然有效
+                await self.vote_round(votes[0])
+            
+            await self.host_action('activity_end', '/api/host/activity/end', 'activity_ended')
+            await self.host_action('activity_close', '/api/host/activity/close', None)
+            
+            for participant in self.participants:
+                await participant.stop()
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+async def run_once(args, participants: int) -> Stats:
+    server = None
+    url = args.url
+    if url is None:
+        server = ManagedServer(free_port())
+        await server.start()
+        url = server.url
+    try:
+        test = LoadTest(args, url, participants, server)
+        await test.execute()
+        return test.stats
+    finally:
+        if server is not None:
+            server.cleanup()
+
+def exceeds_slo(stats: Stats, args) -> bool:
+    """投票确认 p95 超过 SLO 或错误率超过 1% 视为超出容量"""
+    vote = stats.summary('vote_ack')
+    total = vote['count'] + vote['errors']
+    error_rate = vote['errors'] / total if total else 0
+    return vote['p95'] > args.slo_ms or error_rate > 0.01
+
+async def main():
+    parser = argparse.ArgumentParser(description='投票系统端到端压测')
+    parser.add_argument('--url', help='压测已运行的服务(默认在临时目录启动本地服务)')
+    parser.add_argument('--participants', '-n', type=int, default=100, help='模拟参会人数')
+    parser.add_argument('--sweep', help='逐级压测的人数列表,如 50,100,200,400')
+    parser.add_argument('--slo-ms', type=float, default=500, help='投票确认 p95 目标(毫秒),用于判断容量拐点')
+    parser.add_argument('--think-time', type=float, default=2.0, help='收到投票后随机等待的最长时间(秒)')
+    parser.add_argument('--concurrency', type=int, default=500, help='HTTP 连接池大小')
+    parser.add_argument('--timeout', type=float, default=60, help='单步等待超时(秒)')
+    parser.add_argument('--reconnect-delay', type=float, default=3.0, help='断线后重连间隔(秒),与浏览器端一致')
+    parser.add_argument('--no-restart', action='store_true', help='跳过服务重启和重连风暴')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--host-password', default='host123')
+    args = parser.parse_args()
+    
+    sizes = [int(n) for n in args.sweep.split(',')] if args.sweep else [args.participants]
+    results = []
+    for n in sizes:
+        print(f"\n>>> 参会人数 {n}")
+        stats = await run_once(args, n)
+        stats.report(f"N = {n}")
+        results.append((n, stats))
+    
+    if len(results) > 1:
+        print(f"\n== 容量扫描 (SLO: 投票确认 p95 <= {args.slo_ms:.0f}ms) ==")
+        print(f"{'N':>6}{'签到 p95':>12}{'投票 p95':>12}{'广播 p95':>12}{'重连 p95':>12}")
+        knee = None
+        for n, stats in results:
+            broadcast = Stats.percentile(
+                [v for name in stats.names() if name.startswith('broadcast:') for v in stats.samples.get(name, [])], 95
+            )
+            print(
+                f"{n:>6}{stats.summary('signin')['p95']:>12.1f}{stats.summary('vote_ack')['p95']:>12.1f}"
+                f"{broadcast:>12.1f}{stats.summary('reconnect')['p95']:>12.1f}"
+            )
+            if knee is None and exceeds_slo(stats, args):
+                knee = n
+        if knee is None:
+            print('所有规模均满足 SLO')
+        else:
+            print(f"容量拐点: N = {knee} 时超出 SLO")
+
+if __name__ == '__main__':
+    asyncio.run(main())
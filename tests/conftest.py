@@ -0,0 +1,73 @@
+"""
+测试公共夹具
+
+应用使用相对路径(data/、config/、frontend/),测试在临时目录中运行,不影响项目目录下的数据
+"""
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+WORKDIR = Path(tempfile.mkdtemp(prefix="voting-tests-"))
+(WORKDIR / "frontend").symlink_to(ROOT / "frontend")
+os.chdir(WORKDIR)
+sys.path.insert(0, str(ROOT))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from backend.main import app  # noqa: E402
+from backend.config import settings  # noqa: E402
+
+@pytest.fixture(scope="session")
+def client():
+    """整个测试会话共用一个应用实例"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def admin_token(client) -> str:
+    """管理员令牌"""
+    return client.post('/api/admin/login', json={'password': settings.admin_password}).json()['token']
+
+@pytest.fixture
+def start_vote(client, admin_token):
+    """
+    新建活动并开始一个投票
+    
+    Returns:
+        函数 (vote_type, options) -> (活动 ID, 投票 ID, 主持人请求头)
+    """
+    def start(vote_type: str, options=None):
+        activity = client.post(
+            '/api/admin/activities', params={'token': admin_token}, json={'name': '测试活动', 'theme': 'default'}
+        ).json()
+        vote = client.post('/api/admin/votes', params={'token': admin_token}, json={
+            'activity_id': activity['id'], 'title': '测试投票', 'type': vote_type, 'options': options
+        }).json()
+        host = client.post('/api/signin/submit', json={
+            'name': '主持人', 'role': 'host', 'password': settings.host_password
+        }).json()
+        headers = {'X-Session-ID': host['session_id']}
+        client.post('/api/host/activity/start', headers=headers)
+        client.post('/api/host/vote/start', params={'vote_id': vote['id']}, headers=headers)
+        return activity['id'], vote['id'], headers
+    return start
+
+@pytest.fixture
+def sign_in(client):
+    """
+    签到参会人
+    
+    Returns:
+        函数 (count) -> 各参会人的请求头
+    """
+    def sign_in(count: int) -> list:
+        return [
+            {'X-Session-ID': client.post('/api/signin/submit', json={
+                'name': f'参会人{i}', 'department': '测试部', 'role': 'participant'
+            }).json()['session_id']}
+            for i in range(count)
+        ]
+    return sign_in
@@ -0,0 +1,62 @@
+"""
+活动数据导出: 流水文件与数据库
+"""
+import csv
+import time
+
+from backend.services.journal import journal_writer
+
+def run_export(client, admin_token: str, activity_id: int) -> dict:
+    """启动后台导出并等待完成,返回导出文件路径"""
+    job = client.post(f'/api/admin/activities/{activity_id}/export', params={'token': admin_token}).json()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        status = client.get(f"/api/admin/export-jobs/{job['job_id']}", params={'token': admin_token}).json()
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.05)
+    assert status['status'] == 'done', status
+    return status['files']
+
+def read_csv(path: str) -> list:
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.reader(f))
+
+def vote_all(client, participants: list, vote_id: int, answer: dict):
+    for headers in participants:
+        response = client.post('/api/participant/vote', headers=headers, json={'vote_id': vote_id, 'answer': answer})
+        assert response.status_code == 200
+
+def test_journal_export_keeps_latest_answer(client, admin_token, start_vote, sign_in):
+    """从流水还原的记录文件每人每个投票一行,取最后一次答案"""
+    activity_id, vote_id, _ = start_vote('single', ['A', 'B'])
+    participants = sign_in(5)
+    vote_all(client, participants, vote_id, {'selected': 'A'})
+    vote_all(client, participants[:2], vote_id, {'selected': 'B'})
+    
+    files = run_export(client, admin_token, activity_id)
+    records = read_csv(files['records'])
+    assert records[0] == ['活动名称', '投票标题', '参会人姓名', '参会人部门', '投票内容', '投票时间']
+    assert sorted(row[4] for row in records[1:]) == ['A', 'A', 'A', 'B', 'B']
+    
+    statistics = {row[1]: row[2] for row in read_csv(files['statistics'])[1:]}
+    assert statistics == {'A': '3', 'B': '2'}
+
+def test_truncated_journal_falls_back_to_database(client, admin_token, start_vote, sign_in):
+    """流水文件缺少已落库的投票(进程崩溃时未写盘)时,导出仍包含全部记录"""
+    activity_id, vote_id, _ = start_vote('single', ['A', 'B'])
+    participants = sign_in(10)
+    vote_all(client, participants, vote_id, {'selected': 'A'})
+    
+    # 模拟进程崩溃: 最后三条投票没有写入流水文件
+    journal = journal_writer.get(activity_id)
+    journal.flush()
+    lines = journal.path.read_text(encoding='utf-8-sig').splitlines(keepends=True)
+    journal.path.write_text(''.join(lines[:-3]), encoding='utf-8-sig')
+    
+    files = run_export(client, admin_token, activity_id)
+    records = read_csv(files['records'])
+    assert sorted(row[2] for row in records[1:]) == sorted(f'参会人{i}' for i in range(10))
+    
+    statistics = {row[1]: row[2] for row in read_csv(files['statistics'])[1:]}
+    assert statistics == {'A': '10', 'B': '0'}
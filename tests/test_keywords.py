@@ -0,0 +1,25 @@
+"""
+问答题关键词切分测试
+"""
+from backend.services.keywords import KeywordCounter, tokenize
+
+def test_bigrams_do_not_cross_words():
+    """二元组互不重叠,不产生跨词的关键词"""
+    assert tokenize('今天开会') == {'今天', '开会'}
+    assert tokenize('我们明天开会吧') == {'明天', '开会'}
+
+def test_stop_chars_split_segments():
+    """虚词处断开,落单的字不计入关键词"""
+    tokens = tokenize('会议很好,时间太长')
+    assert tokens == {'会议', '时间'}
+    for token in tokens:
+        assert len(token) == 2
+
+def test_counter_has_no_cross_word_keywords():
+    """词云结果中没有跨词的二元组"""
+    counter = KeywordCounter(capacity=50)
+    for text in ['今天开会', '今天开会', '明天开会', 'Great meeting today']:
+        counter.add(tokenize(text))
+    words = {item['word'] for item in counter.top(10)}
+    assert '天开' not in words
+    assert {'今天', '开会', 'great', 'meeting', 'today'} <= words
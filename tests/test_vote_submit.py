@@ -0,0 +1,47 @@
+"""
+投票提交: 答案校验与组提交
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+def test_malformed_answer_does_not_fail_concurrent_votes(client, start_vote, sign_in):
+    """格式不符的答案返回 422,同一时刻提交的其他投票照常成功"""
+    _, vote_id, host_headers = start_vote('multiple', ['A', 'B'])
+    participants = sign_in(20)
+    bad = {3: {'selected': [1]}, 11: 'x'}
+    
+    def submit(index: int) -> int:
+        answer = bad.get(index, {'selected': ['A']})
+        return client.post(
+            '/api/participant/vote', headers=participants[index], json={'vote_id': vote_id, 'answer': answer}
+        ).status_code
+    
+    with ThreadPoolExecutor(len(participants)) as executor:
+        status_codes = list(executor.map(submit, range(len(participants))))
+    
+    for index, status_code in enumerate(status_codes):
+        assert status_code == (422 if index in bad else 200)
+    
+    results = client.post('/api/host/vote/end', params={'vote_id': vote_id}, headers=host_headers).json()['results']
+    counts = {item['option']: item['count'] for item in results['results']}
+    assert counts == {'A': len(participants) - len(bad), 'B': 0}
+
+def test_answer_must_match_vote_type(client, start_vote, sign_in):
+    """各题型的答案格式校验"""
+    _, vote_id, _ = start_vote('rating')
+    participant, = sign_in(1)
+    
+    def submit(answer) -> int:
+        return client.post(
+            '/api/participant/vote', headers=participant, json={'vote_id': vote_id, 'answer': answer}
+        ).status_code
+    
+    assert submit({'selected': 'A'}) == 422
+    assert submit({'rating': 6}) == 422
+    assert submit({'rating': True}) == 422
+    assert submit({'rating': 4}) == 200
+
+def test_unknown_vote_returns_404(client, start_vote, sign_in):
+    start_vote('single', ['A', 'B'])
+    participant, = sign_in(1)
+    response = client.post('/api/participant/vote', headers=participant, json={'vote_id': 999999, 'answer': {}})
+    assert response.status_code == 404